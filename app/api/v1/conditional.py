@@ -0,0 +1,32 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+# Responses carry the user's data, so browsers may keep them but must revalidate each time.
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag(*parts) -> str:
+    """A weak validator over ``parts``: equal content, not byte-identical bodies."""
+
+    digest = hashlib.sha256("\n".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def _matches(if_none_match: str, current: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored on both sides.
+    opaque = current.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, current: str):
+    """Returns a 304 response when the request already holds ``current``, else tags ``response`` with it."""
+
+    headers = {"ETag": current, "Cache-Control": CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, current):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,16 +1,27 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.core.config import settings
 from app.db import database
 from app.models import user as user_model
 from app.schemas import token as token_schema
+from app.services.principal_cache import Principal, principal_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+def _load_principal(email: str):
+    # Opened here rather than taken from get_db, whose sync generator FastAPI would run
+    # in the thread pool on every request, cache hit or not.
+    db = database.SessionLocal()
+    try:
+        user = db.query(user_model.User).filter(user_model.User.email == email).first()
+        return Principal(id=user.id, email=user.email) if user is not None else None
+    finally:
+        db.close()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
 
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -27,10 +38,18 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         
         raise credentials_exception
-    
-    user = db.query(user_model.User).filter(user_model.User.email == token_data.email).first()
-    if user is None:
+
+    # The token signature and expiry are still checked above on every request;
+    # only the users lookup is cached.
+    principal = principal_cache.get(token_data.email)
+    if principal is not None:
+        return principal
+
+    # Loaded or cached, endpoints get the same detached principal, never a session-bound User.
+    principal = await run_in_threadpool(_load_principal, token_data.email)
+    if principal is None:
        
         raise credentials_exception
-    
-    return user
+
+    principal_cache.set(principal)
+    return principal
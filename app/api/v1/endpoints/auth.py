@@ -1,33 +1,44 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from app.db import database
 from app.models import user as user_model
 from app.schemas import user as user_schema, token as token_schema
 from app.core import security
+from app.services.principal_cache import principal_cache
 
 router = APIRouter()
 
+def _get_user_by_email(db: Session, email: str):
+    return db.query(user_model.User).filter(user_model.User.email == email).first()
+
+def _create_user(db: Session, email: str, hashed_password: str):
+
+    new_user = user_model.User(email=email, hashed_password=hashed_password)
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
 @router.post("/register", response_model=user_schema.User)
-def register_user(user: user_schema.UserCreate, db: Session = Depends(database.get_db)):
+async def register_user(user: user_schema.UserCreate, db: Session = Depends(database.get_db)):
 
-    db_user = db.query(user_model.User).filter(user_model.User.email == user.email).first()
+    db_user = await run_in_threadpool(_get_user_by_email, db, user.email)
     if db_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
-    hashed_password = security.get_password_hash(user.password)
-    new_user = user_model.User(email=user.email, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    hashed_password = await security.get_password_hash_async(user.password)
+    new_user = await run_in_threadpool(_create_user, db, user.email, hashed_password)
+    principal_cache.invalidate(new_user.email)
     return new_user
 
 @router.post("/token", response_model=token_schema.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
 
-    user = db.query(user_model.User).filter(user_model.User.email == form_data.username).first()
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    user = await run_in_threadpool(_get_user_by_email, db, form_data.username)
+    if not user or not await security.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
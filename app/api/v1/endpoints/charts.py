@@ -1,51 +1,195 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
-from typing import List
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import hashlib
+import json
 
+from app.core.config import settings
+from app.db import analytics
 from app.db.database import get_db
-from app.api.v1 import dependencies
-from app.models import user as user_model, dataset as dataset_model, saved_chart as saved_chart_model
+from app.api.v1 import conditional, dependencies, pagination
+from app.models import dataset as dataset_model, saved_chart as saved_chart_model
 from app.schemas import saved_chart as saved_chart_schema
+from app.services import ai_service, chart_builder, duckdb_backend, exporter, schema_catalog
 
 router = APIRouter()
 
+
+def _content_hash(chart_data: str) -> str:
+    return hashlib.sha256(chart_data.encode("utf-8")).hexdigest()
+
+
+def _chart_etag(chart: saved_chart_model.SavedChart) -> str:
+    return conditional.etag(chart.id, chart.label, chart.content_hash, chart.data_version)
+
+
+def _owned_dataset(db: Session, dataset_id: int, user_id: int) -> dataset_model.Dataset:
+    dataset = db.query(dataset_model.Dataset).filter(
+        dataset_model.Dataset.id == dataset_id,
+        dataset_model.Dataset.user_id == user_id
+    ).first()
+    if not dataset:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dataset not found")
+    return dataset
+
+
+def _owned_chart(db: Session, chart_id: int, user_id: int) -> saved_chart_model.SavedChart:
+    chart = db.query(saved_chart_model.SavedChart).join(dataset_model.Dataset).filter(
+        saved_chart_model.SavedChart.id == chart_id,
+        dataset_model.Dataset.user_id == user_id
+    ).first()
+    if not chart:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chart not found")
+    return chart
+
+
 @router.post("/datasets/{dataset_id}/charts", response_model=saved_chart_schema.SavedChart)
 def save_chart_for_dataset(
     dataset_id: int,
     chart: saved_chart_schema.SavedChartCreate,
     db: Session = Depends(get_db),
-    current_user: user_model.User = Depends(dependencies.get_current_user)
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
 ):
 
-    dataset = db.query(dataset_model.Dataset).filter(
-        dataset_model.Dataset.id == dataset_id,
-        dataset_model.Dataset.user_id == current_user.id
-    ).first()
-    if not dataset:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dataset not found")
+    dataset = _owned_dataset(db, dataset_id, current_user.id)
+    # The query is run again on refresh, so it is held to the same rules as an export and
+    # stored with a placeholder for the table, which is renamed if the data is replaced.
+    sql_query = None
+    if chart.sql_query:
+        sql_query = exporter.sql_template(exporter.validate_sql(chart.sql_query, dataset.database_table_name), dataset.database_table_name)
 
     new_chart = saved_chart_model.SavedChart(
         dataset_id=dataset_id,
         label=chart.label,
-        chart_data=chart.chart_data
+        chart_data=chart.chart_data,
+        sql_query=sql_query,
+        data_version=dataset.data_version if sql_query else None,
+        content_hash=_content_hash(chart.chart_data)
     )
     db.add(new_chart)
     db.commit()
     db.refresh(new_chart)
     return new_chart
 
-@router.get("/datasets/{dataset_id}/charts", response_model=List[saved_chart_schema.SavedChart])
+@router.get("/datasets/{dataset_id}/charts", response_model=saved_chart_schema.SavedChartPage)
 def get_charts_for_dataset(
     dataset_id: int,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: user_model.User = Depends(dependencies.get_current_user)
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
 ):
 
-    dataset = db.query(dataset_model.Dataset).filter(
-        dataset_model.Dataset.id == dataset_id,
-        dataset_model.Dataset.user_id == current_user.id
-    ).first()
-    if not dataset:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dataset not found")
+    _owned_dataset(db, dataset_id, current_user.id)
+
+    query = db.query(saved_chart_model.SavedChart).filter(saved_chart_model.SavedChart.dataset_id == dataset_id)
+    items, next_cursor = pagination.paginate(query, saved_chart_model.SavedChart.created_at, saved_chart_model.SavedChart.id, cursor, limit)
+    # The page is still read, but unchanged chart data is neither serialized nor sent again.
+    page_etag = conditional.etag(next_cursor, *(_chart_etag(item) for item in items))
+    unchanged = conditional.not_modified(request, response, page_etag)
+    if unchanged is not None:
+        return unchanged
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/{chart_id}", response_model=saved_chart_schema.SavedChart)
+def get_chart(
+    chart_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    chart = _owned_chart(db, chart_id, current_user.id)
+    unchanged = conditional.not_modified(request, response, _chart_etag(chart))
+    if unchanged is not None:
+        return unchanged
+    return chart
+
+
+def _prepare_refresh(db: Session, chart_id: int, user_id: int) -> tuple:
+    chart = _owned_chart(db, chart_id, user_id)
+    dataset = chart.dataset
+    if not chart.sql_query:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This chart was saved without its query and cannot be refreshed."
+        )
+    if dataset.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"The dataset is not ready to query yet (status: {dataset.status})."
+        )
+    if chart.data_version == dataset.data_version:
+        return chart, None
+    sql_query = exporter.render_template(chart.sql_query, dataset.database_table_name)
+    return chart, {
+        "sql_query": exporter.validate_sql(sql_query, dataset.database_table_name),
+        "table_name": dataset.database_table_name,
+        "backend": dataset.storage_backend,
+        "data_version": dataset.data_version,
+        "catalog": schema_catalog.get_catalog(db, dataset),
+    }
+
+
+def _store_refresh(db: Session, chart: saved_chart_model.SavedChart, chart_data: str, data_version: int) -> saved_chart_model.SavedChart:
+    content_hash = _content_hash(chart_data)
+    if content_hash != chart.content_hash:
+        chart.chart_data = chart_data
+        chart.content_hash = content_hash
+    # Recorded even when the data came out the same, so the next refresh is a no-op.
+    chart.data_version = data_version
+    db.commit()
+    db.refresh(chart)
+    return chart
+
+
+@router.post("/{chart_id}/refresh", response_model=saved_chart_schema.SavedChart)
+async def refresh_chart(
+    chart_id: int,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+    """Re-runs the chart's query and rebuilds its data if the dataset changed since it was built."""
+
+    chart, source = await run_in_threadpool(_prepare_refresh, db, chart_id, current_user.id)
+    if source is None:
+        response.headers["ETag"] = _chart_etag(chart)
+        return chart
+
+    max_rows = max(settings.RESULT_PREVIEW_ROWS, settings.CHART_MAX_ROWS)
+    try:
+        # The data may have grown well past what the chart was first built from.
+        sql_query, guard_decision = await ai_service.guard_sql(source["sql_query"], source["table_name"], source["catalog"], source["backend"])
+        if guard_decision is not None and guard_decision["action"] == "rejected":
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=guard_decision["reason"])
+        result_df, _, _ = await ai_service.run_query(
+            sql_query, max_rows, source["table_name"], source["backend"], source["data_version"]
+        )
+    except analytics.QueryCancelledError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"The query was cancelled because it ran longer than {settings.ANALYTICS_QUERY_TIMEOUT_SECONDS:g} seconds."
+        )
+    except PoolTimeoutError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The analytics database is busy right now. Please try again in a moment.")
+    except (SQLAlchemyError, duckdb_backend.DuckDBError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Database Error: {str(e)}")
+
+    # The stored chart type stands in for the question, so the rebuilt chart keeps its kind.
+    previous_type = json.loads(chart.chart_data).get("chart_type", "")
+    chart_spec = await run_in_threadpool(chart_builder.build_chart_spec, previous_type, result_df)
+    if chart_spec is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The chart's query no longer returns data that can be plotted."
+        )
 
-    return db.query(saved_chart_model.SavedChart).filter(saved_chart_model.SavedChart.dataset_id == dataset_id).order_by(saved_chart_model.SavedChart.created_at.desc()).all()
+    chart = await run_in_threadpool(_store_refresh, db, chart, json.dumps(chart_spec), source["data_version"])
+    response.headers["ETag"] = _chart_etag(chart)
+    return chart
@@ -1,24 +1,23 @@
-from fastapi import APIRouter, Depends, Body, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Body, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.services import ai_service
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from app.services import ai_service, conversation, profiler, schema_catalog
 from app.core.config import settings
-from app.db.database import get_db
+from app.core.observability import span
+from app.db.database import get_db, SessionLocal
+import json
 from app.api.v1 import dependencies
-from app.models import user as user_model, dataset as dataset_model, chat as chat_model
+from app.models import dataset as dataset_model, chat as chat_model
 
 router = APIRouter()
 
-@router.post("/chat")
-async def chat_with_data(
-    dataset_id: int = Body(...),
-    question: str = Body(...),
-    db: Session = Depends(get_db),
-    current_user: user_model.User = Depends(dependencies.get_current_user)
-):
+def _prepare_chat(db: Session, dataset_id: int, user_id: int, question: str) -> dict:
 
     dataset = db.query(dataset_model.Dataset).filter(
         dataset_model.Dataset.id == dataset_id,
-        dataset_model.Dataset.user_id == current_user.id
+        dataset_model.Dataset.user_id == user_id
     ).first()
 
     if not dataset:
@@ -27,17 +26,15 @@ async def chat_with_data(
             detail="Dataset not found or you do not have permission to access it."
         )
 
-    past_messages = db.query(chat_model.ChatMessage).filter(
-        chat_model.ChatMessage.dataset_id == dataset_id
-    ).order_by(chat_model.ChatMessage.timestamp.desc()).limit(10).all()
-    past_messages.reverse() 
+    if dataset.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"The dataset is not ready to query yet (status: {dataset.status})."
+        )
 
-    conversation_history = ""
-    for msg in past_messages:
-        speaker = "Human" if msg.is_from_user else "AI"
-        conversation_history += f"{speaker}: {msg.message}\n"
-    
-    full_prompt = conversation_history + f"Human: {question}"
+    with span("chat", "history_load") as record:
+        full_prompt, summarize_before_id = conversation.build_conversation_prompt(db, dataset_id, question)
+        record["prompt_tokens"] = conversation.count_tokens(full_prompt)
 
     user_message = chat_model.ChatMessage(
         dataset_id=dataset.id,
@@ -47,18 +44,98 @@ async def chat_with_data(
     db.add(user_message)
     db.commit()
 
-    response_dict = ai_service.get_sql_agent_response(
-        db_uri=settings.DATABASE_URL,
-        table_name=dataset.database_table_name,
-        conversation_prompt=full_prompt
-    )
-    
-    ai_message = chat_model.ChatMessage(
-        dataset_id=dataset.id,
-        is_from_user=False,
-        message=response_dict["answer"]
-    )
-    db.add(ai_message)
-    db.commit()
+    with span("chat", "schema_fetch"):
+        catalog = schema_catalog.get_catalog(db, dataset)
+    profile = profiler.from_model(dataset.profile) if settings.PROFILE_FAST_PATH and dataset.profile is not None else None
+
+    # Plain values only: ORM objects expire once the session commits or closes.
+    return {
+        "table_name": dataset.database_table_name,
+        "conversation_prompt": full_prompt,
+        "catalog": catalog,
+        "backend": dataset.storage_backend,
+        "data_version": dataset.data_version,
+        "user_id": user_id,
+        "profile": profile,
+        "summarize_before_id": summarize_before_id,
+    }
+
+def _agent_arguments(context: dict, dataset_id: int) -> dict:
+    return {
+        "table_name": context["table_name"],
+        "conversation_prompt": context["conversation_prompt"],
+        "catalog": context["catalog"],
+        "dataset_id": dataset_id,
+        "backend": context["backend"],
+        "profile": context["profile"],
+        "data_version": context["data_version"],
+        "user_id": context["user_id"],
+    }
+
+def _save_ai_message(db: Session, dataset_id: int, answer: str, sql_query: str = None):
 
-    return response_dict
\ No newline at end of file
+    with span("chat", "persistence"):
+        ai_message = chat_model.ChatMessage(
+            dataset_id=dataset_id,
+            is_from_user=False,
+            message=answer,
+            sql_query=sql_query or None
+        )
+        db.add(ai_message)
+        db.commit()
+
+@router.post("/chat")
+async def chat_with_data(
+    background_tasks: BackgroundTasks,
+    dataset_id: int = Body(...),
+    question: str = Body(...),
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    # The session is synchronous, so every ORM round-trip runs in the thread pool
+    # and only the awaited LLM/query pipeline occupies the event loop.
+    context = await run_in_threadpool(_prepare_chat, db, dataset_id, current_user.id, question)
+
+    response_dict = await ai_service.get_sql_agent_response(**_agent_arguments(context, dataset_id))
+
+    await run_in_threadpool(_save_ai_message, db, dataset_id, response_dict["answer"], response_dict.get("sql_query"))
+
+    # Messages that no longer fit the history budget are folded into the summary after the response is sent.
+    if context["summarize_before_id"] is not None:
+        background_tasks.add_task(conversation.update_summary, dataset_id, context["summarize_before_id"])
+
+    return response_dict
+
+
+def _new_session_save_ai_message(dataset_id: int, answer: str, sql_query: str = None):
+    # The request-scoped session is already closed by the time a streamed body finishes.
+    db = SessionLocal()
+    try:
+        _save_ai_message(db, dataset_id, answer, sql_query)
+    finally:
+        db.close()
+
+@router.post("/chat/stream")
+async def stream_chat_with_data(
+    dataset_id: int = Body(...),
+    question: str = Body(...),
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    context = await run_in_threadpool(_prepare_chat, db, dataset_id, current_user.id, question)
+    summarize_before_id = context["summarize_before_id"]
+
+    async def event_stream():
+        async for event, payload in ai_service.stream_sql_agent_response(**_agent_arguments(context, dataset_id)):
+            if event == "done":
+                await run_in_threadpool(_new_session_save_ai_message, dataset_id, payload["answer"], payload.get("sql_query"))
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(conversation.update_summary, dataset_id, summarize_before_id) if summarize_before_id is not None else None
+    )
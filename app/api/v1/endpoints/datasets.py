@@ -1,30 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import re
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import inspect
-from typing import List
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from starlette.concurrency import run_in_threadpool
+from typing import List, Literal, Optional
 
+from app.core.config import settings
+from app.core.observability import span
 from app.db.database import get_db, engine
-from app.api.v1 import dependencies
-from app.models import user as user_model, dataset as dataset_model, chat as chat_model
-from app.schemas import dataset as dataset_schema, chat as chat_schema
-from app.services import ai_service
+from app.api.v1 import dependencies, pagination
+from app.models import dataset as dataset_model, chat as chat_model, index_decision as index_decision_model
+from app.schemas import dataset as dataset_schema, dataset_profile as profile_schema, chat as chat_schema, index_decision as index_decision_schema, ingest_job as job_schema
+from app.services import ai_service, duckdb_backend, exporter, file_handler, ingest_jobs, profiler, schema_catalog
 
 router = APIRouter()
 
-@router.get("/", response_model=List[dataset_schema.Dataset])
+@router.get("/", response_model=dataset_schema.DatasetPage)
 def get_user_datasets(
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: user_model.User = Depends(dependencies.get_current_user)
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
 ):
 
-    return db.query(dataset_model.Dataset).filter(dataset_model.Dataset.user_id == current_user.id).order_by(dataset_model.Dataset.upload_timestamp.desc()).all()
+    query = db.query(dataset_model.Dataset).filter(dataset_model.Dataset.user_id == current_user.id)
+    items, next_cursor = pagination.paginate(query, dataset_model.Dataset.upload_timestamp, dataset_model.Dataset.id, cursor, limit)
+    return {"items": items, "next_cursor": next_cursor}
 
 
-@router.get("/{dataset_id}/history", response_model=List[chat_schema.ChatMessage])
+@router.get("/{dataset_id}/history", response_model=chat_schema.ChatMessagePage)
 def get_dataset_chat_history(
     dataset_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
     db: Session = Depends(get_db),
-    current_user: user_model.User = Depends(dependencies.get_current_user)
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
 ):
 
     dataset = db.query(dataset_model.Dataset).filter(
@@ -38,6 +50,182 @@ def get_dataset_chat_history(
             detail="Dataset not found or you do not have permission to access it."
         )
 
-    return db.query(chat_model.ChatMessage).filter(chat_model.ChatMessage.dataset_id == dataset_id).order_by(chat_model.ChatMessage.timestamp).all()
+    # Pages run from the newest message backwards; each page is returned in chronological order.
+    query = db.query(chat_model.ChatMessage).filter(chat_model.ChatMessage.dataset_id == dataset_id)
+    items, next_cursor = pagination.paginate(query, chat_model.ChatMessage.timestamp, chat_model.ChatMessage.id, cursor, limit)
+    return {"items": list(reversed(items)), "next_cursor": next_cursor}
 
 
+@router.get("/{dataset_id}/indexes", response_model=List[index_decision_schema.IndexDecision])
+def get_dataset_index_decisions(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    dataset = db.query(dataset_model.Dataset).filter(
+        dataset_model.Dataset.id == dataset_id,
+        dataset_model.Dataset.user_id == current_user.id
+    ).first()
+
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found or you do not have permission to access it."
+        )
+
+    return db.query(index_decision_model.IndexDecision).filter(index_decision_model.IndexDecision.dataset_id == dataset_id).order_by(index_decision_model.IndexDecision.created_at).all()
+
+
+@router.get("/{dataset_id}/profile", response_model=profile_schema.DatasetProfile)
+def get_dataset_profile(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    dataset = db.query(dataset_model.Dataset).filter(
+        dataset_model.Dataset.id == dataset_id,
+        dataset_model.Dataset.user_id == current_user.id
+    ).first()
+
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found or you do not have permission to access it."
+        )
+
+    if dataset.profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No profile is available for this dataset. Profiles are computed when a file is uploaded."
+        )
+
+    return profiler.from_model(dataset.profile).summary()
+
+
+@router.post("/{dataset_id}/export")
+def export_dataset_query(
+    dataset_id: int,
+    request: dataset_schema.DatasetExportRequest,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    dataset = db.query(dataset_model.Dataset).filter(
+        dataset_model.Dataset.id == dataset_id,
+        dataset_model.Dataset.user_id == current_user.id
+    ).first()
+
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found or you do not have permission to access it."
+        )
+
+    if dataset.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"The dataset is not ready to query yet (status: {dataset.status})."
+        )
+
+    if request.message_id is not None:
+        message = db.query(chat_model.ChatMessage).filter(
+            chat_model.ChatMessage.id == request.message_id,
+            chat_model.ChatMessage.dataset_id == dataset_id,
+            chat_model.ChatMessage.is_from_user == False
+        ).first()
+        if not message or not message.sql_query:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No SQL query is stored for this message."
+            )
+        # The table the turn read may have been replaced, or its cost guard sample dropped, since.
+        sql_query = exporter.retarget(message.sql_query, dataset.database_table_name)
+    elif request.sql_query:
+        sql_query = request.sql_query
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide either message_id or sql_query."
+        )
+
+    sql_query = exporter.validate_sql(sql_query, dataset.database_table_name)
+
+    media_type, extension = exporter.EXPORT_FORMATS[request.format]
+    stem = re.sub(r"[^A-Za-z0-9._-]+", "_", dataset.original_filename.rsplit(".", 1)[0]) or "dataset"
+    filename = f"{stem}-export.{extension}"
+    try:
+        content = exporter.stream_export(sql_query, dataset.database_table_name, dataset.storage_backend, request.format)
+    except PoolTimeoutError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="The analytics database is busy right now. Please try again in a moment.")
+    except (SQLAlchemyError, duckdb_backend.DuckDBError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Database Error: {str(e)}")
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/{dataset_id}/append", response_model=job_schema.IngestJob, status_code=status.HTTP_202_ACCEPTED)
+async def append_to_dataset(
+    dataset_id: int,
+    file: UploadFile = File(...),
+    mode: Literal["append", "replace"] = Form("append"),
+    dedup: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+    """Adds the file's rows to the dataset ("append") or swaps its data for the file's ("replace").
+
+    Either way the dataset keeps its ID and chat history. Appended files must
+    have the dataset's columns, with values that fit their types; ``dedup``
+    skips rows the dataset already has and is only accepted for appends.
+    """
+
+    dataset = db.query(dataset_model.Dataset).filter(
+        dataset_model.Dataset.id == dataset_id,
+        dataset_model.Dataset.user_id == current_user.id
+    ).first()
+
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found or you do not have permission to access it."
+        )
+
+    if dataset.status != "ready":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Only ready datasets can be updated (status: {dataset.status})."
+        )
+    if mode == "replace" and dedup:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="dedup only applies to appends; a replacement loads the file as it is."
+        )
+    file_handler.check_supported(file.filename)
+    ingest_jobs.check_idle(db, dataset)
+
+    try:
+
+        if mode == "append" and dataset.storage_backend != "duckdb":
+            # Datasets uploaded before catalogs were stored get one now; the append updates it.
+            await run_in_threadpool(schema_catalog.get_catalog, db, dataset)
+
+        with span("upload", "spool"):
+            spool_path, file_size = await run_in_threadpool(ingest_jobs.spool, file.file, file.filename)
+        job = await run_in_threadpool(ingest_jobs.create_update_job, db, dataset, mode, file.filename, spool_path, file_size, dedup)
+
+        if settings.INGEST_BACKGROUND:
+            ingest_jobs.submit(job)
+        else:
+            await run_in_threadpool(ingest_jobs.run_inline, job)
+            db.refresh(job)
+
+        return ingest_jobs.describe(job)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during file upload: {str(e)}")
@@ -1,35 +1,89 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+from app.core.config import settings
+from app.core.observability import span
 from app.db.database import get_db
-from app.services import file_handler
+from app.services import file_handler, ingest_jobs
 from app.api.v1 import dependencies
-from app.models import user as user_model, dataset as dataset_model
-from app.schemas import dataset as dataset_schema
+from app.models import dataset as dataset_model, ingest_job as job_model
+from app.schemas import ingest_job as job_schema
 
 router = APIRouter()
 
-@router.post("/upload", response_model=dataset_schema.Dataset)
+def _get_owned_job(db: Session, job_id: int, user_id: int) -> job_model.IngestJob:
+
+    job = db.query(job_model.IngestJob).join(dataset_model.Dataset).filter(
+        job_model.IngestJob.id == job_id,
+        dataset_model.Dataset.user_id == user_id
+    ).first()
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or you do not have permission to access it."
+        )
+    return ingest_jobs.refresh(db, job)
+
+@router.post("/upload", response_model=job_schema.IngestJob, status_code=status.HTTP_202_ACCEPTED)
 async def upload_file(
     file: UploadFile = File(...),
+    backend: Optional[str] = Form(None),
     db: Session = Depends(get_db),
-    current_user: user_model.User = Depends(dependencies.get_current_user)
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
 ):
 
+    backend = backend or settings.STORAGE_BACKEND
+    if backend not in file_handler.STORAGE_BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown storage backend '{backend}'. Use one of: {', '.join(file_handler.STORAGE_BACKENDS)}.")
+    file_handler.check_supported(file.filename)
+
     try:
 
-        table_name = await file_handler.process_and_store_file(file, db)
-        
-        new_dataset = dataset_model.Dataset(
-            user_id=current_user.id,
-            original_filename=file.filename,
-            database_table_name=table_name
-        )
-        db.add(new_dataset)
-        db.commit()
-        db.refresh(new_dataset)
-        
-        return new_dataset
+        # The request only spools the file and queues the job; parsing and inserting
+        # happen in the ingest worker processes.
+        with span("upload", "spool"):
+            spool_path, file_size = await run_in_threadpool(ingest_jobs.spool, file.file, file.filename)
+        job = await run_in_threadpool(ingest_jobs.create_job, db, current_user.id, file.filename, backend, spool_path, file_size)
+
+        if settings.INGEST_BACKGROUND:
+            ingest_jobs.submit(job)
+        else:
+            await run_in_threadpool(ingest_jobs.run_inline, job)
+            db.refresh(job)
+
+        return ingest_jobs.describe(job)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during file upload: {str(e)}")
+
+@router.get("/jobs/{job_id}", response_model=job_schema.IngestJob)
+def get_ingest_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    return ingest_jobs.describe(_get_owned_job(db, job_id, current_user.id))
+
+@router.post("/jobs/{job_id}/cancel", response_model=job_schema.IngestJob)
+def cancel_ingest_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    job = ingest_jobs.cancel(db, _get_owned_job(db, job_id, current_user.id))
+    return ingest_jobs.describe(job)
+
+@router.post("/jobs/{job_id}/retry", response_model=job_schema.IngestJob, status_code=status.HTTP_202_ACCEPTED)
+def retry_ingest_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: dependencies.Principal = Depends(dependencies.get_current_user)
+):
+
+    job = ingest_jobs.retry(db, _get_owned_job(db, job_id, current_user.id))
+    return ingest_jobs.describe(job)
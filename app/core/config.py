@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 import os
 
 class Settings(BaseSettings):
@@ -7,6 +8,93 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10_000
+    AUTH_HASH_WORKERS: int = 4
+
+    LLM_MODEL: str = "openai/gpt-oss-20b:free"
+    LLM_BASE_URL: str = "https://openrouter.ai/api/v1"
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_MAX_CONCURRENCY_PER_USER: int = 2
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_SECONDS: float = 1.0
+    LLM_RETRY_MAX_SECONDS: float = 30.0
+
+    HISTORY_TOKEN_BUDGET: int = 1500
+    HISTORY_MESSAGE_MAX_TOKENS: int = 400
+    HISTORY_MAX_MESSAGES: int = 50
+    HISTORY_TOKEN_ENCODING: str = "cl100k_base"
+    HISTORY_SUMMARY_MAX_WORDS: int = 150
+    HISTORY_SUMMARY_BATCH: int = 100
+
+    ANALYTICS_DATABASE_URL: Optional[str] = None
+    ANALYTICS_POOL_SIZE: int = 5
+    ANALYTICS_MAX_OVERFLOW: int = 5
+    ANALYTICS_POOL_TIMEOUT_SECONDS: int = 10
+    ANALYTICS_POOL_RECYCLE_SECONDS: int = 1800
+    ANALYTICS_QUERY_TIMEOUT_SECONDS: float = 30
+
+    COST_GUARD_ENABLED: bool = True
+    COST_GUARD_MAX_ROWS: int = 50_000_000
+    COST_GUARD_MAX_COST: Optional[float] = None
+    COST_GUARD_ACTION: str = "reject"
+    COST_GUARD_LIMIT_ROWS: int = 1_000_000
+    COST_GUARD_SAMPLE_ROWS: int = 1_000_000
+
+    RESULT_PREVIEW_ROWS: int = 10
+    RESULT_COUNT_TOTAL: bool = True
+    CHART_MAX_ROWS: int = 10_000
+    CHART_MAX_POINTS: int = 500
+    EXPORT_BATCH_ROWS: int = 50_000
+    EXPORT_QUERY_TIMEOUT_SECONDS: float = 600
+    EXPORT_TYPE_SCAN_ROWS: int = 100_000
+
+    SQL_CACHE_MAX_ENTRIES: int = 1024
+    SQL_CACHE_TTL_SECONDS: int = 60 * 60 * 24
+    SQL_CACHE_PATH: Optional[str] = None
+    SQL_CACHE_CONTEXT_QUESTIONS: int = 1
+
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    RESULT_CACHE_TTL_SECONDS: int = 60 * 60
+    RESULT_CACHE_SPILL_DIR: Optional[str] = None
+    RESULT_CACHE_SPILL_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+
+    STORAGE_BACKEND: str = "sql"
+    DUCKDB_DATA_DIR: str = "data/duckdb"
+    DUCKDB_THREADS: Optional[int] = None
+    DUCKDB_MEMORY_LIMIT: Optional[str] = None
+    DUCKDB_MAX_DATABASES: int = 64
+
+    INGEST_MODE: str = "streaming"
+    INGEST_CHUNK_ROWS: int = 50_000
+    INGEST_USE_LOAD_DATA: bool = False
+    INGEST_INFER_TYPES: bool = True
+    INGEST_BACKGROUND: bool = True
+    INGEST_WORKERS: int = 2
+    INGEST_WORKER_NICE: int = 10
+    INGEST_SPOOL_DIR: str = "data/spool"
+    INGEST_PROGRESS_INTERVAL_SECONDS: float = 1.0
+    INGEST_STALE_SECONDS: int = 120
+    INGEST_SPOOL_TTL_SECONDS: int = 60 * 60 * 24 * 7
+    TYPE_INFERENCE_SAMPLE_ROWS: int = 10_000
+
+    PROFILE_SKETCH_PRECISION: int = 12
+    PROFILE_TOP_K: int = 10
+    PROFILE_TOP_K_CAPACITY: int = 100
+    PROFILE_FAST_PATH: bool = True
+
+    INDEX_ADVISOR_ENABLED: bool = True
+    INDEX_ADVISOR_MIN_ROWS: int = 10_000
+    INDEX_ADVISOR_MAX_DISTINCT_RATIO: float = 0.2
+    INDEX_ADVISOR_MAX_UPLOAD_INDEXES: int = 3
+    INDEX_ADVISOR_MAX_INDEXES: int = 8
+    INDEX_ADVISOR_MIN_OBSERVATIONS: int = 3
+    INDEX_ADVISOR_DROP_AFTER_QUERIES: int = 200
+
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+
     class Config():
         env_file = ".env"
 
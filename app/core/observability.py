@@ -0,0 +1,239 @@
+import contextlib
+import contextvars
+import json
+import logging
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.pipeline")
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Wall-clock time spent in each pipeline stage.",
+    ["pipeline", "stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+STAGE_ERRORS = Counter(
+    "pipeline_stage_errors_total",
+    "Pipeline stages that ended with an exception.",
+    ["pipeline", "stage"],
+)
+STAGE_ROWS = Histogram(
+    "pipeline_stage_rows",
+    "Rows produced or written by a pipeline stage.",
+    ["pipeline", "stage"],
+    buckets=(1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+LLM_TOKENS = Histogram(
+    "llm_tokens",
+    "Tokens sent to and received from the LLM per call.",
+    ["stage", "direction"],
+    buckets=(10, 50, 100, 250, 500, 1_000, 2_000, 4_000, 8_000, 16_000, 32_000),
+)
+INGEST_ROWS_PER_SECOND = Histogram(
+    "ingest_rows_per_second",
+    "Upload throughput per ingest mode.",
+    ["mode"],
+    buckets=(1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000),
+)
+RESULT_CACHE_LOOKUPS = Counter(
+    "result_cache_lookups_total",
+    "Query result cache lookups; the hit ratio is hits over hits and misses (bypass: query not cacheable).",
+    ["outcome"],
+)
+RESULT_CACHE_BYTES = Gauge(
+    "result_cache_bytes",
+    "Serialized query results held by the result cache.",
+    ["tier"],
+)
+RESULT_CACHE_ENTRIES = Gauge(
+    "result_cache_entries",
+    "Query results held by the result cache.",
+    ["tier"],
+)
+SQL_CACHE_LOOKUPS = Counter(
+    "sql_cache_lookups_total",
+    "Generated SQL cache lookups by outcome.",
+    ["outcome"],
+)
+SQL_CACHE_REMOVALS = Counter(
+    "sql_cache_removals_total",
+    "Generated SQL dropped from the cache: expired, over capacity, schema changed or failed when run.",
+    ["reason"],
+)
+SQL_CACHE_ENTRIES = Gauge(
+    "sql_cache_entries",
+    "Generated SQL queries held by the cache.",
+)
+HISTORY_PROMPTS = Counter(
+    "history_prompts_total",
+    "Chat prompts built from the conversation history.",
+)
+HISTORY_PROMPT_TOKENS = Counter(
+    "history_prompt_tokens_total",
+    "Tokens in the history prompts sent to the LLM.",
+)
+HISTORY_BASELINE_TOKENS = Counter(
+    "history_baseline_tokens_total",
+    "Tokens the same prompts would have had with the last ten messages sent in full.",
+)
+HISTORY_TOKENS_SAVED = Counter(
+    "history_tokens_saved_total",
+    "Baseline tokens left out of history prompts; prompts longer than their baseline add nothing.",
+)
+HISTORY_SUMMARIES_UPDATED = Counter(
+    "history_summaries_updated_total",
+    "Rolling conversation summary updates.",
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_queue_depth",
+    "LLM calls waiting for a concurrency slot.",
+)
+LLM_IN_FLIGHT = Gauge(
+    "llm_in_flight",
+    "LLM calls holding a concurrency slot.",
+)
+LLM_QUEUED_USERS = Gauge(
+    "llm_queued_users",
+    "Users with LLM calls waiting for a concurrency slot.",
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM calls spent queued before getting a slot.",
+    ["stage"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LLM_COALESCED = Counter(
+    "llm_coalesced_total",
+    "LLM calls served by an identical call already in flight.",
+    ["stage"],
+)
+LLM_RETRIES = Counter(
+    "llm_retries_total",
+    "LLM calls retried after a rate limit or a transient provider error.",
+    ["reason"],
+)
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections of each database pool by state.",
+    ["pool", "state"],
+)
+DB_POOL_SATURATION = Gauge(
+    "db_pool_saturation",
+    "Share of a sized pool's capacity that is checked out.",
+    ["pool"],
+)
+ANALYTICS_QUERY_EVENTS = Counter(
+    "analytics_query_events_total",
+    "Analytics queries started, timed out, cancelled or refused a pooled connection.",
+    ["event"],
+)
+ANALYTICS_CHECKOUT_WAIT_SECONDS = Histogram(
+    "analytics_checkout_wait_seconds",
+    "Time analytics queries waited for a pooled connection.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def observe_stage(pipeline: str, stage: str, seconds: float, status: str = "ok", **fields):
+    """Records one finished stage as histogram samples and a structured log line."""
+
+    STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+    if status == "error":
+        STAGE_ERRORS.labels(pipeline, stage).inc()
+    if fields.get("rows") is not None:
+        STAGE_ROWS.labels(pipeline, stage).observe(fields["rows"])
+    for direction in ("prompt", "completion"):
+        if fields.get(f"{direction}_tokens") is not None:
+            LLM_TOKENS.labels(stage, direction).observe(fields[f"{direction}_tokens"])
+    if fields.get("rows_per_sec") is not None and fields.get("mode") is not None:
+        INGEST_ROWS_PER_SECOND.labels(fields["mode"]).observe(fields["rows_per_sec"])
+
+    logger.info(
+        "%s.%s %.1f ms", pipeline, stage, seconds * 1000,
+        extra={"span": {"pipeline": pipeline, "stage": stage, "duration_ms": round(seconds * 1000, 2), "status": status, **fields}},
+    )
+
+
+@contextlib.contextmanager
+def span(pipeline: str, stage: str, **fields):
+    """Times the enclosed block; the yielded dict collects fields such as ``rows`` or token counts."""
+
+    record = dict(fields)
+    status = "ok"
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        # CancelledError and GeneratorExit mean the client went away mid-stage.
+        status = "error" if isinstance(e, Exception) else "cancelled"
+        raise
+    finally:
+        observe_stage(pipeline, stage, time.perf_counter() - started, status, **record)
+
+
+def metrics_response() -> tuple:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": request_id_var.get(),
+        }
+        payload.update(getattr(record, "span", None) or {})
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging():
+    handler = logging.StreamHandler()
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+
+
+class RequestIdMiddleware:
+    """Tags every request with an ID (the caller's ``X-Request-ID`` or a new one) for logs and the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = re.sub(r"[^A-Za-z0-9._-]", "", headers.get(b"x-request-id", b"").decode("latin-1"))[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
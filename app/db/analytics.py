@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import observability
+from app.core.config import settings
+from app.db.database import async_database_url, engine
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DATABASE_URL = settings.ANALYTICS_DATABASE_URL or settings.DATABASE_URL
+
+
+class QueryCancelledError(Exception):
+    pass
+
+
+def _pool_args(url: str) -> dict:
+    # SQLite picks its own pool class and has no server connections to ration.
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.ANALYTICS_POOL_SIZE,
+        "max_overflow": settings.ANALYTICS_MAX_OVERFLOW,
+        "pool_timeout": settings.ANALYTICS_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.ANALYTICS_POOL_RECYCLE_SECONDS,
+    }
+
+
+def _configure_session(dbapi_connection, connection_record):
+    """Makes every analytics connection read-only and, on MySQL, bounds SELECT run time server-side."""
+    cursor = dbapi_connection.cursor()
+    try:
+        if ANALYTICS_DATABASE_URL.startswith("mysql"):
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            cursor.execute(f"SET SESSION max_execution_time = {int(settings.ANALYTICS_QUERY_TIMEOUT_SECONDS * 1000)}")
+            cursor.execute("SELECT CONNECTION_ID()")
+            connection_record.info["connection_id"] = cursor.fetchone()[0]
+        elif ANALYTICS_DATABASE_URL.startswith("sqlite"):
+            cursor.execute("PRAGMA query_only = ON")
+    finally:
+        cursor.close()
+
+
+analytics_engine = create_engine(ANALYTICS_DATABASE_URL, pool_pre_ping=True, **_pool_args(ANALYTICS_DATABASE_URL))
+event.listen(analytics_engine, "connect", _configure_session)
+
+_async_url = async_database_url(ANALYTICS_DATABASE_URL)
+analytics_async_engine = create_async_engine(_async_url, pool_pre_ping=True, **_pool_args(ANALYTICS_DATABASE_URL)) if _async_url else None
+if analytics_async_engine is not None:
+    event.listen(analytics_async_engine.sync_engine, "connect", _configure_session)
+
+def record(event: str):
+    observability.ANALYTICS_QUERY_EVENTS.labels(event).inc()
+
+
+def record_checkout(started: float):
+    record("queries")
+    observability.ANALYTICS_CHECKOUT_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _kill_query(connection_id: int):
+    # Runs on the application pool, since the analytics pool may be the exhausted one.
+    with engine.connect() as connection:
+        connection.execute(text(f"KILL QUERY {int(connection_id)}"))
+
+
+def canceller(connection_info: dict, dbapi_connection=None):
+    """Returns a callable that aborts the statement running on a connection, or None."""
+    connection_id = connection_info.get("connection_id")
+    if connection_id is not None:
+        return lambda: _kill_query(connection_id)
+    # sqlite3 connections can be interrupted from another thread.
+    return getattr(dbapi_connection, "interrupt", None)
+
+
+class QueryHandle:
+    """Cancels the statement running on an analytics connection from another thread or task."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancel = None
+        self.reason = None
+
+    def bind(self, cancel):
+        with self._lock:
+            self._cancel = cancel
+            pending = self.reason is not None
+        if pending and cancel is not None:
+            cancel()
+
+    def cancel(self, reason: str):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            cancel = self._cancel
+        record("timeouts" if reason == "timeout" else "cancellations")
+        if cancel is not None:
+            try:
+                cancel()
+            except Exception as e:
+                logger.warning("Could not cancel analytics query: %s", e)
+
+
+def _export_pool(name: str, pool, sized: bool):
+    """Reports ``pool``'s connections on /metrics, read when scraped."""
+    for state in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, state, None)
+        if callable(method):
+            observability.DB_POOL_CONNECTIONS.labels(name, state).set_function(method)
+    if sized:
+        capacity = settings.ANALYTICS_POOL_SIZE + settings.ANALYTICS_MAX_OVERFLOW
+        observability.DB_POOL_SATURATION.labels(name).set_function(lambda: pool.checkedout() / capacity)
+
+
+_export_pool("application", engine.pool, False)
+_export_pool("analytics", analytics_engine.pool, bool(_pool_args(ANALYTICS_DATABASE_URL)))
+if analytics_async_engine is not None:
+    _export_pool("analytics_async", analytics_async_engine.pool, bool(_pool_args(ANALYTICS_DATABASE_URL)))
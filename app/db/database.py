@@ -3,7 +3,19 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+connect_args = {}
+if settings.INGEST_USE_LOAD_DATA and settings.DATABASE_URL.startswith("mysql"):
+    # LOAD DATA LOCAL INFILE must be enabled on the client side as well as on the server.
+    connect_args["local_infile"] = True
+
+engine = create_engine(settings.DATABASE_URL, connect_args=connect_args)
+
+def async_database_url(url: str):
+    """Maps a sync MySQL URL onto the asyncmy driver; other backends have no async driver here."""
+    for prefix in ("mysql+pymysql://", "mysql://"):
+        if url.startswith(prefix):
+            return "mysql+asyncmy://" + url[len(prefix):]
+    return None
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
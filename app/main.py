@@ -1,23 +1,33 @@
 from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from app.api.v1.api import api_router
+from app.core import observability
 from app.db.database import engine, Base
 
-from app.models import user, dataset, chat, saved_chart
+from app.models import user, dataset, dataset_catalog, dataset_profile, index_decision, ingest_job, conversation_summary, chat, saved_chart
 
 Base.metadata.create_all(bind=engine)
 
+observability.configure_logging()
+
 app = FastAPI(
     title="AI Data Analyst",
     description="An AI-powered data analysis tool with user accounts and chat history.",
     version="0.3.0"
 )
 
+app.add_middleware(observability.RequestIdMiddleware)
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 @app.get("/", include_in_schema=False)
 async def read_index():
     return FileResponse('app/static/index.html')
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    content, media_type = observability.metrics_response()
+    return Response(content=content, media_type=media_type)
+
 app.include_router(api_router, prefix="/api/v1")
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, DateTime, func, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), unique=True, nullable=False)
+    summary = Column(Text, nullable=False)
+    last_message_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    dataset = relationship("Dataset", back_populates="conversation_summary")
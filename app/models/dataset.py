@@ -1,15 +1,27 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
 class Dataset(Base):
     __tablename__ = "datasets"
+    __table_args__ = (
+        Index("ix_datasets_user_id_upload_timestamp", "user_id", "upload_timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     original_filename = Column(String(255), nullable=False)
     database_table_name = Column(String(255), unique=True, nullable=False)
     upload_timestamp = Column(DateTime, default=func.now())
+    storage_backend = Column(String(16), nullable=False, default="sql", server_default="sql")
+    status = Column(String(16), nullable=False, default="ready", server_default="ready")
+    # Bumped whenever the table's rows change; cached query results carry the version they were read at.
+    data_version = Column(Integer, nullable=False, default=1, server_default="1")
 
     owner = relationship("User", back_populates="datasets")
     chat_messages = relationship("ChatMessage", back_populates="dataset", cascade="all, delete-orphan")
+    index_decisions = relationship("IndexDecision", back_populates="dataset", cascade="all, delete-orphan")
+    conversation_summary = relationship("ConversationSummary", back_populates="dataset", uselist=False, cascade="all, delete-orphan")
+    catalog = relationship("DatasetCatalog", back_populates="dataset", uselist=False, cascade="all, delete-orphan")
+    profile = relationship("DatasetProfile", back_populates="dataset", uselist=False, cascade="all, delete-orphan")
+    ingest_jobs = relationship("IngestJob", back_populates="dataset", cascade="all, delete-orphan")
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, func, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+
+class DatasetCatalog(Base):
+    __tablename__ = "dataset_catalogs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), unique=True, nullable=False)
+    columns = Column(Text, nullable=False)
+    sample_rows = Column(Text, nullable=False)
+    row_count = Column(BigInteger, nullable=False, default=0)
+    schema_hash = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    dataset = relationship("Dataset", back_populates="catalog")
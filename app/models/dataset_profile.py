@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, BigInteger, DateTime, func, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+
+class DatasetProfile(Base):
+    __tablename__ = "dataset_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), unique=True, nullable=False)
+    row_count = Column(BigInteger, nullable=False, default=0)
+    profile = Column(Text(length=2**24), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    dataset = relationship("Dataset", back_populates="profile")
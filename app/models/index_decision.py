@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+
+class IndexDecision(Base):
+    __tablename__ = "index_decisions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    column_name = Column(String(255), nullable=False)
+    index_name = Column(String(64), nullable=False)
+    action = Column(String(16), nullable=False)
+    source = Column(String(16), nullable=False)
+    reason = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+    dataset = relationship("Dataset", back_populates="index_decisions")
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, func, ForeignKey, Text, Boolean
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False, index=True)
+    kind = Column(String(16), nullable=False, default="upload", server_default="upload")
+    status = Column(String(16), nullable=False, default="queued")
+    filename = Column(String(255), nullable=False)
+    spool_path = Column(String(1024), nullable=False)
+    backend = Column(String(16), nullable=False)
+    table_name = Column(String(255), nullable=True)
+    # The dataset's ID while the job is queued or running, NULL once it is over: the
+    # unique index lets only one job at a time claim a dataset.
+    active_dataset_id = Column(Integer, nullable=True, unique=True)
+    dedup = Column(Boolean, nullable=False, default=False, server_default="0")
+    file_size = Column(BigInteger, nullable=False, default=0)
+    bytes_read = Column(BigInteger, nullable=False, default=0)
+    rows_ingested = Column(BigInteger, nullable=False, default=0)
+    rows_total = Column(BigInteger, nullable=True)
+    attempts = Column(Integer, nullable=False, default=1)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    dataset = relationship("Dataset", back_populates="ingest_jobs")
@@ -1,14 +1,23 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from app.db.database import Base
 
 class SavedChart(Base):
     __tablename__ = "saved_charts"
+    __table_args__ = (
+        Index("ix_saved_charts_dataset_id_created_at", "dataset_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     dataset_id = Column(Integer, ForeignKey("datasets.id"), nullable=False)
     label = Column(String(255), nullable=False)
     chart_data = Column(Text, nullable=False) 
+    # The query behind the chart and the dataset version its data was built from;
+    # charts saved without a query cannot be refreshed.
+    sql_query = Column(Text, nullable=True)
+    data_version = Column(Integer, nullable=True)
+    content_hash = Column(String(64), nullable=True)
     created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     dataset = relationship("Dataset")
@@ -1,11 +1,17 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 class ChatMessage(BaseModel):
     id: int
     is_from_user: bool
     message: str
+    sql_query: Optional[str] = None
     timestamp: datetime
 
     class Config:
         from_attributes = True
+
+class ChatMessagePage(BaseModel):
+    items: List[ChatMessage]
+    next_cursor: Optional[str] = None
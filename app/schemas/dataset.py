@@ -1,10 +1,23 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Literal, Optional
 
 class Dataset(BaseModel):
     id: int
     original_filename: str
     upload_timestamp: datetime
+    storage_backend: str
+    status: str
+    data_version: int
 
     class Config:
         from_attributes = True
+
+class DatasetPage(BaseModel):
+    items: List[Dataset]
+    next_cursor: Optional[str] = None
+
+class DatasetExportRequest(BaseModel):
+    message_id: Optional[int] = None
+    sql_query: Optional[str] = None
+    format: Literal["csv", "parquet", "arrow"] = "csv"
@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+class TopValue(BaseModel):
+    value: str
+    count: int
+
+class ColumnProfile(BaseModel):
+    kind: str
+    count: int
+    nulls: int
+    min: Optional[Any] = None
+    max: Optional[Any] = None
+    mean: Optional[float] = None
+    sum: Optional[float] = None
+    distinct: int
+    distinct_exact: bool
+    top_values: List[TopValue]
+
+class DatasetProfile(BaseModel):
+    row_count: int
+    columns: Dict[str, ColumnProfile]
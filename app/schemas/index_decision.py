@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+class IndexDecision(BaseModel):
+    id: int
+    column_name: str
+    index_name: str
+    action: str
+    source: str
+    reason: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+class IngestJob(BaseModel):
+    id: int
+    dataset_id: int
+    kind: str
+    status: str
+    filename: str
+    backend: str
+    file_size: int
+    bytes_read: int
+    rows_ingested: int
+    rows_total: Optional[int] = None
+    dedup: bool
+    percent: float
+    eta_seconds: Optional[float] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
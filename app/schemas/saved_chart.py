@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 import json
 
 class SavedChartBase(BaseModel):
@@ -7,12 +8,20 @@ class SavedChartBase(BaseModel):
     chart_data: str 
 
 class SavedChartCreate(SavedChartBase):
-    pass
+    sql_query: Optional[str] = None
 
 class SavedChart(SavedChartBase):
     id: int
     dataset_id: int
+    sql_query: Optional[str] = None
+    data_version: Optional[int] = None
+    content_hash: Optional[str] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class SavedChartPage(BaseModel):
+    items: List[SavedChart]
+    next_cursor: Optional[str] = None
@@ -1,109 +1,378 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
 import pandas as pd
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError, TimeoutError as PoolTimeoutError
+from starlette.concurrency import run_in_threadpool
 from app.core.config import settings
+from app.core.observability import span
 from app.db.database import engine
+from app.db import analytics
 from langchain_openai import ChatOpenAI
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain.chains import create_sql_query_chain
+from langchain.chains.sql_database.prompt import PROMPT, SQL_PROMPTS
 from openai import APIError
 from sqlalchemy import text
+from app.services.sql_cache import sql_cache
+from app.services.result_cache import result_cache
+from app.services.llm_scheduler import llm_scheduler, request_key
+from app.services import schema_catalog, index_advisor, chart_builder, conversation, cost_guard, duckdb_backend, profiler
 import json
+import re
+
+logger = logging.getLogger(__name__)
+
+def _is_select(sql_query: str) -> bool:
+    return sql_query.upper().startswith("SELECT") or sql_query.upper().startswith("WITH")
+
+def get_llm() -> ChatOpenAI:
+    return ChatOpenAI(
+        model=settings.LLM_MODEL,
+        temperature=0,
+        openai_api_key=settings.OPENROUTER_KEY,
+        base_url=settings.LLM_BASE_URL,
+        # Retries are left to the scheduler, which backs off without holding a concurrency slot.
+        max_retries=0,
+        default_headers={"HTTP-Referer": "http://localhost:8000", "X-Title": "AI Data Analyst"}
+    )
+
+def _prompt_dialect(backend: str) -> str:
+    # DuckDB follows PostgreSQL syntax closely enough for the PostgreSQL prompt.
+    return "postgresql" if backend == "duckdb" else engine.dialect.name
+
+def _token_usage(usage_metadata, prompt_text: str, completion_text: str) -> dict:
+    # Providers report usage when they can; otherwise estimate with the history tokenizer.
+    usage = usage_metadata or {}
+    return {
+        "prompt_tokens": usage.get("input_tokens") or conversation.count_tokens(prompt_text),
+        "completion_tokens": usage.get("output_tokens") or conversation.count_tokens(completion_text),
+    }
+
+async def _generate_sql(llm, table_info: str, conversation_prompt: str, backend: str = "sql", user_id: int = None) -> tuple:
+    """Returns the generated SQL and the token usage of the call."""
+
+    sql_prompt = SQL_PROMPTS.get(_prompt_dialect(backend), PROMPT).partial(top_k="5")
+    query_generation_chain = sql_prompt | llm.bind(stop=["\nSQLResult:"])
+
+    general_sql_instruction = (
+        "You are a helpful AI data analyst. Based on the conversation history and the user's final question, generate a single, highly compatible SQL query to answer the question.\n"
+        "IMPORTANT GUIDELINES FOR SQL GENERATION:\n"
+        "1. **Use Highly Compatible SQL:** Adhere to the ANSI SQL (SQL-92) standard.\n"
+        "2. **Avoid Modern Functions:** Do not use advanced or vendor-specific functions like JSON_TABLE.\n"
+        "3. **Goal:** The query must be runnable on older database systems."
+    )
+    enhanced_prompt = f"{general_sql_instruction}\n\nConversation History:\n{conversation_prompt}"
+    prompt_input = {"input": f"{enhanced_prompt}\nSQLQuery: ", "table_info": table_info}
+    prompt_text = sql_prompt.format(**prompt_input)
+    response = await llm_scheduler.call(
+        request_key("sql_generation", prompt_text), user_id,
+        lambda: query_generation_chain.ainvoke(prompt_input), stage="sql_generation"
+    )
+    raw_response = response.content
+    usage = _token_usage(response.usage_metadata, prompt_text, raw_response)
+    logger.debug("Raw LLM response: %s", raw_response)
+
+    if "SQLQuery:" in raw_response:
+        sql_query = raw_response.split("SQLQuery:")[-1].strip()
+        if '```' in sql_query:
+            sql_query = sql_query.split('```')[1]
+
+        sql_query = sql_query.replace('sql', '').replace('`', '').replace('\\', '').strip()
+
+        if "SQLResult:" in sql_query:
+             sql_query = sql_query.split("SQLResult:")[0].strip()
+    else:
+        sql_query = raw_response.strip()
+
+    if sql_query.endswith(';'):
+        sql_query = sql_query[:-1]
+
+    return sql_query, usage
+
+LIMIT_CLAUSE = re.compile(r'\blimit\s+\d+(\s*(,|offset)\s*\d+)?\s*$', re.IGNORECASE)
+CHART_KEYWORDS = ['chart', 'plot', 'graph', 'visualize', 'diagram', 'bar', 'pie', 'line']
+
+def _bounded_sql(sql_query: str, max_rows: int) -> str:
+    # One extra row tells us whether the result was truncated.
+    if LIMIT_CLAUSE.search(sql_query):
+        return sql_query
+    return f"{sql_query}\nLIMIT {max_rows + 1}"
+
+def _count_sql(sql_query: str) -> str:
+    return f"SELECT COUNT(*) FROM (\n{sql_query}\n) AS bounded_result"
+
+def _read_sql_sync(sql_query: str, max_rows: int, handle: analytics.QueryHandle) -> tuple:
+    started = time.perf_counter()
+    with analytics.analytics_engine.connect() as connection:
+        analytics.record_checkout(started)
+        handle.bind(analytics.canceller(connection.info, connection.connection.dbapi_connection))
+        timer = threading.Timer(settings.ANALYTICS_QUERY_TIMEOUT_SECONDS, handle.cancel, args=("timeout",))
+        timer.start()
+        try:
+            result = connection.execution_options(stream_results=True).execute(text(_bounded_sql(sql_query, max_rows)))
+            columns = list(result.keys())
+            rows = result.fetchmany(max_rows + 1)
+            result.close()
+            total_rows = None
+            if len(rows) > max_rows and settings.RESULT_COUNT_TOTAL:
+                total_rows = connection.execute(text(_count_sql(sql_query))).scalar()
+        except DBAPIError:
+            if handle.reason is not None:
+                raise analytics.QueryCancelledError(handle.reason)
+            raise
+        finally:
+            timer.cancel()
+            if handle.reason is not None:
+                # KILL QUERY can leave a half-read result behind; drop the connection instead of pooling it.
+                connection.invalidate()
+    return columns, rows, total_rows
+
+def _read_duckdb_sync(table_name: str, sql_query: str, max_rows: int, handle: analytics.QueryHandle) -> tuple:
+    cursor = duckdb_backend.cursor(table_name)
+    handle.bind(cursor.interrupt)
+    timer = threading.Timer(settings.ANALYTICS_QUERY_TIMEOUT_SECONDS, handle.cancel, args=("timeout",))
+    timer.start()
+    try:
+        cursor.execute(_bounded_sql(sql_query, max_rows))
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchmany(max_rows + 1)
+        total_rows = None
+        if len(rows) > max_rows and settings.RESULT_COUNT_TOTAL:
+            total_rows = cursor.execute(_count_sql(sql_query)).fetchone()[0]
+    except duckdb_backend.DuckDBError:
+        if handle.reason is not None:
+            raise analytics.QueryCancelledError(handle.reason)
+        raise
+    finally:
+        timer.cancel()
+        cursor.close()
+    return columns, rows, total_rows
+
+async def _read_sql_async(connection, sql_query: str, max_rows: int) -> tuple:
+    result = await connection.stream(text(_bounded_sql(sql_query, max_rows)))
+    columns = list(result.keys())
+    rows = await result.fetchmany(max_rows + 1)
+    await result.close()
+    total_rows = None
+    if len(rows) > max_rows and settings.RESULT_COUNT_TOTAL:
+        total_rows = (await connection.execute(text(_count_sql(sql_query)))).scalar()
+    return columns, rows, total_rows
+
+async def _fetch_rows(sql_query: str, max_rows: int, table_name: str, backend: str) -> tuple:
+    # Runs on the analytics pool so slow generated queries cannot starve logins and
+    # history writes. Statements are killed on timeout or when the caller is cancelled,
+    # e.g. because the client of a streamed answer disconnected.
+    handle = analytics.QueryHandle()
+    if backend == "duckdb" or analytics.analytics_async_engine is None:
+        try:
+            if backend == "duckdb":
+                return await run_in_threadpool(_read_duckdb_sync, table_name, duckdb_backend.to_duckdb_sql(sql_query), max_rows, handle)
+            return await run_in_threadpool(_read_sql_sync, sql_query.replace('%', '%%'), max_rows, handle)
+        except asyncio.CancelledError:
+            await asyncio.shield(run_in_threadpool(handle.cancel, "cancelled"))
+            raise
+
+    started = time.perf_counter()
+    async with analytics.analytics_async_engine.connect() as connection:
+        analytics.record_checkout(started)
+        handle.bind(analytics.canceller(connection.info))
+        try:
+            return await asyncio.wait_for(_read_sql_async(connection, sql_query.replace('%', '%%'), max_rows), settings.ANALYTICS_QUERY_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await run_in_threadpool(handle.cancel, "timeout")
+            await connection.invalidate()
+            raise analytics.QueryCancelledError("timeout")
+        except asyncio.CancelledError:
+            await asyncio.shield(run_in_threadpool(handle.cancel, "cancelled"))
+            await asyncio.shield(connection.invalidate())
+            raise
+
+async def _execute_query(sql_query: str, max_rows: int, table_name: str = None, backend: str = "sql") -> tuple:
+    """Fetches at most ``max_rows`` rows through a server-side cursor.
+
+    Returns the rows as a DataFrame plus the total row count, which is only
+    queried separately when the result was cut off.
+    """
+    try:
+        columns, rows, total_rows = await _fetch_rows(sql_query, max_rows, table_name, backend)
+    except PoolTimeoutError:
+        analytics.record("pool_timeouts")
+        raise
+
+    if total_rows is None:
+        total_rows = len(rows) if len(rows) <= max_rows else None
+    result_df = await run_in_threadpool(pd.DataFrame.from_records, rows[:max_rows], columns=columns)
+    return result_df, total_rows
+
+async def guard_sql(sql_query: str, table_name: str, catalog: dict, backend: str = "sql") -> tuple:
+    """Runs ``sql_query`` past the cost guard; returns the SQL to execute and the guard's decision."""
+
+    # Only the shared database server needs protecting; DuckDB runs in-process.
+    if backend != "sql":
+        return sql_query, None
+    with span("chat", "cost_guard") as record:
+        sql_query, guard_decision = await run_in_threadpool(cost_guard.guard_query, sql_query, table_name, catalog)
+        record["action"] = guard_decision["action"] if guard_decision is not None else None
+    return sql_query, guard_decision
+
+async def run_query(sql_query: str, max_rows: int, table_name: str, backend: str = "sql", data_version: int = None) -> tuple:
+    """Like ``_execute_query``, but served from the result cache when ``data_version`` is known.
+
+    Returns ``(result_df, total_rows, cached)``.
+    """
+    # Results are cached per data version, so an append or replace makes them miss.
+    use_result_cache = settings.RESULT_CACHE_ENABLED and data_version is not None
+    if use_result_cache:
+        cached_result = await run_in_threadpool(result_cache.get, table_name, data_version, sql_query, max_rows)
+        if cached_result is not None:
+            return (*cached_result, True)
+    result_df, total_rows = await _execute_query(sql_query, max_rows, table_name, backend)
+    if use_result_cache:
+        await run_in_threadpool(result_cache.set, table_name, data_version, sql_query, max_rows, result_df, total_rows)
+    return result_df, total_rows, False
+
+def _summarize_result(result_df: pd.DataFrame, total_rows, max_rows: int) -> tuple:
+
+    preview_rows = settings.RESULT_PREVIEW_ROWS
+    preview_df = result_df.head(preview_rows)
+    data_preview_json = json.loads(preview_df.to_json(orient='split')) if not preview_df.empty else None
+
+    result_str = preview_df.to_string()
+    if total_rows is None:
+        # The total is unknown only when the fetch stopped at max_rows with rows still to come.
+        if len(result_df) >= max_rows:
+            result_str += f"\n\n... (and at least {len(result_df) + 1 - len(preview_df)} more rows)"
+    elif total_rows > len(preview_df):
+        result_str += f"\n\n... (and {total_rows - len(preview_df)} more rows)"
+
+    return data_preview_json, result_str
+
+async def stream_sql_agent_response(table_name: str, conversation_prompt: str, catalog: dict, dataset_id: int = None, backend: str = "sql", profile=None, data_version: int = None, user_id: int = None):
+    """Runs the chat pipeline, yielding ``(event, payload)`` pairs as each stage finishes.
+
+    Events are ``sql``, ``data`` and ``token`` (answer text as it is generated). The
+    last event is always ``done``, whose payload is the full response dict, also on errors.
+    """
 
-def get_sql_agent_response(db_uri: str, table_name: str, conversation_prompt: str) -> dict:
-   
     sql_query = ""
+    sql_cached = False
     result_df = pd.DataFrame()
+
+    # Whole-table statistics come straight from the upload-time profile, without the LLM or the table.
+    with span("chat", "profile_lookup") as record:
+        profile_answer = profiler.answer_from_profile(conversation_prompt.split("Human:")[-1].strip(), profile)
+        record["answered"] = profile_answer is not None
+    if profile_answer is not None:
+        yield "done", {"answer": profile_answer, "sql_query": "", "data_preview": None, "source": "profile"}
+        return
     
     try:
-       
-        llm = ChatOpenAI(
-            model="openai/gpt-oss-20b:free",
-            temperature=0,
-            openai_api_key=settings.OPENROUTER_KEY,
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={"HTTP-Referer": "http://localhost:8000", "X-Title": "AI Data Analyst"}
-        )
-
-        db = SQLDatabase.from_uri(db_uri, include_tables=[table_name])
-        query_generation_chain = create_sql_query_chain(llm, db)
-        
-        general_sql_instruction = (
-            "You are a helpful AI data analyst. Based on the conversation history and the user's final question, generate a single, highly compatible SQL query to answer the question.\n"
-            "IMPORTANT GUIDELINES FOR SQL GENERATION:\n"
-            "1. **Use Highly Compatible SQL:** Adhere to the ANSI SQL (SQL-92) standard.\n"
-            "2. **Avoid Modern Functions:** Do not use advanced or vendor-specific functions like JSON_TABLE.\n"
-            "3. **Goal:** The query must be runnable on older database systems."
-        )
-        enhanced_prompt = f"{general_sql_instruction}\n\nConversation History:\n{conversation_prompt}"
-        raw_response = query_generation_chain.invoke({"question": enhanced_prompt})
-
-        print("--- Raw Response from LLM ---")
-        print(raw_response)
-        print("-----------------------------")
-
-        if "SQLQuery:" in raw_response:
-            sql_query = raw_response.split("SQLQuery:")[-1].strip()
-            if '```' in sql_query:
-                sql_query = sql_query.split('```')[1]
-
-            sql_query = sql_query.replace('sql', '').replace('`', '').replace('\\', '').strip()
-
-            if "SQLResult:" in sql_query:
-                 sql_query = sql_query.split("SQLResult:")[0].strip()
-        else:
-            sql_query = raw_response.strip()
-        
-        if sql_query.endswith(';'):
-            sql_query = sql_query[:-1]
-        
-        if not (sql_query.upper().startswith("SELECT") or sql_query.upper().startswith("WITH")):
-            return {
+
+        llm = get_llm()
+
+        table_schema_hash = catalog["schema_hash"]
+
+        with span("chat", "sql_generation") as record:
+            cached_sql = await run_in_threadpool(sql_cache.get, table_name, table_schema_hash, conversation_prompt)
+            sql_cached = record["cached"] = cached_sql is not None
+            if sql_cached:
+                sql_query = cached_sql
+            else:
+                table_info = schema_catalog.render_table_info(table_name, catalog)
+                sql_query, usage = await _generate_sql(llm, table_info, conversation_prompt, backend, user_id)
+                record.update(usage)
+
+        if not _is_select(sql_query):
+            yield "done", {
                 "answer": "The AI generated an invalid response. It did not produce a readable SQL query.",
                 "sql_query": sql_query,
                 "data_preview": None
             }
+            return
 
     except Exception as e:
-        return {"answer": f"Error during query generation: {str(e)}", "sql_query": "", "data_preview": None}
+        yield "done", {"answer": f"Error during query generation: {str(e)}", "sql_query": "", "data_preview": None}
+        return
+
+    generated_sql_query = sql_query
+    guard_decision = None
+
+    async def forget_sql():
+        # A cached query that no longer runs is regenerated on the next ask instead of replayed.
+        if sql_cached:
+            await run_in_threadpool(sql_cache.discard, table_name, table_schema_hash, conversation_prompt)
 
     try:
-        safe_sql_query = sql_query.replace('%', '%%')
-        with engine.connect() as connection:
-            result_df = pd.read_sql_query(text(safe_sql_query), connection)
-    except SQLAlchemyError as e:
-        return {"answer": f"Database Error: {str(e)}", "sql_query": sql_query, "data_preview": None}
+        sql_query, guard_decision = await guard_sql(sql_query, table_name, catalog, backend)
     except Exception as e:
-        return {"answer": f"An unexpected error occurred while fetching data: {str(e)}", "sql_query": sql_query, "data_preview": None}
+        yield "done", {"answer": f"Error while estimating query cost: {str(e)}", "sql_query": sql_query, "data_preview": None}
+        return
 
+    # ``source_sql`` is the query before any cost guard rewrite, the one worth saving with a chart.
+    yield "sql", {"sql_query": sql_query, "source_sql": generated_sql_query, "cost_guard": guard_decision}
+
+    if guard_decision is not None and guard_decision["action"] == "rejected":
+        await forget_sql()
+        yield "done", {
+            "answer": f"{guard_decision['reason']} The query was not run. Try filtering or aggregating the data more narrowly.",
+            "sql_query": sql_query,
+            "data_preview": None,
+            "cost_guard": guard_decision
+        }
+        return
+
+    last_user_question = conversation_prompt.split("Human:")[-1].strip()
+    is_chart_request = any(keyword in last_user_question.lower() for keyword in CHART_KEYWORDS)
+    max_rows = max(settings.RESULT_PREVIEW_ROWS, settings.CHART_MAX_ROWS if is_chart_request else 0)
 
     try:
-        last_user_question = conversation_prompt.split("Human:")[-1].strip()
-        
-        preview_df = result_df.head(10)
-        data_preview_json = json.loads(preview_df.to_json(orient='split')) if not preview_df.empty else None
+        with span("chat", "sql_execution", backend=backend) as record:
+            result_df, total_rows, record["cached"] = await run_query(sql_query, max_rows, table_name, backend, data_version)
+            record["rows"] = len(result_df)
+            record["total_rows"] = total_rows
+        if not sql_cached:
+            # Only SQL that ran is cached, so a broken query is not handed out again.
+            await run_in_threadpool(sql_cache.set, table_name, table_schema_hash, conversation_prompt, generated_sql_query)
+        if backend == "sql":
+            await run_in_threadpool(index_advisor.observe_query, dataset_id, table_name, generated_sql_query, catalog)
+    except analytics.QueryCancelledError:
+        await forget_sql()
+        yield "done", {
+            "answer": f"The query was cancelled because it ran longer than {settings.ANALYTICS_QUERY_TIMEOUT_SECONDS:g} seconds. Try narrowing the question.",
+            "sql_query": sql_query,
+            "data_preview": None,
+            "cost_guard": guard_decision
+        }
+        return
+    except PoolTimeoutError:
+        yield "done", {"answer": "The analytics database is busy right now. Please try again in a moment.", "sql_query": sql_query, "data_preview": None, "cost_guard": guard_decision}
+        return
+    except (SQLAlchemyError, duckdb_backend.DuckDBError) as e:
+        await forget_sql()
+        yield "done", {"answer": f"Database Error: {str(e)}", "sql_query": sql_query, "data_preview": None, "cost_guard": guard_decision}
+        return
+    except Exception as e:
+        await forget_sql()
+        yield "done", {"answer": f"An unexpected error occurred while fetching data: {str(e)}", "sql_query": sql_query, "data_preview": None, "cost_guard": guard_decision}
+        return
 
-        result_str = preview_df.to_string()
-        if len(result_df) > 10:
-            result_str += f"\n\n... (and {len(result_df) - 10} more rows)"
 
-        chart_keywords = ['chart', 'plot', 'graph', 'visualize', 'diagram', 'bar', 'pie', 'line']
-        is_chart_request = any(keyword in last_user_question.lower() for keyword in chart_keywords)
+    data_preview_json = None
+    try:
+        data_preview_json, result_str = await run_in_threadpool(_summarize_result, result_df, total_rows, max_rows)
+        yield "data", {"data_preview": data_preview_json, "total_rows": total_rows}
 
         final_answer = ""
 
+        chart_spec = None
         if is_chart_request and len(result_df.columns) >= 2:
-            prompt_for_chart_json = f"""
-            Based on the user's question and the following data, you MUST respond with ONLY a valid JSON object that can be used to create a chart with Chart.js.
-            The JSON object must have this exact structure: {{"type": "chart", "chart_type": "bar", "data": {{"labels": [], "datasets": [{{"label": "Description", "data": []}}]}}, "title": "Chart Title"}}
-            - 'chart_type' can be 'bar', 'line', or 'pie'.
-            - 'labels' should be the first column of the data.
-            - 'data' should be the second column.
-            User's Question: "{last_user_question}"
-            Data: {result_df.to_json(orient='split')}
-            Valid JSON Response:
-            """
-            final_response = llm.invoke(prompt_for_chart_json)
-            final_answer = final_response.content.strip().replace("```json", "").replace("```", "").strip()
+            with span("chat", "chart_generation") as record:
+                chart_spec = await run_in_threadpool(chart_builder.build_chart_spec, last_user_question, result_df)
+                record["rows"] = len(result_df)
+
+        if chart_spec is not None:
+            final_answer = json.dumps(chart_spec)
         else:
             prompt_for_answer = f"""
             Based on the final user question and the following real data, provide a concise, natural language answer.
@@ -111,14 +380,37 @@ def get_sql_agent_response(db_uri: str, table_name: str, conversation_prompt: st
             Real Data from the database: "{result_str}"
             Answer:
             """
-            final_answer_response = llm.invoke(prompt_for_answer)
-            final_answer = final_answer_response.content
+            # The span includes the time the client takes to consume the streamed tokens.
+            with span("chat", "answer_generation") as record:
+                usage_metadata = None
+                answer_stream = llm_scheduler.stream(
+                    request_key("answer_generation", prompt_for_answer), user_id,
+                    lambda: llm.astream(prompt_for_answer), stage="answer_generation"
+                )
+                async with contextlib.aclosing(answer_stream) as chunks:
+                    async for chunk in chunks:
+                        usage_metadata = chunk.usage_metadata or usage_metadata
+                        if chunk.content:
+                            final_answer += chunk.content
+                            yield "token", {"text": chunk.content}
+                record.update(_token_usage(usage_metadata, prompt_for_answer, final_answer))
 
-        return {
+        yield "done", {
             "answer": final_answer,
             "sql_query": sql_query,
-            "data_preview": data_preview_json
+            "source_sql": generated_sql_query,
+            "data_preview": data_preview_json,
+            "total_rows": total_rows,
+            "cost_guard": guard_decision
         }
 
     except Exception as e:
-        return {"answer": f"Error generating final answer: {str(e)}", "sql_query": sql_query, "data_preview": data_preview_json}
+        yield "done", {"answer": f"Error generating final answer: {str(e)}", "sql_query": sql_query, "data_preview": data_preview_json, "cost_guard": guard_decision}
+
+async def get_sql_agent_response(table_name: str, conversation_prompt: str, catalog: dict, dataset_id: int = None, backend: str = "sql", profile=None, data_version: int = None, user_id: int = None) -> dict:
+
+    response_dict = None
+    async for event, payload in stream_sql_agent_response(table_name, conversation_prompt, catalog, dataset_id, backend, profile, data_version, user_id):
+        if event == "done":
+            response_dict = payload
+    return response_dict
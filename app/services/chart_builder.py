@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from pandas.api import types as pd_types
+
+from app.core.config import settings
+
+MAX_SERIES = 5
+PIE_KEYWORDS = ('pie', 'donut', 'doughnut', 'share', 'proportion', 'percentage')
+LINE_KEYWORDS = ('line', 'trend', 'over time', 'timeline', 'per day', 'per month', 'per year', 'daily', 'monthly', 'yearly')
+BAR_KEYWORDS = ('bar', 'histogram', 'compare', 'comparison')
+
+
+def _as_temporal(series: pd.Series):
+    if pd_types.is_datetime64_any_dtype(series):
+        return series
+    if not pd_types.is_object_dtype(series):
+        return None
+    parsed = pd.to_datetime(series, errors='coerce', format='ISO8601')
+    return parsed if parsed.notna().all() else None
+
+
+def _as_numeric(series: pd.Series):
+    if pd_types.is_bool_dtype(series):
+        return None
+    if pd_types.is_numeric_dtype(series):
+        return series.astype(float)
+    # Tables loaded without type inference hand back numbers as strings.
+    parsed = pd.to_numeric(series, errors='coerce')
+    return parsed if parsed.notna().sum() >= max(1, 0.9 * series.notna().sum()) else None
+
+
+def _chart_type(question: str, temporal_x: bool, points: int) -> str:
+    question = question.lower()
+    if any(keyword in question for keyword in PIE_KEYWORDS):
+        return 'pie'
+    if any(keyword in question for keyword in LINE_KEYWORDS):
+        return 'line'
+    if any(keyword in question for keyword in BAR_KEYWORDS):
+        return 'bar'
+    return 'line' if temporal_x or points > 50 else 'bar'
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the points to keep."""
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = edges[bucket + 1], edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _bucket_categories(labels: pd.Series, values: pd.DataFrame, max_points: int) -> tuple:
+    # Keep the largest categories and fold the rest into a single "Other" entry.
+    if len(labels) <= max_points:
+        return labels, values
+    order = values.iloc[:, 0].fillna(0).to_numpy().argsort()[::-1]
+    keep = np.sort(order[:max_points - 1])
+    rest = np.sort(order[max_points - 1:])
+    kept_labels = pd.concat([labels.iloc[keep], pd.Series(["Other"])], ignore_index=True)
+    kept_values = pd.concat([values.iloc[keep], values.iloc[rest].sum().to_frame().T], ignore_index=True)
+    return kept_labels, kept_values
+
+
+def _label_for(column_name: str) -> str:
+    return str(column_name).replace('_', ' ').strip().title()
+
+
+def _to_list(series: pd.Series) -> list:
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def build_chart_spec(question: str, df: pd.DataFrame, max_points: int = None):
+    """Builds the Chart.js payload for ``df`` without asking the LLM.
+
+    The first column provides the labels and every numeric column after it a
+    series. Returns None when there is nothing numeric to plot.
+    """
+
+    max_points = max_points or settings.CHART_MAX_POINTS
+    if len(df.columns) < 2 or df.empty:
+        return None
+
+    x = df.iloc[:, 0]
+    series = {}
+    for col in df.columns[1:]:
+        numeric = _as_numeric(df[col])
+        if numeric is not None:
+            series[col] = numeric
+        if len(series) == MAX_SERIES:
+            break
+    if not series:
+        return None
+    values = pd.DataFrame(series)
+
+    temporal_x = _as_temporal(x)
+    chart_type = _chart_type(question, temporal_x is not None, len(df))
+
+    if chart_type == 'pie':
+        values = values.iloc[:, :1]
+        labels, values = _bucket_categories(x.astype(str), values, max_points)
+    elif chart_type == 'line' and len(df) > max_points:
+        if temporal_x is not None:
+            order = np.argsort(temporal_x.to_numpy(), kind='stable')
+            x_axis = temporal_x.to_numpy()[order].astype('datetime64[ns]').astype(np.int64).astype(float)
+        else:
+            order = np.arange(len(df))
+            x_axis = order.astype(float)
+        y_axis = values.iloc[order, 0].fillna(0).to_numpy()
+        keep = order[lttb_indices(x_axis, y_axis, max_points)]
+        labels, values = x.iloc[keep], values.iloc[keep]
+    else:
+        labels, values = _bucket_categories(x.astype(str), values, max_points)
+
+    if temporal_x is not None and chart_type != 'pie':
+        labels = pd.to_datetime(labels, errors='coerce', format='ISO8601').dt.strftime('%Y-%m-%d %H:%M:%S').str.replace(' 00:00:00', '', regex=False)
+
+    x_name = _label_for(df.columns[0])
+    return {
+        "type": "chart",
+        "chart_type": chart_type,
+        "data": {
+            "labels": [str(label) for label in labels],
+            "datasets": [{"label": _label_for(col), "data": _to_list(values[col])} for col in values.columns],
+        },
+        "title": f"{', '.join(_label_for(col) for col in values.columns)} by {x_name}",
+    }
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core import observability
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models import chat as chat_model, conversation_summary as summary_model
+
+logger = logging.getLogger(__name__)
+
+# The previous prompt builder sent the last ten messages in full; savings are measured against it.
+BASELINE_MESSAGES = 10
+
+_encoding = None
+_encoding_failed = False
+_summary_locks = {}
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(settings.HISTORY_TOKEN_ENCODING)
+        except Exception as e:
+            # tiktoken downloads its BPE files on first use; without them fall back to an estimate.
+            logger.warning("tiktoken unavailable, estimating token counts: %s", e)
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text if len(text) <= max_tokens * 4 else text[:max_tokens * 4] + " …"
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens]) + " …"
+
+
+def _format_message(msg) -> str:
+    speaker = "Human" if msg.is_from_user else "AI"
+    return f"{speaker}: {msg.message}\n"
+
+
+def build_conversation_prompt(db: Session, dataset_id: int, question: str) -> tuple:
+    """Builds the conversation prompt within HISTORY_TOKEN_BUDGET tokens.
+
+    Recent messages are added newest first until the budget runs out; anything
+    older is represented by the dataset's rolling summary. Returns the prompt
+    and the id of the oldest message kept verbatim when older, unsummarized
+    messages were left out (None otherwise), so the caller can refresh the summary.
+    """
+
+    summary = db.query(summary_model.ConversationSummary).filter(
+        summary_model.ConversationSummary.dataset_id == dataset_id
+    ).first()
+    summarized_upto = summary.last_message_id if summary else 0
+
+    recent_messages = db.query(chat_model.ChatMessage).filter(
+        chat_model.ChatMessage.dataset_id == dataset_id
+    ).order_by(chat_model.ChatMessage.timestamp.desc(), chat_model.ChatMessage.id.desc()).limit(settings.HISTORY_MAX_MESSAGES).all()
+
+    summary_text = f"Summary of the earlier conversation: {summary.summary}\n" if summary else ""
+    remaining = settings.HISTORY_TOKEN_BUDGET - count_tokens(summary_text)
+
+    kept_lines = []
+    oldest_kept_id = None
+    left_out = False
+    # The same question still waiting for its answer is a double submit: leaving it out
+    # gives both requests the same prompt, so their LLM calls are coalesced.
+    pending_repeat = recent_messages[0] if recent_messages and recent_messages[0].is_from_user and recent_messages[0].message == question else None
+    for msg in recent_messages:
+        if msg.id <= summarized_upto:
+            break
+        if msg is pending_repeat:
+            continue
+        line = _format_message(msg)
+        line_tokens = count_tokens(line)
+        if line_tokens > settings.HISTORY_MESSAGE_MAX_TOKENS:
+            line = truncate_to_tokens(line.rstrip("\n"), settings.HISTORY_MESSAGE_MAX_TOKENS) + "\n"
+            line_tokens = settings.HISTORY_MESSAGE_MAX_TOKENS
+        if line_tokens > remaining:
+            left_out = True
+            break
+        kept_lines.append(line)
+        remaining -= line_tokens
+        oldest_kept_id = msg.id
+    else:
+        # Messages beyond the loaded window that the summary does not cover yet.
+        left_out = len(recent_messages) == settings.HISTORY_MAX_MESSAGES and recent_messages[-1].id > summarized_upto + 1
+
+    kept_lines.reverse()
+    question_line = f"Human: {question}"
+    prompt = summary_text + "".join(kept_lines) + question_line
+
+    baseline = "".join(_format_message(msg) for msg in reversed(recent_messages[:BASELINE_MESSAGES])) + question_line
+    baseline_tokens = count_tokens(baseline)
+    prompt_tokens = count_tokens(prompt)
+    observability.HISTORY_PROMPTS.inc()
+    observability.HISTORY_BASELINE_TOKENS.inc(baseline_tokens)
+    observability.HISTORY_PROMPT_TOKENS.inc(prompt_tokens)
+    # Counters only go up; a summary can make a short conversation's prompt longer than its baseline.
+    observability.HISTORY_TOKENS_SAVED.inc(max(0, baseline_tokens - prompt_tokens))
+
+    if not left_out:
+        return prompt, None
+    return prompt, oldest_kept_id if oldest_kept_id is not None else recent_messages[0].id + 1
+
+
+def _load_summary_batch(dataset_id: int, before_message_id: int) -> tuple:
+    db = SessionLocal()
+    try:
+        summary = db.query(summary_model.ConversationSummary).filter(
+            summary_model.ConversationSummary.dataset_id == dataset_id
+        ).first()
+        summarized_upto = summary.last_message_id if summary else 0
+        messages = db.query(chat_model.ChatMessage).filter(
+            chat_model.ChatMessage.dataset_id == dataset_id,
+            chat_model.ChatMessage.id > summarized_upto,
+            chat_model.ChatMessage.id < before_message_id
+        ).order_by(chat_model.ChatMessage.id).limit(settings.HISTORY_SUMMARY_BATCH).all()
+        lines = [
+            truncate_to_tokens(_format_message(msg).rstrip("\n"), settings.HISTORY_MESSAGE_MAX_TOKENS)
+            for msg in messages
+        ]
+        return (summary.summary if summary else ""), lines, (messages[-1].id if messages else None)
+    finally:
+        db.close()
+
+
+def _store_summary(dataset_id: int, summary_text: str, last_message_id: int):
+    db = SessionLocal()
+    try:
+        summary = db.query(summary_model.ConversationSummary).filter(
+            summary_model.ConversationSummary.dataset_id == dataset_id
+        ).first()
+        if summary is None:
+            summary = summary_model.ConversationSummary(dataset_id=dataset_id)
+            db.add(summary)
+        summary.summary = summary_text
+        summary.last_message_id = last_message_id
+        db.commit()
+    finally:
+        db.close()
+
+
+async def update_summary(dataset_id: int, before_message_id: int):
+    """Folds messages older than ``before_message_id`` into the dataset's rolling summary.
+
+    Only messages newer than the last summarized one are sent to the LLM, together
+    with the previous summary, so each update costs one small call.
+    """
+
+    from app.services.ai_service import get_llm
+    from app.services.llm_scheduler import llm_scheduler, request_key
+
+    lock = _summary_locks.setdefault(dataset_id, asyncio.Lock())
+    async with lock:
+        try:
+            while True:
+                previous, lines, last_message_id = await run_in_threadpool(_load_summary_batch, dataset_id, before_message_id)
+                if last_message_id is None:
+                    return
+                prompt = (
+                    "You maintain a running summary of a conversation between a user and an AI data analyst.\n"
+                    f"Update the summary with the new messages. Keep table names, columns, filters and figures the user "
+                    f"may refer back to. Reply with the summary only, at most {settings.HISTORY_SUMMARY_MAX_WORDS} words.\n\n"
+                    f"Current summary:\n{previous or '(empty)'}\n\nNew messages:\n" + "\n".join(lines) + "\n\nUpdated summary:"
+                )
+                # Summaries run for no user in particular and share one fair-queue slot budget.
+                response = await llm_scheduler.call(request_key("summary", prompt), None, lambda: get_llm().ainvoke(prompt), stage="summary")
+                await run_in_threadpool(_store_summary, dataset_id, response.content.strip(), last_message_id)
+                observability.HISTORY_SUMMARIES_UPDATED.inc()
+        except Exception as e:
+            logger.warning("Could not update conversation summary for dataset %s: %s", dataset_id, e)
@@ -0,0 +1,250 @@
+import json
+import logging
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import inspect, text
+
+from app.core.config import settings
+from app.db.database import engine
+from app.db import analytics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SUFFIX = "_sample"
+# Index lookups in SQLite plans carry no row estimate; charge them this share of the table.
+SQLITE_SEARCH_SELECTIVITY = 0.1
+ALIAS_STOPWORDS = r'(?:WHERE|GROUP|ORDER|HAVING|LIMIT|JOIN|INNER|LEFT|RIGHT|FULL|OUTER|CROSS|NATURAL|ON|USING|UNION)\b'
+TABLE_REFERENCE = re.compile(
+    r'\b(FROM|JOIN)\s+[`"]?([A-Za-z_][A-Za-z0-9_]*)[`"]?'
+    r'(?:\s+(?:AS\s+)?(?!' + ALIAS_STOPWORDS + r')[`"]?([A-Za-z_][A-Za-z0-9_]*)[`"]?)?',
+    re.IGNORECASE
+)
+SQLITE_STEP = re.compile(r'^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(.*)$')
+# Rows are kept with a probability a bit above the share needed, so the LIMIT is reached.
+SAMPLE_OVERDRAW = 1.1
+
+# Samples are built off the request path, one at a time.
+_sample_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cost-guard-sample")
+_sample_locks = {}
+_building = set()
+
+
+def table_aliases(sql_query: str) -> dict:
+    """Maps every table name and alias in FROM/JOIN clauses (lower-cased) to its table."""
+    aliases = {}
+    for _, table, alias in TABLE_REFERENCE.findall(sql_query):
+        aliases[table.lower()] = table
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def _plan_rows(node) -> float:
+    # Tables joined in a nested loop multiply; separate query blocks add up.
+    if isinstance(node, list):
+        return sum(_plan_rows(item) for item in node)
+    if not isinstance(node, dict):
+        return 0
+    rows = float(node.get("rows_examined_per_scan", 0))
+    for key, value in node.items():
+        if key == "nested_loop":
+            product = 1.0
+            for item in value:
+                product *= max(1.0, _plan_rows(item))
+            rows += product
+        elif isinstance(value, (dict, list)):
+            rows += _plan_rows(value)
+    return rows
+
+
+def _estimate_mysql(connection, sql_query: str, row_counts: dict) -> dict:
+    plan = json.loads(connection.execute(text(f"EXPLAIN FORMAT=JSON {sql_query}")).scalar())
+    cost = plan.get("query_block", {}).get("cost_info", {}).get("query_cost")
+    return {"rows": _plan_rows(plan), "cost": float(cost) if cost is not None else None}
+
+
+def _estimate_sqlite(connection, sql_query: str, row_counts: dict) -> dict:
+    # EXPLAIN QUERY PLAN has no row estimates, so scans are charged the table's row count.
+    aliases = table_aliases(sql_query)
+    fallback = max(row_counts.values(), default=0)
+    loops = defaultdict(lambda: 1.0)
+    for _, parent, _, detail in connection.execute(text(f"EXPLAIN QUERY PLAN {sql_query}")).fetchall():
+        match = SQLITE_STEP.match(detail)
+        if not match:
+            continue
+        kind, name, rest = match.groups()
+        table = aliases.get(name.lower(), name).lower()
+        rows = row_counts.get(table, fallback)
+        if kind == "SEARCH":
+            rows = 1 if "PRIMARY KEY" in rest else rows * SQLITE_SEARCH_SELECTIVITY
+        loops[parent] *= max(1.0, rows)
+    return {"rows": sum(loops.values()), "cost": None}
+
+
+# Estimators take (connection, sql_query, row_counts by lower-cased table name) and
+# return {"rows": estimated rows examined, "cost": optimizer cost or None}.
+ESTIMATORS = {
+    "mysql": _estimate_mysql,
+    "sqlite": _estimate_sqlite,
+}
+
+
+def register_estimator(dialect_name: str, estimator):
+    ESTIMATORS[dialect_name] = estimator
+
+
+def _estimate(sql_query: str, row_counts: dict):
+    estimator = ESTIMATORS.get(analytics.analytics_engine.dialect.name)
+    if estimator is None:
+        return None
+    with analytics.analytics_engine.connect() as connection:
+        # Same escaping as execution: the MySQL driver %-formats statements.
+        return estimator(connection, sql_query.replace('%', '%%'), row_counts)
+
+
+def _over_budget(estimate: dict) -> bool:
+    if estimate["rows"] > settings.COST_GUARD_MAX_ROWS:
+        return True
+    return (
+        settings.COST_GUARD_MAX_COST is not None
+        and estimate["cost"] is not None
+        and estimate["cost"] > settings.COST_GUARD_MAX_COST
+    )
+
+
+def replace_table(sql_query: str, table_name: str, replacement: str) -> str:
+    """Swaps every FROM/JOIN reference to ``table_name`` for ``replacement``, keeping aliases."""
+
+    def substitute(match):
+        keyword, table, alias = match.groups()
+        if table.lower() != table_name.lower():
+            return match.group(0)
+        return f"{keyword} {replacement} AS `{alias or table}`"
+
+    return TABLE_REFERENCE.sub(substitute, sql_query)
+
+
+def sample_table_name(table_name: str) -> str:
+    return f"{table_name[:64 - len(SAMPLE_SUFFIX)]}{SAMPLE_SUFFIX}"
+
+
+def _sample_lock(table_name: str) -> threading.Lock:
+    return _sample_locks.setdefault(table_name, threading.Lock())
+
+
+def _build_sample(table_name: str, row_count: int):
+    sample_name = sample_table_name(table_name)
+    try:
+        with _sample_lock(table_name):
+            if inspect(engine).has_table(sample_name):
+                return
+            # Each row is kept or skipped as it is read: no sort of the whole table, and
+            # the scan stops once the LIMIT is reached.
+            fraction = min(1.0, SAMPLE_OVERDRAW * settings.COST_GUARD_SAMPLE_ROWS / max(row_count, 1))
+            if engine.dialect.name == "mysql":
+                keep = f"RAND() < {fraction}"
+            else:
+                keep = f"ABS(RANDOM() % 1000000) < {fraction * 1000000}"
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f"CREATE TABLE `{sample_name}` AS SELECT * FROM `{table_name}` "
+                    f"WHERE {keep} LIMIT {settings.COST_GUARD_SAMPLE_ROWS}"
+                ))
+            logger.info("Created sample table %s for %s", sample_name, table_name)
+    except Exception as e:
+        logger.warning("Could not create sample table %s: %s", sample_name, e)
+    finally:
+        _building.discard(table_name)
+
+
+def sample_table(table_name: str, row_count: int):
+    """The random sample copy of ``table_name``, or None while it is still being built.
+
+    The first call schedules the build in the background.
+    """
+
+    sample_name = sample_table_name(table_name)
+    if inspect(engine).has_table(sample_name):
+        return sample_name
+    if table_name not in _building:
+        _building.add(table_name)
+        _sample_executor.submit(_build_sample, table_name, row_count)
+    return None
+
+
+def drop_sample_table(table_name: str):
+    with _sample_lock(table_name):
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS `{sample_table_name(table_name)}`"))
+
+
+def guard_query(sql_query: str, table_name: str, catalog: dict) -> tuple:
+    """Estimates the cost of ``sql_query`` with EXPLAIN before it is executed.
+
+    Returns the SQL to run and a decision dict for the chat response. Over budget,
+    COST_GUARD_ACTION either rejects the query or rewrites it to read a LIMITed
+    slice or a random sample of the table; until the sample is built, the slice
+    is used instead. Rewrites that are still over budget are rejected.
+    """
+
+    if not settings.COST_GUARD_ENABLED:
+        return sql_query, None
+
+    row_count = catalog["row_count"]
+    try:
+        estimate = _estimate(sql_query, {table_name.lower(): row_count})
+    except Exception as e:
+        # The query itself will most likely fail the same way and report the error.
+        logger.warning("Cost guard could not EXPLAIN query on %s: %s", table_name, e)
+        return sql_query, {"action": "unchecked", "reason": f"EXPLAIN failed: {e}"}
+    if estimate is None:
+        return sql_query, None
+
+    decision = {
+        "action": "allowed",
+        "estimated_rows": int(estimate["rows"]),
+        "estimated_cost": estimate["cost"],
+        "max_rows": settings.COST_GUARD_MAX_ROWS,
+        "max_cost": settings.COST_GUARD_MAX_COST,
+    }
+    if not _over_budget(estimate):
+        return sql_query, decision
+
+    if estimate["rows"] > settings.COST_GUARD_MAX_ROWS:
+        over_budget = f"The query was estimated to examine about {decision['estimated_rows']:,} rows, over the budget of {settings.COST_GUARD_MAX_ROWS:,}."
+    else:
+        over_budget = f"The query's estimated cost of {estimate['cost']:,.0f} is over the budget of {settings.COST_GUARD_MAX_COST:,.0f}."
+    if settings.COST_GUARD_ACTION in ("limit", "sample"):
+        try:
+            sample_name = sample_table(table_name, row_count) if settings.COST_GUARD_ACTION == "sample" else None
+            if sample_name is None:
+                bounded_rows = min(row_count, settings.COST_GUARD_LIMIT_ROWS)
+                rewritten = replace_table(sql_query, table_name, f"(SELECT * FROM `{table_name}` LIMIT {bounded_rows})")
+                row_counts = {table_name.lower(): bounded_rows}
+                action, detail = "limited", f"It was run on the first {bounded_rows:,} rows of the table only."
+                if settings.COST_GUARD_ACTION == "sample":
+                    detail += " A random sample of the table is being prepared for later questions."
+            else:
+                bounded_rows = min(row_count, settings.COST_GUARD_SAMPLE_ROWS)
+                rewritten = replace_table(sql_query, table_name, f"`{sample_name}`")
+                row_counts = {table_name.lower(): bounded_rows, sample_name.lower(): bounded_rows}
+                action, detail = "sampled", f"It was run on a random sample of {bounded_rows:,} rows, so results are approximate."
+
+            if rewritten != sql_query:
+                new_estimate = _estimate(rewritten, row_counts)
+                if not _over_budget(new_estimate):
+                    decision.update({
+                        "action": action,
+                        "original_sql_query": sql_query,
+                        "rewritten_estimated_rows": int(new_estimate["rows"]),
+                        "reason": f"{over_budget} {detail}",
+                    })
+                    return rewritten, decision
+        except Exception as e:
+            logger.warning("Cost guard could not rewrite query on %s: %s", table_name, e)
+
+    decision.update({"action": "rejected", "reason": over_budget})
+    return sql_query, decision
@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import duckdb
+import pyarrow as pa
+
+from app.core.config import settings
+
+DuckDBError = duckdb.Error
+
+ARROW_TYPES = {
+    "text": pa.string(),
+    "bool": pa.bool_(),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "date": pa.date32(),
+    "datetime": pa.timestamp("ns"),
+}
+
+# String literals and comments are matched only to be skipped; group 1 is a backticked identifier.
+SQL_TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|/\*.*?\*/|`((?:[^`]|``)*)`""", re.DOTALL)
+
+_lock = threading.Lock()
+# One database per dataset table; see _open.
+_databases = OrderedDict()
+
+
+def parquet_path(table_name: str) -> str:
+    return os.path.join(settings.DUCKDB_DATA_DIR, f"{table_name}.parquet")
+
+
+def arrow_schema(specs: dict) -> pa.Schema:
+    return pa.schema([(col_name, ARROW_TYPES[spec["kind"]]) for col_name, spec in specs.items()])
+
+
+def _quote_path(path: str) -> str:
+    return "'" + os.path.abspath(path).replace("'", "''") + "'"
+
+
+def _open(table_name: str, extra_paths: tuple = ()):
+    """An in-memory database exposing ``table_name`` as a view over its Parquet file.
+
+    Generated SQL runs here, so the database is locked down once the view exists:
+    it can read the table's own file (and ``extra_paths``) but nothing else on
+    the host, nor write files, nor change its configuration back.
+    """
+
+    config = {}
+    if settings.DUCKDB_THREADS:
+        config["threads"] = settings.DUCKDB_THREADS
+    if settings.DUCKDB_MEMORY_LIMIT:
+        config["memory_limit"] = settings.DUCKDB_MEMORY_LIMIT
+    database = duckdb.connect(database=":memory:", config=config)
+    path = _quote_path(parquet_path(table_name))
+    database.execute(f"CREATE VIEW \"{table_name}\" AS SELECT * FROM read_parquet({path})")
+    allowed = ", ".join([path, *(_quote_path(extra) for extra in extra_paths)])
+    database.execute(f"SET allowed_paths = [{allowed}]")
+    database.execute("SET enable_external_access = false")
+    database.execute("SET lock_configuration = true")
+    return database
+
+
+def cursor(table_name: str):
+    """Returns a new cursor on the database of ``table_name``; each thread must use its own cursor."""
+
+    with _lock:
+        database = _databases.get(table_name)
+        if database is None:
+            database = _databases[table_name] = _open(table_name)
+            # Idle databases beyond the cap are dropped; cursors still open keep theirs alive.
+            while len(_databases) > settings.DUCKDB_MAX_DATABASES:
+                _databases.popitem(last=False)
+        else:
+            _databases.move_to_end(table_name)
+        return database.cursor()
+
+
+def forget_table(table_name: str):
+    # The Parquet file was replaced or removed; the database is reopened on next use.
+    with _lock:
+        _databases.pop(table_name, None)
+
+
+def column_types(table_name: str) -> dict:
+    connection = cursor(table_name)
+    try:
+        return {row[0]: row[1] for row in connection.execute(f"DESCRIBE \"{table_name}\"").fetchall()}
+    finally:
+        connection.close()
+
+
+def appended_rows(table_name: str, appended_path: str, dedup: bool, batch_rows: int):
+    """Yields record batches of the rows in ``appended_path`` to add to the table.
+
+    With ``dedup`` only rows not already in the table are yielded, each once.
+    """
+
+    query = f"SELECT * FROM read_parquet({_quote_path(appended_path)})"
+    if dedup:
+        query += f" EXCEPT SELECT * FROM \"{table_name}\""
+    # Only this query reads the staged file, so it gets a database of its own.
+    database = _open(table_name, (appended_path,))
+    try:
+        yield from database.execute(query).fetch_record_batch(batch_rows)
+    finally:
+        database.close()
+
+
+def _quote_identifier(match) -> str:
+    if match.group(1) is None:
+        return match.group(0)
+    name = match.group(1).replace('``', '`')
+    return '"' + name.replace('"', '""') + '"'
+
+
+def to_duckdb_sql(sql_query: str) -> str:
+    # The LLM sees MySQL-style DDL and tends to quote identifiers with backticks;
+    # backticks inside string literals and comments are left alone.
+    return SQL_TOKEN.sub(_quote_identifier, sql_query)
+
+
+def storage_size_mb(table_name: str):
+    path = parquet_path(table_name)
+    return round(os.path.getsize(path) / (1024 * 1024), 2) if os.path.exists(path) else None
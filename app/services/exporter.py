@@ -0,0 +1,376 @@
+import io
+import itertools
+import re
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db import analytics
+from app.services import cost_guard, duckdb_backend
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+TOKEN = re.compile(r"""
+    (?P<space>\s+|--(?=\s|$)[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>`(?:[^`]|``)*`|"(?:[^"]|"")*")
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+# Stands for the dataset's table in saved queries; see sql_template.
+TABLE_PLACEHOLDER = "{{dataset_table}}"
+# Clauses that end a FROM list at their own nesting level.
+FROM_LIST_ENDS = {
+    "where", "group", "having", "order", "limit", "offset", "fetch", "union", "except", "intersect",
+    "window", "qualify", "select", "into", "for",
+}
+# Words after a table name that are not its alias.
+ALIAS_STOPWORDS = FROM_LIST_ENDS | {"join", "inner", "left", "right", "full", "outer", "cross", "natural", "on", "using", "lateral"}
+# Functions whose arguments use FROM without reading a table, e.g. EXTRACT(YEAR FROM created_at).
+FROM_FUNCTIONS = {"extract", "substring", "substr", "trim", "position", "overlay"}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back in pieces while keeping absolute offsets for the writers."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _tokens(sql_query: str) -> list:
+    """``(kind, value, start, end)`` for every token; quoted identifiers are unquoted and words lowercased."""
+
+    tokens = []
+    for match in TOKEN.finditer(sql_query):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "space":
+            if value.startswith(("/*!", "/*+")):
+                # MySQL runs the contents of /*! ... */ comments.
+                raise HTTPException(status_code=400, detail="Executable comments are not allowed in the query.")
+            continue
+        if kind == "string" and value.endswith("\\'"):
+            # MySQL would read \' as an escaped quote and DuckDB/SQLite as the end of the
+            # string, so the rest of the query would mean different things to each.
+            raise HTTPException(status_code=400, detail="Backslash escapes are not allowed in string literals.")
+        if kind == "quoted":
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        tokens.append((kind, value.lower() if kind in ("word", "quoted") else value, match.start(), match.end()))
+    return tokens
+
+
+def _relations(tokens: list):
+    """Yields ``(token index, reference)`` for each relation read in a FROM, JOIN or TABLE clause.
+
+    References to the query's own CTEs are left out. Plain table names come back
+    lowercased; anything else verbatim, so it fails a check against table names:
+    qualified names (``schema.table``), table functions (``read_text(``) and
+    strings (DuckDB reads a file named by a string in FROM).
+    """
+
+    depth = 0
+    openers = {0: None}
+    ctes = {0: set()}
+    from_depths = set()
+    expect_table = False
+    for index, (kind, value, _, _) in enumerate(tokens):
+        following = tokens[index + 1][1] if index + 1 < len(tokens) else None
+        if value == "(":
+            opener = tokens[index - 1][1] if index and tokens[index - 1][0] == "word" else None
+            depth += 1
+            openers[depth] = opener
+            ctes[depth] = set()
+            if expect_table:
+                # A subquery or a parenthesised list of tables; SELECT ends the latter.
+                from_depths.add(depth)
+            continue
+        if value == ")":
+            from_depths.discard(depth)
+            openers.pop(depth, None)
+            ctes.pop(depth, None)
+            depth = max(depth - 1, 0)
+            expect_table = False
+            continue
+        if kind == "word" and value == "as" and following == "(" and index:
+            # ``name AS (`` or ``name (columns) AS (`` defines a CTE at this level.
+            position = index - 1
+            if tokens[position][1] == ")":
+                while position > 0 and tokens[position][1] != "(":
+                    position -= 1
+                position -= 1
+            if position >= 0 and tokens[position][0] in ("word", "quoted"):
+                ctes[depth].add(tokens[position][1])
+            continue
+        if kind == "word" and value in ("from", "join", "table"):
+            if value == "from" and openers.get(depth) in FROM_FUNCTIONS:
+                continue
+            expect_table = True
+            from_depths.add(depth)
+            continue
+        if kind == "word" and value in FROM_LIST_ENDS:
+            from_depths.discard(depth)
+            expect_table = False
+            continue
+        if value == "," and depth in from_depths:
+            expect_table = True
+            continue
+        if not expect_table or (kind == "word" and value in ("lateral", "only")):
+            continue
+
+        expect_table = False
+        if kind == "string":
+            yield index, value
+        elif kind in ("word", "quoted"):
+            if following == ".":
+                yield index, f"{value}.{tokens[index + 2][1] if index + 2 < len(tokens) else ''}"
+            elif following == "(":
+                yield index, f"{value}("
+            elif not any(value in names for level, names in ctes.items() if level <= depth):
+                yield index, value
+
+
+def table_references(sql_query: str) -> list:
+    """The relations ``sql_query`` reads; see ``_relations``."""
+
+    return [reference for _, reference in _relations(_tokens(sql_query))]
+
+
+def _substitute(sql_query: str, table_names, replacement: str) -> str:
+    # Plain references to ``table_names`` (all plain references when None) become ``replacement``.
+    tokens = _tokens(sql_query)
+    pieces = []
+    position = 0
+    for index, reference in _relations(tokens):
+        kind, _, start, end = tokens[index]
+        plain = kind in ("word", "quoted") and reference == tokens[index][1]
+        if plain and (table_names is None or reference in table_names):
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+            aliased = following is not None and following[0] in ("word", "quoted") and following[1] not in ALIAS_STOPWORDS
+            # Columns qualified with the table's name keep resolving through an alias.
+            pieces += [sql_query[position:start], replacement if aliased else f"{replacement} AS `{tokens[index][1]}`"]
+            position = end
+    return "".join(pieces) + sql_query[position:]
+
+
+def sql_template(sql_query: str, table_name: str) -> str:
+    """``sql_query`` with the dataset's table, or the cost guard's sample of it, as TABLE_PLACEHOLDER.
+
+    Saved queries are stored this way: the table is renamed when the dataset's data
+    is replaced and the sample is dropped when rows are appended.
+    """
+
+    return _substitute(sql_query, {table_name.lower(), cost_guard.sample_table_name(table_name).lower()}, TABLE_PLACEHOLDER)
+
+
+def render_template(template: str, table_name: str) -> str:
+    return template.replace(TABLE_PLACEHOLDER, f"`{table_name}`")
+
+
+def retarget(sql_query: str, table_name: str) -> str:
+    """Points every plain table reference of a query stored with a chat turn at the dataset's current table.
+
+    A stored query read the dataset's table, or its sample, as it was named at
+    the time; both may be gone since. Only for queries the application generated.
+    """
+
+    return render_template(_substitute(sql_query, None, TABLE_PLACEHOLDER), table_name)
+
+
+def validate_sql(sql_query: str, table_name: str) -> str:
+    """Only single SELECT statements reading nothing but the dataset's own table are accepted."""
+
+    normalized = sql_query.strip().rstrip(";")
+    upper = normalized.upper()
+    if not (upper.startswith("SELECT") or upper.startswith("WITH")) or any(token[1] == ";" for token in _tokens(normalized)):
+        raise HTTPException(status_code=400, detail="Only a single SELECT query can be exported.")
+
+    # A stored chat turn may have been rewritten to read the cost guard's sample of the table.
+    allowed = {table_name.lower(), cost_guard.sample_table_name(table_name).lower()}
+    if any(reference not in allowed for reference in table_references(normalized)):
+        raise HTTPException(status_code=400, detail="The query may only read the dataset's table.")
+    return normalized
+
+
+# MySQL column type codes (pymysql.constants.FIELD_TYPE) and their Arrow types.
+MYSQL_ARROW_TYPES = {
+    1: pa.int64(), 2: pa.int64(), 3: pa.int64(), 8: pa.int64(), 9: pa.int64(), 13: pa.int64(),
+    4: pa.float64(), 5: pa.float64(),
+    10: pa.date32(), 14: pa.date32(),
+    7: pa.timestamp("us"), 12: pa.timestamp("us"),
+}
+MYSQL_DECIMAL_TYPES = {0, 246}
+
+
+def _described_type(description: tuple):
+    """The Arrow type of a MySQL result column, or None when the driver reports none (SQLite)."""
+
+    type_code = description[1]
+    if type_code is None:
+        return None
+    if type_code in MYSQL_DECIMAL_TYPES:
+        precision, scale = description[4], description[5] or 0
+        return pa.decimal128(38, scale) if precision is not None and precision <= 38 else pa.string()
+    return MYSQL_ARROW_TYPES.get(type_code, pa.string())
+
+
+def _arrow_type(values: list):
+    inferred = pa.array([value for value in values if value is not None]).type
+    if pa.types.is_null(inferred):
+        return None
+    if pa.types.is_decimal(inferred):
+        # Precision is inferred from the values seen; widen it so later batches fit the same schema.
+        return pa.decimal128(38, inferred.scale)
+    return inferred
+
+
+def _record_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pa.types.is_string(field.type):
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _result_schema(result, columns: list) -> tuple:
+    """The Arrow schema of ``result`` and the rows fetched to work it out.
+
+    Types come from the cursor description. Drivers that report none (SQLite has
+    no column types) have them inferred from the first non-NULL values, reading
+    ahead up to EXPORT_TYPE_SCAN_ROWS rows; columns still all NULL by then are text.
+    """
+
+    types = [_described_type(description) for description in result.cursor.description]
+    pending = []
+    scanned = 0
+    while any(arrow_type is None for arrow_type in types) and scanned < settings.EXPORT_TYPE_SCAN_ROWS:
+        rows = result.fetchmany(settings.EXPORT_BATCH_ROWS)
+        if not rows:
+            break
+        pending.append(rows)
+        scanned += len(rows)
+        types = [arrow_type or _arrow_type([row[index] for row in rows]) for index, arrow_type in enumerate(types)]
+    schema = pa.schema([pa.field(name, arrow_type or pa.string()) for name, arrow_type in zip(columns, types)])
+    return schema, pending
+
+
+def _sql_batches(sql_query: str):
+    handle = analytics.QueryHandle()
+    finished = False
+    started = time.perf_counter()
+    with analytics.analytics_engine.connect() as connection:
+        analytics.record_checkout(started)
+        is_mysql = connection.dialect.name == "mysql"
+        if is_mysql:
+            # Exports legitimately run longer than interactive queries.
+            connection.execute(text(f"SET SESSION max_execution_time = {int(settings.EXPORT_QUERY_TIMEOUT_SECONDS * 1000)}"))
+        handle.bind(analytics.canceller(connection.info, connection.connection.dbapi_connection))
+        try:
+            result = connection.execution_options(stream_results=True).execute(text(sql_query.replace('%', '%%')))
+            schema, pending = _result_schema(result, list(result.keys()))
+            # The first batch, empty or not, carries the schema to the writer.
+            yield _record_batch(pending.pop(0) if pending else [], schema)
+            for rows in pending:
+                yield _record_batch(rows, schema)
+            while True:
+                rows = result.fetchmany(settings.EXPORT_BATCH_ROWS)
+                if not rows:
+                    break
+                yield _record_batch(rows, schema)
+            result.close()
+            finished = True
+        finally:
+            if not finished:
+                # The client went away: stop the server from producing rows nobody will read and
+                # drop the connection rather than draining its server-side cursor.
+                handle.cancel("cancelled")
+                connection.invalidate()
+            elif is_mysql:
+                connection.execute(text(f"SET SESSION max_execution_time = {int(settings.ANALYTICS_QUERY_TIMEOUT_SECONDS * 1000)}"))
+
+
+def _duckdb_batches(table_name: str, sql_query: str):
+    cursor = duckdb_backend.cursor(table_name)
+    finished = False
+    try:
+        reader = cursor.execute(duckdb_backend.to_duckdb_sql(sql_query)).fetch_record_batch(settings.EXPORT_BATCH_ROWS)
+        empty = True
+        for batch in reader:
+            empty = False
+            yield batch
+        if empty:
+            yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+        finished = True
+    finally:
+        if not finished:
+            cursor.interrupt()
+        cursor.close()
+
+
+def _open_writer(export_format: str, sink, schema: pa.Schema):
+    if export_format == "csv":
+        return pa_csv.CSVWriter(sink, schema)
+    if export_format == "parquet":
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    return pa.ipc.new_stream(sink, schema)
+
+
+def _encoded(batches, first: pa.RecordBatch, export_format: str):
+    sink = _ChunkSink()
+    writer = _open_writer(export_format, sink, first.schema)
+    try:
+        for batch in itertools.chain([first], batches):
+            if batch.num_rows:
+                writer.write_batch(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        writer.close()
+        writer = None
+        yield sink.drain()
+    finally:
+        batches.close()
+
+
+def stream_export(sql_query: str, table_name: str, backend: str, export_format: str):
+    """Runs ``sql_query`` and returns a generator of its encoded result, batch by batch.
+
+    Rows come from a server-side cursor EXPORT_BATCH_ROWS at a time and each batch
+    is encoded and handed to the response before the next one is fetched, so memory
+    stays flat regardless of the result size. The first batch is fetched before
+    returning, so a failing query raises here instead of cutting a response short.
+    """
+
+    batches = _duckdb_batches(table_name, sql_query) if backend == "duckdb" else _sql_batches(sql_query)
+    try:
+        first = next(batches)
+    except BaseException:
+        batches.close()
+        raise
+    return _encoded(batches, first, export_format)
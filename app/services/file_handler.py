@@ -1,8 +1,37 @@
+import numpy as np
 import pandas as pd
+import contextlib
+import json
+import logging
+import os
 import re
+import resource
+import tempfile
+import time
+import uuid
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 from fastapi import UploadFile, HTTPException
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import text, table, column
+from app.core.config import settings
+from app.core import observability
+from app.services import duckdb_backend, profiler as profiler_service, row_hashes, schema_catalog, type_inference
+
+logger = logging.getLogger(__name__)
+
+class IngestCancelled(Exception):
+    pass
+
+STREAMING_EXTENSIONS = ('.csv', '.tsv', '.jsonl', '.ndjson')
+ARROW_EXTENSIONS = ('.parquet', '.feather')
+SUPPORTED_EXTENSIONS = STREAMING_EXTENSIONS + ('.xls', '.xlsx', '.json') + ARROW_EXTENSIONS
+STORAGE_BACKENDS = ('sql', 'duckdb')
+STAGING_SUFFIX = "_staging"
+STAGE_HASH_COLUMN = "__row_hash"
 
 def clean_column_name(col_name: str) -> str:
     col_name = str(col_name)
@@ -10,88 +39,879 @@ def clean_column_name(col_name: str) -> str:
     col_name = re.sub(r'\s+', '_', col_name.strip())
     return col_name.lower()
 
-async def process_and_store_file(file: UploadFile, db: Session) -> str:
+def _clean_column_names(columns) -> list:
+
+    def clean_column_name(col_name: str, idx: int) -> str:
+        col_name = str(col_name).strip()
+        col_name = re.sub(r'[^\w\s]', '', col_name)
+        col_name = re.sub(r'\s+', '_', col_name)
+        col_name = col_name.lower()
+        if not col_name:
+            col_name = f"column_{idx+1}"
+        return col_name
+
+    return [clean_column_name(col, idx) for idx, col in enumerate(columns)]
+
+def _unsupported_format() -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=(
+            "Unsupported file format. Please upload a CSV, TSV, JSON Lines, Excel, "
+            "JSON, Parquet, or Feather file."
+        )
+    )
+
+def check_supported(filename: str):
+    if not filename or not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise _unsupported_format()
+
+def new_table_name(filename: str) -> str:
+    # The random suffix keeps names unique when the same file is uploaded twice within a second.
+    base_filename = re.sub(r'\W+', '_', filename.split('.')[0])[:32]
+    return f"data_{base_filename}_{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
 
-    filename = file.filename
-    file_content = file.file
+def discard_table(table_name: str, backend: str, db: Session):
+    """Removes whatever a failed or cancelled ingest left behind."""
+    if backend == "duckdb":
+        path = duckdb_backend.parquet_path(table_name)
+        for leftover in (path, f"{path}.partial"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        duckdb_backend.forget_table(table_name)
+    else:
+        db.execute(text(f"DROP TABLE IF EXISTS `{table_name}`"))
+        db.commit()
 
+def staging_table_name(table_name: str) -> str:
+    return f"{table_name[:64 - len(STAGING_SUFFIX)]}{STAGING_SUFFIX}"
+
+def _read_frame(file_content, filename: str) -> pd.DataFrame:
+
+    if filename.endswith('.csv'):
+        return pd.read_csv(file_content, on_bad_lines='skip', dtype=str)
+    elif filename.endswith('.tsv'):
+        return pd.read_csv(file_content, sep='\t', on_bad_lines='skip', dtype=str)
+    elif filename.endswith(('.jsonl', '.ndjson')):
+        return pd.read_json(file_content, lines=True, dtype=str)
+    elif filename.endswith(('.xls', '.xlsx')):
+        return pd.read_excel(file_content, dtype=str)
+    elif filename.endswith('.json'):
+        return pd.read_json(file_content, dtype=str)
+    elif filename.endswith('.parquet'):
+
+        return pd.read_parquet(file_content)
+    elif filename.endswith('.feather'):
+        return pd.read_feather(file_content)
+    raise _unsupported_format()
+
+def _csv_chunks(file_content, sep: str, chunk_rows: int):
     try:
+        reader = pd.read_csv(file_content, sep=sep, on_bad_lines='skip', dtype=str, chunksize=chunk_rows)
+    except pd.errors.EmptyDataError:
+        return
+    empty = True
+    for chunk in reader:
+        empty = False
+        yield chunk
+    if empty:
+        # A header without rows still loads, as an empty table with the header's columns.
+        file_content.seek(0)
+        yield pd.read_csv(file_content, sep=sep, dtype=str, nrows=0)
 
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file_content, on_bad_lines='skip', dtype=str)
-        elif filename.endswith('.tsv'):
-            df = pd.read_csv(file_content, sep='\t', on_bad_lines='skip', dtype=str)
-        elif filename.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(file_content, dtype=str)
-        elif filename.endswith('.json'):
-            df = pd.read_json(file_content, dtype=str)
-        elif filename.endswith('.parquet'):
-
-            df = pd.read_parquet(file_content)
-        elif filename.endswith('.feather'):
-            df = pd.read_feather(file_content)
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=(
-                    "Unsupported file format. Please upload a CSV, TSV, Excel, "
-                    "JSON, Parquet, or Feather file."
-                )
-            )
+def _read_chunks(file_content, filename: str, chunk_rows: int):
 
-        def clean_column_name(col_name: str, idx: int) -> str:
-            col_name = str(col_name).strip()
-            col_name = re.sub(r'[^\w\s]', '', col_name)
-            col_name = re.sub(r'\s+', '_', col_name)
-            col_name = col_name.lower()
-            if not col_name:  
-                col_name = f"column_{idx+1}"
-            return col_name
+    if filename.endswith('.csv'):
+        return _csv_chunks(file_content, ',', chunk_rows)
+    elif filename.endswith('.tsv'):
+        return _csv_chunks(file_content, '\t', chunk_rows)
+    elif filename.endswith(('.jsonl', '.ndjson')):
+        return pd.read_json(file_content, lines=True, dtype=str, chunksize=chunk_rows)
+    raise _unsupported_format()
 
-        df.columns = [clean_column_name(col, idx) for idx, col in enumerate(df.columns)]
+def _arrow_batches(file_content, filename: str, monitor=None):
+    """Yields record batches of a Parquet or Feather file without reading the whole file.
 
+    Parquet is read one row group at a time. Feather files on disk are memory
+    mapped, so uncompressed columns are used in place rather than copied. The
+    row count recorded in the file is passed to ``monitor`` before the first batch.
+    """
 
+    if filename.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(file_content)
+        if monitor is not None:
+            monitor.expect(parquet_file.metadata.num_rows)
+        yield from parquet_file.iter_batches(batch_size=settings.INGEST_CHUNK_ROWS)
+        return
+
+    path = getattr(file_content, "name", None)
+    mapped = isinstance(path, str) and os.path.exists(path)
+    with contextlib.ExitStack() as stack:
+        # The map is closed once the file is read; an upload's own file object is left to its owner.
+        source = stack.enter_context(pa.memory_map(path)) if mapped else pa.PythonFile(file_content, mode="r")
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            if monitor is not None and mapped:
+                # Mapped batches are read in place, so counting their rows reads no data.
+                monitor.expect(sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches)))
+        except pa.ArrowInvalid:
+            # Feather v1 predates the Arrow IPC file format and can only be read whole.
+            source.seek(0)
+            batches = feather.read_table(source).to_batches()
+            if monitor is not None:
+                monitor.expect(sum(batch.num_rows for batch in batches))
+        for batch in batches:
+            # Slices are zero-copy views; they keep chunks the size the other ingest paths use.
+            for offset in range(0, batch.num_rows, settings.INGEST_CHUNK_ROWS):
+                yield batch.slice(offset, settings.INGEST_CHUNK_ROWS)
 
+def _arrow_frame(batch: pa.RecordBatch) -> pd.DataFrame:
+    # Dictionary columns would become pandas categoricals and decimals Python
+    # Decimal objects; neither goes through inference, coercion or profiling.
+    arrays = []
+    for array in batch.columns:
+        if pa.types.is_dictionary(array.type):
+            array = array.dictionary_decode()
+        if pa.types.is_decimal(array.type):
+            array = array.cast(pa.float64())
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names).to_pandas()
 
-        base_filename = re.sub(r'\W+', '_', filename.split('.')[0])
-        table_name = f"data_{base_filename}_{pd.Timestamp.now().strftime('%Y%m%d%H%M%S')}"
+def _read_upload(file_content, filename: str, monitor=None):
+    if filename.endswith(STREAMING_EXTENSIONS):
+        return _read_chunks(file_content, filename, settings.INGEST_CHUNK_ROWS)
+    if filename.endswith(ARROW_EXTENSIONS) and settings.INGEST_MODE == "streaming":
+        return (_arrow_frame(batch) for batch in _arrow_batches(file_content, filename, monitor))
+    frame = _read_frame(file_content, filename)
+    if monitor is not None:
+        monitor.expect(len(frame))
+    return [frame]
 
+def _create_table(db: Session, table_name: str, specs: dict):
+
+    column_definitions = [f"`{col_name}` {spec['sql_type']}" for col_name, spec in specs.items()]
+    create_table_sql = f"CREATE TABLE `{table_name}` (\n" + ",\n".join(column_definitions) + "\n);"
+
+    db.execute(text(create_table_sql))
+    db.commit()
+
+def _with_columns(chunk: pd.DataFrame, columns: list) -> pd.DataFrame:
+    # A JSON line may leave keys out; their values are NULL. Object columns of
+    # None coerce to every kind, where the float NaN columns of reindex would not.
+    missing = [col for col in columns if col not in chunk.columns]
+    if missing:
+        chunk = chunk.assign(**{col: pd.Series(None, index=chunk.index, dtype=object) for col in missing})
+    return chunk[columns]
+
+def _fixed_columns(chunk: pd.DataFrame, columns: list) -> pd.DataFrame:
+    # For tables whose columns can no longer change: keys seen only in later rows fail the upload.
+    unexpected = [col for col in chunk.columns if col not in columns]
+    if unexpected:
+        raise HTTPException(status_code=400, detail=f"Later rows of the file have keys that are not columns of the table: {', '.join(unexpected)}.")
+    return _with_columns(chunk, columns)
+
+def _add_columns(connection, table_name: str, specs: dict, added: dict):
+    for col_name, spec in added.items():
+        connection.execute(text(f"ALTER TABLE `{table_name}` ADD COLUMN `{col_name}` {spec['sql_type']}"))
+        specs[col_name] = spec
+
+def _modify_columns(connection, table_name: str, specs: dict, changed: dict):
+    for col_name, spec in changed.items():
+        if connection.dialect.name == "mysql":
+            connection.execute(text(f"ALTER TABLE `{table_name}` MODIFY `{col_name}` {spec['sql_type']}"))
+        specs[col_name] = spec
+
+def _widen_text_columns(connection, table_name: str, specs: dict, df: pd.DataFrame):
+    # Later chunks may hold longer strings than the sampled rows; grow the VARCHAR before inserting.
+    changed = {}
+    for col_name, spec in specs.items():
+        wider = type_inference.widened_spec(spec, df[col_name])
+        if wider is not None:
+            changed[col_name] = wider
+    _modify_columns(connection, table_name, specs, changed)
+
+def _unfitting_values(widened: dict, specs: dict) -> HTTPException:
+    columns = ", ".join(f"{col_name} ({specs[col_name]['sql_type']})" for col_name in widened)
+    return HTTPException(status_code=400, detail=f"The file has values that do not fit these columns: {columns}.")
+
+def _coerce_fixed(chunk: pd.DataFrame, specs: dict) -> pd.DataFrame:
+    # For columns whose type can no longer change: values that do not fit fail the upload.
+    chunk, widened = type_inference.coerce_frame(chunk, specs)
+    if widened:
+        raise _unfitting_values(widened, specs)
+    return chunk
+
+def _insert_rows(connection, table_name: str, df: pd.DataFrame):
+    # executemany with a list of dicts lets SQLAlchemy batch the rows into
+    # multi-row INSERT ... VALUES statements ("insertmanyvalues").
+    target = table(table_name, *[column(col) for col in df.columns])
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    if records:
+        connection.execute(target.insert(), records)
+
+def _insert_batch(connection, table_name: str, batch: pa.RecordBatch):
+    # to_pylist builds the row dicts straight from the Arrow buffers, one batch at a time.
+    target = table(table_name, *[column(col) for col in batch.schema.names])
+    records = batch.to_pylist()
+    if records:
+        connection.execute(target.insert(), records)
+
+def _load_data_batch(connection, table_name: str, batch: pa.RecordBatch):
+    _load_data_infile(connection, table_name, batch.to_pandas())
+
+def _escape_load_data(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series):
+        series = series.astype("Int64")
+    escaped = (
+        series.astype(str)
+        .str.replace('\\', '\\\\', regex=False)
+        .str.replace('\t', '\\t', regex=False)
+        .str.replace('\n', '\\n', regex=False)
+        .str.replace('\r', '\\r', regex=False)
+    )
+    return escaped.where(series.notna(), '\\N')
+
+def _load_data_infile(connection, table_name: str, df: pd.DataFrame):
+    # Uses MySQL's default LOAD DATA format: tab separated, backslash escaped, \N for NULL.
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, encoding='utf-8') as tmp:
+        escaped = df.apply(_escape_load_data)
+        tmp.writelines("\t".join(row) + "\n" for row in escaped.itertuples(index=False, name=None))
+        path = tmp.name
+    try:
+        columns = ", ".join(f"`{col}`" for col in df.columns)
+        connection.exec_driver_sql(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE `{table_name}` "
+            f"CHARACTER SET utf8mb4 ({columns})"
+        )
+    finally:
+        os.remove(path)
 
-        create_table_sql = f"CREATE TABLE `{table_name}` (\n"
-        column_definitions = []
-        for col_name, dtype in df.dtypes.items():
-            if 'object' in str(dtype):
-                sql_type = 'MEDIUMTEXT'
-            elif 'int' in str(dtype):
-                sql_type = 'BIGINT'
-            elif 'float' in str(dtype):
-                sql_type = 'DOUBLE'
-            else:
-                sql_type = 'MEDIUMTEXT' 
-            column_definitions.append(f"`{col_name}` {sql_type}")
-        
-        create_table_sql += ",\n".join(column_definitions)
-        create_table_sql += "\n);"
-        
+def _rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        # ru_maxrss is in kilobytes on Linux; it is a lifetime high-water mark, not current usage.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class IngestMonitor:
+
+    def __init__(self, mode: str, progress=None):
+        self.mode = mode
+        self.progress = progress
+        self.rows = 0
+        # Rows the file holds, where its metadata or the parse step tells; None for
+        # text formats read in chunks, whose progress is the share of bytes read.
+        self.total_rows = None
+        self.started_at = time.perf_counter()
+        self.start_rss_mb = _rss_mb()
+        self.peak_rss_mb = self.start_rss_mb
+        self.stage_seconds = {}
+
+    def expect(self, total_rows: int):
+        self.total_rows = total_rows
+
+    def observe(self, rows: int):
+        self.rows += rows
+        self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb())
+        if self.progress is not None:
+            self.progress(self.rows, self.total_rows)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        # Chunked ingest interleaves stages, so time is summed per stage across chunks.
+        started = time.perf_counter()
         try:
-            db.execute(text(create_table_sql))
-            db.commit()
+            yield
+        finally:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def parsed(self, chunks):
+        """Iterates ``chunks``, counting the time spent reading each one as parsing."""
+        iterator = iter(chunks)
+        while True:
+            with self.stage("parse"):
+                chunk = next(iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def stats(self) -> dict:
+        seconds = time.perf_counter() - self.started_at
+        return {
+            "mode": self.mode,
+            "rows": self.rows,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(self.rows / seconds, 1) if seconds > 0 else 0.0,
+            "start_rss_mb": round(self.start_rss_mb, 1),
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            "stages": {name: round(value, 3) for name, value in self.stage_seconds.items()},
+        }
+
+def _report_ingest(stats: dict, table_name: str):
+    # Per-stage timings plus one "ingest" span carrying the overall throughput.
+    for name, seconds in stats["stages"].items():
+        observability.observe_stage("upload", name, seconds, mode=stats["mode"], rows=stats["rows"] if name == "insert" else None)
+    observability.observe_stage(
+        "upload", "ingest", stats["seconds"], table=table_name, mode=stats["mode"], rows=stats["rows"],
+        rows_per_sec=stats["rows_per_sec"], peak_rss_mb=stats["peak_rss_mb"]
+    )
+
+def _use_streaming(filename: str) -> bool:
+    return settings.INGEST_MODE == "streaming" and filename.endswith(STREAMING_EXTENSIONS)
+
+def _use_arrow(filename: str) -> bool:
+    return settings.INGEST_MODE == "streaming" and filename.endswith(ARROW_EXTENSIONS)
+
+def _use_load_data(db: Session) -> bool:
+    return settings.INGEST_USE_LOAD_DATA and db.get_bind().dialect.name == "mysql"
+
+def _column_types(specs: dict) -> dict:
+    return {col_name: spec["sql_type"] for col_name, spec in specs.items()}
+
+def ingest_buffered(file_content, filename: str, table_name: str, db: Session, profiler=None, progress=None) -> tuple:
+
+    monitor = IngestMonitor("buffered", progress)
+    with monitor.stage("parse"):
+        df = _read_frame(file_content, filename)
+        monitor.expect(len(df))
+        df.columns = _clean_column_names(df.columns)
+        specs = type_inference.infer_column_types(df)
+        df, widened = type_inference.coerce_frame(df, specs)
+        specs.update(widened)
+        for col_name, spec in list(specs.items()):
+            wider = type_inference.widened_spec(spec, df[col_name])
+            if wider is not None:
+                specs[col_name] = wider
+    if profiler is not None:
+        with monitor.stage("profile"):
+            profiler.observe(df, specs)
+    monitor.observe(0)
 
+    with monitor.stage("ddl"):
+        _create_table(db, table_name, specs)
+    try:
+        with monitor.stage("insert"):
             df.to_sql(
                 table_name,
                 con=db.get_bind(),
-                if_exists='append', 
+                if_exists='append',
                 index=False,
-                chunksize=1000 
+                chunksize=1000
             )
-        except Exception as e:
-            db.rollback()
-            raise e
-            
-       
+    except Exception:
+        db.rollback()
+        discard_table(table_name, "sql", db)
+        raise
+    monitor.observe(len(df))
+
+    catalog = schema_catalog.build_catalog(
+        df.head(settings.TYPE_INFERENCE_SAMPLE_ROWS), _column_types(specs), row_count=len(df)
+    )
+    return catalog, monitor.stats()
+
+def ingest_streaming(file_content, filename: str, table_name: str, db: Session, profiler=None, progress=None) -> tuple:
+
+    monitor = IngestMonitor("load_data" if _use_load_data(db) else "streaming", progress)
+    write_chunk = _load_data_infile if _use_load_data(db) else _insert_rows
+    bind = db.get_bind()
+
+    specs = None
+    first_chunk = None
+    try:
+        for chunk in monitor.parsed(_read_chunks(file_content, filename, settings.INGEST_CHUNK_ROWS)):
+            with monitor.stage("parse"):
+                chunk.columns = _clean_column_names(chunk.columns)
+                first = specs is None
+                if first:
+                    specs = type_inference.infer_column_types(chunk)
+                # JSON lines can bring keys the earlier chunks did not have; they become new columns.
+                new_specs = type_inference.infer_column_types(chunk[[col for col in chunk.columns if col not in specs]])
+                chunk = _with_columns(chunk, [*specs, *new_specs])
+                chunk, widened = type_inference.coerce_frame(chunk, {**specs, **new_specs})
+                added = {col: widened.pop(col, spec) for col, spec in new_specs.items()}
+            if first:
+                specs.update(widened)
+                widened = {}
+                with monitor.stage("ddl"):
+                    _create_table(db, table_name, specs)
+            if first_chunk is None:
+                first_chunk = chunk.head(settings.TYPE_INFERENCE_SAMPLE_ROWS)
+            with monitor.stage("insert"), bind.begin() as connection:
+                _add_columns(connection, table_name, specs, added)
+                # Values past the sampled rows that do not fit the column's type widen it.
+                _modify_columns(connection, table_name, specs, widened)
+                _widen_text_columns(connection, table_name, specs, chunk)
+                write_chunk(connection, table_name, chunk)
+            if profiler is not None:
+                with monitor.stage("profile"):
+                    profiler.observe(chunk, specs)
+            monitor.observe(len(chunk))
+    except Exception:
+        db.rollback()
+        if specs is not None:
+            with bind.begin() as connection:
+                connection.execute(text(f"DROP TABLE IF EXISTS `{table_name}`"))
+        raise
+
+    if specs is None:
+        raise HTTPException(status_code=400, detail="The uploaded file contains no rows.")
+
+    catalog = schema_catalog.build_catalog(_with_columns(first_chunk, list(specs)), _column_types(specs), row_count=monitor.rows)
+    return catalog, monitor.stats()
+
+def _arrow_specs(batch: pa.RecordBatch, names: list) -> dict:
+    if not settings.INGEST_INFER_TYPES:
+        return {name: type_inference.untyped_spec() for name in names}
+
+    specs = {}
+    for name, array in zip(names, batch.columns):
+        spec = type_inference.arrow_spec(array.type)
+        value_type = array.type.value_type if pa.types.is_dictionary(array.type) else array.type
+        if pa.types.is_string(value_type) or pa.types.is_large_string(value_type):
+            # Strings get a VARCHAR sized from the first batch, widened later if needed.
+            max_length = pc.max(pc.utf8_length(array.dictionary_decode() if pa.types.is_dictionary(array.type) else array)).as_py()
+            spec = type_inference.text_spec(max_length)
+        specs[name] = spec
+    return specs
+
+def _arrow_text(array: pa.Array) -> pa.Array:
+    try:
+        return array.cast(pa.string())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # Binary and nested values have no string cast; they are stored as JSON text.
+        return pa.array([None if value is None else json.dumps(value, default=str) for value in array.to_pylist()], pa.string())
+
+# uint64 values past BIGINT's range still fit a DECIMAL exactly.
+UINT64_SPEC = {"sql_type": "DECIMAL(20,0)", "kind": "float", "decimal": True}
+
+def _overflowing_columns(batch: pa.RecordBatch, names: list, specs: dict) -> dict:
+    widened = {}
+    for name, array in zip(names, batch.columns):
+        if specs[name]["kind"] == "int" and not specs[name].get("decimal") and pa.types.is_uint64(array.type):
+            maximum = pc.max(array).as_py()
+            if maximum is not None and maximum > type_inference.BIGINT_MAX:
+                widened[name] = UINT64_SPEC
+    return widened
+
+ARROW_TARGETS = {
+    "bool": pa.bool_(),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "date": pa.date32(),
+}
 
-        return table_name
+def _normalize_batch(batch: pa.RecordBatch, names: list, specs: dict) -> pa.RecordBatch:
+    """Casts each column to the Arrow type matching its SQL column."""
 
+    arrays = []
+    for name, array in zip(names, batch.columns):
+        spec = specs[name]
+        if pa.types.is_dictionary(array.type):
+            array = array.dictionary_decode()
+        if spec["kind"] == "text":
+            array = _arrow_text(array)
+        elif spec["kind"] == "datetime":
+            # Time zone aware timestamps are stored as naive UTC, as in coerce_frame.
+            array = array.cast(pa.timestamp("us"), safe=False)
+        elif not spec.get("decimal"):
+            array = array.cast(ARROW_TARGETS[spec["kind"]])
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+def _widen_arrow_text(connection, table_name: str, specs: dict, batch: pa.RecordBatch):
+    for col_name, spec in list(specs.items()):
+        if spec["kind"] != "text" or "width" not in spec:
+            continue
+        max_length = pc.max(pc.utf8_length(batch.column(col_name))).as_py()
+        if max_length is None or max_length <= spec["width"]:
+            continue
+        wider = type_inference.text_spec(max_length)
+        if connection.dialect.name == "mysql":
+            connection.execute(text(f"ALTER TABLE `{table_name}` MODIFY `{col_name}` {wider['sql_type']}"))
+        specs[col_name] = wider
+
+def ingest_arrow(file_content, filename: str, table_name: str, db: Session, profiler=None, progress=None) -> tuple:
+    """Loads a Parquet or Feather file batch by batch with native column types.
+
+    Arrow types map straight to SQL types, so no values are parsed or inferred,
+    and record batches go to the database without a DataFrame in between;
+    only the profiler sees each batch as pandas.
+    """
+
+    monitor = IngestMonitor("load_data_arrow" if _use_load_data(db) else "arrow", progress)
+    write_batch = _load_data_batch if _use_load_data(db) else _insert_batch
+    bind = db.get_bind()
+
+    specs = None
+    names = None
+    first_chunk = None
+    try:
+        for batch in monitor.parsed(_arrow_batches(file_content, filename, monitor)):
+            with monitor.stage("parse"):
+                first = specs is None
+                if first:
+                    names = _clean_column_names(batch.schema.names)
+                    specs = _arrow_specs(batch, names)
+                widened = _overflowing_columns(batch, names, specs)
+                batch = _normalize_batch(batch, names, {**specs, **widened})
+            if first:
+                specs.update(widened)
+                widened = {}
+                with monitor.stage("ddl"):
+                    _create_table(db, table_name, specs)
+            with monitor.stage("insert"), bind.begin() as connection:
+                _modify_columns(connection, table_name, specs, widened)
+                _widen_arrow_text(connection, table_name, specs, batch)
+                write_batch(connection, table_name, batch)
+            if profiler is not None or first_chunk is None:
+                with monitor.stage("profile"):
+                    frame = _arrow_frame(batch)
+                    if first_chunk is None:
+                        first_chunk = frame.head(settings.TYPE_INFERENCE_SAMPLE_ROWS)
+                    if profiler is not None:
+                        profiler.observe(frame, specs)
+            monitor.observe(batch.num_rows)
+    except Exception:
+        db.rollback()
+        if specs is not None:
+            with bind.begin() as connection:
+                connection.execute(text(f"DROP TABLE IF EXISTS `{table_name}`"))
+        raise
+
+    if specs is None:
+        raise HTTPException(status_code=400, detail="The uploaded file contains no rows.")
+
+    catalog = schema_catalog.build_catalog(first_chunk, _column_types(specs), row_count=monitor.rows)
+    return catalog, monitor.stats()
+
+def _rewritten_writer(path: str, schema: pa.Schema) -> pq.ParquetWriter:
+    """Rewrites the Parquet file at ``path`` to ``schema`` and returns a writer that continues it.
+
+    Columns are cast to their widened types and columns added since come in as NULL.
+    """
+
+    previous = f"{path}.previous"
+    os.replace(path, previous)
+    writer = pq.ParquetWriter(path, schema, compression="zstd")
+    try:
+        with open(previous, "rb") as source:
+            for batch in pq.ParquetFile(source).iter_batches(batch_size=settings.INGEST_CHUNK_ROWS):
+                arrays = [
+                    batch.column(field.name).cast(field.type) if field.name in batch.schema.names else pa.nulls(batch.num_rows, field.type)
+                    for field in schema
+                ]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    except Exception:
+        writer.close()
+        raise
+    finally:
+        os.remove(previous)
+    return writer
+
+def ingest_columnar(file_content, filename: str, table_name: str, profiler=None, progress=None) -> tuple:
+    """Writes the upload to a Parquet file queried through DuckDB instead of a database table."""
+
+    monitor = IngestMonitor("parquet", progress)
+    path = duckdb_backend.parquet_path(table_name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial_path = f"{path}.partial"
+
+    chunks = _read_upload(file_content, filename, monitor)
+
+    specs = None
+    schema = None
+    writer = None
+    first_chunk = None
+    try:
+        for chunk in monitor.parsed(chunks):
+            with monitor.stage("parse"):
+                chunk.columns = _clean_column_names(chunk.columns)
+                if specs is None:
+                    specs = type_inference.infer_column_types(chunk)
+                    chunk, widened = type_inference.coerce_frame(chunk, specs)
+                    specs.update(widened)
+                    schema = duckdb_backend.arrow_schema(specs)
+                    writer = pq.ParquetWriter(partial_path, schema, compression="zstd")
+                else:
+                    # Same rules as ingest_streaming: late JSON keys become columns and values
+                    # that do not fit widen theirs.
+                    new_specs = type_inference.infer_column_types(chunk[[col for col in chunk.columns if col not in specs]])
+                    chunk = _with_columns(chunk, [*specs, *new_specs])
+                    chunk, widened = type_inference.coerce_frame(chunk, {**specs, **new_specs})
+                    widened.update({col: widened.get(col, spec) for col, spec in new_specs.items()})
+                    if widened:
+                        # The Parquet schema is fixed once the first row group is written,
+                        # so the rows written so far are rewritten to the wider one.
+                        specs.update(widened)
+                        schema = duckdb_backend.arrow_schema(specs)
+                        writer.close()
+                        writer = None
+                        writer = _rewritten_writer(partial_path, schema)
+            if first_chunk is None:
+                first_chunk = chunk.head(settings.TYPE_INFERENCE_SAMPLE_ROWS)
+            with monitor.stage("insert"):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            if profiler is not None:
+                with monitor.stage("profile"):
+                    profiler.observe(chunk, specs)
+            monitor.observe(len(chunk))
+        if writer is not None:
+            writer.close()
+            writer = None
+    except Exception:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    if specs is None:
+        raise HTTPException(status_code=400, detail="The uploaded file contains no rows.")
+
+    os.replace(partial_path, path)
+    duckdb_backend.forget_table(table_name)
+    column_types = duckdb_backend.column_types(table_name)
+    catalog = schema_catalog.build_catalog(_with_columns(first_chunk, list(specs)), column_types, row_count=monitor.rows)
+    return catalog, monitor.stats()
+
+def _append_specs(chunk: pd.DataFrame, catalog: dict) -> dict:
+    """Specs that load the new file's columns into the existing ones; rejects files that do not fit."""
+
+    existing = [col["name"] for col in catalog["columns"]]
+    missing = [col for col in existing if col not in chunk.columns]
+    unexpected = [col for col in chunk.columns if col not in existing]
+    if missing or unexpected:
+        problems = []
+        if missing:
+            problems.append(f"missing columns: {', '.join(missing)}")
+        if unexpected:
+            problems.append(f"unexpected columns: {', '.join(unexpected)}")
+        raise HTTPException(status_code=400, detail=f"The file does not match the dataset's columns ({'; '.join(problems)}).")
+
+    specs = {}
+    incompatible = []
+    for col in catalog["columns"]:
+        spec = type_inference.append_spec(col["type"], chunk[col["name"]])
+        if spec is None:
+            incompatible.append(f"{col['name']} ({col['type']})")
+        specs[col["name"]] = spec
+    if incompatible:
+        raise HTTPException(status_code=400, detail=f"The file's values do not fit these columns: {', '.join(incompatible)}.")
+    return specs
+
+def _appended_catalog(catalog: dict, column_types: dict, appended: int) -> dict:
+    # Sample rows and cardinality estimates stay those of the original upload.
+    return {
+        "columns": [{**col, "type": column_types[col["name"]]} for col in catalog["columns"]],
+        "sample_rows": catalog["sample_rows"],
+        "row_count": catalog["row_count"] + appended,
+    }
+
+def append_rows(file_content, filename: str, table_name: str, catalog: dict, db: Session, dedup: bool = False, profiler=None, progress=None) -> tuple:
+    """Appends the file's rows to an existing SQL table.
+
+    Chunks are coerced to the table's column types and written to a staging
+    table; one INSERT ... SELECT moves them into the table at the end, so
+    queries never see half an append and a failed or cancelled one leaves the
+    table as it was. With ``dedup``, rows whose hash is already recorded for
+    the table, or that repeat within the file, are skipped.
+    """
+
+    monitor = IngestMonitor("append", progress)
+    bind = db.get_bind()
+    staging = staging_table_name(table_name)
+    columns = [col["name"] for col in catalog["columns"]]
+    kinds = {col["name"]: type_inference.kind_of(col["type"]) for col in catalog["columns"]}
+
+    with monitor.stage("ddl"), bind.begin() as connection:
+        # A staging table left behind by a crashed worker is simply replaced.
+        connection.execute(text(f"DROP TABLE IF EXISTS `{staging}`"))
+        connection.execute(text(f"CREATE TABLE `{staging}` AS SELECT * FROM `{table_name}` WHERE 1 = 0"))
+        connection.execute(text(f"ALTER TABLE `{staging}` ADD COLUMN `{STAGE_HASH_COLUMN}` BIGINT"))
+        if dedup:
+            connection.execute(text(f"CREATE INDEX `{staging[:60]}_ix` ON `{staging}` (`{STAGE_HASH_COLUMN}`)"))
+
+    specs = None
+    skipped = 0
+    try:
+        with monitor.stage("dedup"):
+            if dedup and not row_hashes.exists(bind, table_name):
+                row_hashes.backfill(bind, table_name, kinds)
+            # Once a table has row hashes, every append keeps them complete.
+            track_hashes = dedup or row_hashes.exists(bind, table_name)
+
+        for chunk in monitor.parsed(_read_upload(file_content, filename, monitor)):
+            with monitor.stage("parse"):
+                chunk.columns = _clean_column_names(chunk.columns)
+                if specs is None:
+                    specs = _append_specs(chunk, catalog)
+                chunk = _coerce_fixed(_fixed_columns(chunk, columns), specs)
+            hashes = None
+            if track_hashes:
+                with monitor.stage("dedup"):
+                    hashes = row_hashes.row_hashes(chunk, kinds)
+                    if dedup:
+                        with bind.connect() as connection:
+                            seen = np.concatenate([
+                                row_hashes.known(connection, row_hashes.hash_table_name(table_name), hashes),
+                                row_hashes.known(connection, staging, hashes, STAGE_HASH_COLUMN),
+                            ])
+                        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, seen)
+                        skipped += int((~keep).sum())
+                        chunk, hashes = chunk[keep], hashes[keep]
+            with monitor.stage("insert"), bind.begin() as connection:
+                _widen_text_columns(connection, staging, specs, chunk)
+                _insert_rows(connection, staging, chunk.assign(**{STAGE_HASH_COLUMN: hashes}))
+            if profiler is not None:
+                with monitor.stage("profile"):
+                    profiler.observe(chunk, specs)
+            monitor.observe(len(chunk))
+
+        if specs is None:
+            raise HTTPException(status_code=400, detail="The uploaded file contains no rows.")
+
+        with monitor.stage("ddl"), bind.begin() as connection:
+            if connection.dialect.name == "mysql":
+                for col in catalog["columns"]:
+                    if specs[col["name"]]["sql_type"] != col["type"]:
+                        connection.execute(text(f"ALTER TABLE `{table_name}` MODIFY `{col['name']}` {specs[col['name']]['sql_type']}"))
+        column_list = ", ".join(f"`{col}`" for col in columns)
+        with monitor.stage("insert"), bind.begin() as connection:
+            appended = connection.execute(text(f"INSERT INTO `{table_name}` ({column_list}) SELECT {column_list} FROM `{staging}`")).rowcount
+            if track_hashes:
+                row_hashes.add_staged(connection, table_name, staging, STAGE_HASH_COLUMN)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        with bind.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS `{staging}`"))
+
+    catalog = _appended_catalog(catalog, _column_types(specs), appended)
+    return catalog, {**monitor.stats(), "appended": appended, "skipped_duplicates": skipped}
+
+def append_columnar(file_content, filename: str, table_name: str, catalog: dict, dedup: bool = False, profiler=None, progress=None) -> tuple:
+    """Appends the file's rows to a DuckDB dataset by rewriting its Parquet file.
+
+    The new rows are staged in a Parquet file of their own, then copied after
+    the existing row groups into a new file that replaces the old one in a
+    single rename. With ``dedup``, DuckDB leaves out rows already in the table
+    or repeated within the file.
+    """
+
+    monitor = IngestMonitor("parquet_append", progress)
+    path = duckdb_backend.parquet_path(table_name)
+    staged_path, partial_path = f"{path}.append", f"{path}.partial"
+    columns = [col["name"] for col in catalog["columns"]]
+
+    specs = None
+    schema = None
+    writer = None
+    try:
+        for chunk in monitor.parsed(_read_upload(file_content, filename, monitor)):
+            with monitor.stage("parse"):
+                chunk.columns = _clean_column_names(chunk.columns)
+                if specs is None:
+                    specs = _append_specs(chunk, catalog)
+                    schema = pq.read_schema(path)
+                    writer = pq.ParquetWriter(staged_path, schema, compression="zstd")
+                chunk = _coerce_fixed(_fixed_columns(chunk, columns), specs)
+            with monitor.stage("insert"):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            # Deduplicated rows are profiled below, once DuckDB has dropped the duplicates.
+            if profiler is not None and not dedup:
+                with monitor.stage("profile"):
+                    profiler.observe(chunk, specs)
+            monitor.observe(len(chunk))
+
+        if writer is None:
+            raise HTTPException(status_code=400, detail="The uploaded file contains no rows.")
+        writer.close()
+
+        appended = 0
+        with monitor.stage("insert"):
+            writer = pq.ParquetWriter(partial_path, schema, compression="zstd")
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=settings.INGEST_CHUNK_ROWS):
+                writer.write_batch(batch)
+            for batch in duckdb_backend.appended_rows(table_name, staged_path, dedup, settings.INGEST_CHUNK_ROWS):
+                new_rows = pa.Table.from_batches([batch]).cast(schema)
+                writer.write_table(new_rows)
+                appended += new_rows.num_rows
+                if profiler is not None and dedup:
+                    profiler.observe(new_rows.to_pandas(), specs)
+            writer.close()
+            writer = None
+        os.replace(partial_path, path)
+        duckdb_backend.forget_table(table_name)
+    finally:
+        if writer is not None:
+            writer.close()
+        for leftover in (staged_path, partial_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    catalog = _appended_catalog(catalog, {col["name"]: col["type"] for col in catalog["columns"]}, appended)
+    return catalog, {**monitor.stats(), "appended": appended, "skipped_duplicates": monitor.rows - appended}
+
+def append_file(file_content, filename: str, table_name: str, catalog: dict, db: Session, backend: str, dedup: bool = False, progress=None) -> tuple:
+    """Appends the file to an existing dataset table.
+
+    Returns the updated catalog and a profile of just the appended rows, to be
+    merged into the stored one.
+    """
+
+    try:
+        profiler = profiler_service.DatasetProfiler()
+        if backend == "duckdb":
+            catalog, stats = append_columnar(file_content, filename, table_name, catalog, dedup, profiler, progress)
+        else:
+            catalog, stats = append_rows(file_content, filename, table_name, catalog, db, dedup, profiler, progress)
+
+        _report_ingest(stats, table_name)
+        logger.info("Appended %s rows to %s (%s duplicates skipped)", stats["appended"], table_name, stats["skipped_duplicates"])
+        return catalog, profiler
+
+    except (HTTPException, IngestCancelled):
+        raise
     except Exception as e:
-        print(f"An error occurred in file_handler: {e}")
-        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
\ No newline at end of file
+        logger.exception("An error occurred in file_handler: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error appending file: {str(e)}")
+
+def store_file(file_content, filename: str, db: Session, backend: str = None, table_name: str = None, progress=None) -> tuple:
+    """Ingests the file into ``table_name`` (a new name by default).
+
+    ``progress`` is called with the running row count, and the file's total
+    row count where known, after every chunk; it may raise IngestCancelled to
+    stop the ingest.
+    """
+
+    backend = backend or settings.STORAGE_BACKEND
+    try:
+
+        table_name = table_name or new_table_name(filename)
+
+        # The profile is built from the same coerced chunks that are written, in the same pass.
+        profiler = profiler_service.DatasetProfiler()
+        if backend == "duckdb":
+            catalog, stats = ingest_columnar(file_content, filename, table_name, profiler, progress)
+        elif _use_streaming(filename):
+            catalog, stats = ingest_streaming(file_content, filename, table_name, db, profiler, progress)
+        elif _use_arrow(filename):
+            catalog, stats = ingest_arrow(file_content, filename, table_name, db, profiler, progress)
+        else:
+            catalog, stats = ingest_buffered(file_content, filename, table_name, db, profiler, progress)
+
+        _report_ingest(stats, table_name)
+
+        return table_name, catalog, profiler
+
+    except (HTTPException, IngestCancelled):
+        raise
+    except Exception as e:
+        logger.exception("An error occurred in file_handler: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+
+async def process_and_store_file(file: UploadFile, db: Session, backend: str = None) -> tuple:
+    # Parsing and inserting are blocking; keep them off the event loop.
+    return await run_in_threadpool(store_file, file.file, file.filename, db, backend)
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.database import SessionLocal, engine
+from app.models import index_decision as decision_model
+
+logger = logging.getLogger(__name__)
+
+TEXT_PREFIX_LENGTH = 64
+UNINDEXABLE_TYPES = ("BOOLEAN",)
+TEMPORAL_TYPES = ("DATE", "DATETIME", "TIMESTAMP")
+PREDICATE_CLAUSES = ("WHERE", "GROUP BY", "ORDER BY", "HAVING", "ON")
+CLAUSE_KEYWORDS = re.compile(r'\b(SELECT|FROM|WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|UNION|JOIN|ON)\b', re.I)
+
+# DDL runs off the request path, one statement at a time.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+_lock = threading.Lock()
+_usage = {}
+
+
+class _DatasetUsage:
+    """Query usage and indexes of a dataset's current table; a replaced table starts over."""
+
+    def __init__(self, table_name: str, indexed: dict):
+        self.table_name = table_name
+        self.queries = 0
+        self.counts = defaultdict(int)
+        self.last_seen = {}
+        self.indexed = indexed
+        self.pending = set()
+
+
+def _indexable(column_type: str) -> bool:
+    return column_type.upper() not in UNINDEXABLE_TYPES
+
+
+def index_name(table_name: str, column_name: str) -> str:
+    digest = hashlib.sha1(f"{table_name}.{column_name}".encode("utf-8")).hexdigest()[:10]
+    return f"ix_{column_name[:40]}_{digest}"
+
+
+def predicate_columns(sql_query: str, column_names) -> list:
+    """Returns the table columns referenced in WHERE/GROUP BY/ORDER BY/HAVING/ON clauses."""
+
+    sql_query = re.sub(r"'(?:[^']|'')*'", "''", sql_query)
+    parts = CLAUSE_KEYWORDS.split(sql_query)
+    clauses = [
+        body for keyword, body in zip(parts[1::2], parts[2::2])
+        if re.sub(r'\s+', ' ', keyword.upper()) in PREDICATE_CLAUSES
+    ]
+    tokens = set(re.findall(r'[a-z_][a-z0-9_]*', " ".join(clauses).lower()))
+    return [col for col in column_names if col.lower() in tokens]
+
+
+def _load_usage(dataset_id: int, table_name: str) -> _DatasetUsage:
+
+    db = SessionLocal()
+    try:
+        decisions = db.query(decision_model.IndexDecision).filter(
+            decision_model.IndexDecision.dataset_id == dataset_id
+        ).order_by(decision_model.IndexDecision.id).all()
+    finally:
+        db.close()
+
+    indexed = {}
+    for decision in decisions:
+        # Index names are derived from the table, so decisions about a table the
+        # dataset's data has since been replaced with are left out.
+        if decision.index_name != index_name(table_name, decision.column_name):
+            continue
+        if decision.action == "create":
+            indexed[decision.column_name] = decision.source
+        elif decision.action == "drop":
+            indexed.pop(decision.column_name, None)
+    return _DatasetUsage(table_name, indexed)
+
+
+def _apply(dataset_id: int, table_name: str, column_name: str, column_type: str, action: str, source: str, reason: str):
+
+    name = index_name(table_name, column_name)
+    try:
+        with engine.begin() as connection:
+            if action == "create":
+                column_sql = f"`{column_name}`"
+                if connection.dialect.name == "mysql" and "TEXT" in column_type.upper():
+                    column_sql = f"`{column_name}`({TEXT_PREFIX_LENGTH})"
+                connection.execute(text(f"CREATE INDEX `{name}` ON `{table_name}` ({column_sql})"))
+            elif connection.dialect.name == "mysql":
+                connection.execute(text(f"DROP INDEX `{name}` ON `{table_name}`"))
+            else:
+                connection.execute(text(f"DROP INDEX `{name}`"))
+        recorded_action = action
+    except Exception as e:
+        logger.warning("Index advisor could not %s %s on %s: %s", action, name, table_name, e)
+        recorded_action = f"{action}_failed"
+        reason = f"{reason} Failed: {e}"
+
+    with _lock:
+        usage = _usage.get(dataset_id)
+        if usage is not None and usage.table_name == table_name:
+            usage.pending.discard(column_name)
+            if recorded_action == "create":
+                usage.indexed[column_name] = source
+                usage.last_seen.setdefault(column_name, usage.queries)
+            elif recorded_action == "drop":
+                usage.indexed.pop(column_name, None)
+
+    logger.info("Index advisor %s %s on %s.%s: %s", recorded_action, name, table_name, column_name, reason)
+    db = SessionLocal()
+    try:
+        db.add(decision_model.IndexDecision(
+            dataset_id=dataset_id,
+            column_name=column_name,
+            index_name=name,
+            action=recorded_action,
+            source=source,
+            reason=reason
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("Index advisor task failed: %s", future.exception())
+
+
+def _submit(dataset_id: int, table_name: str, column_name: str, column_type: str, action: str, source: str, reason: str):
+    future = _executor.submit(_apply, dataset_id, table_name, column_name, column_type, action, source, reason)
+    future.add_done_callback(_log_failure)
+
+
+def advise_upload(dataset_id: int, table_name: str, catalog: dict):
+    """Indexes likely filter/group keys of a freshly ingested table, judged by sampled cardinality."""
+
+    if not settings.INDEX_ADVISOR_ENABLED or catalog["row_count"] < settings.INDEX_ADVISOR_MIN_ROWS:
+        return
+
+    candidates = []
+    for col in catalog["columns"]:
+        non_null = col.get("sample_non_null")
+        distinct = col.get("sample_distinct")
+        if not _indexable(col["type"]) or not non_null or distinct is None or distinct < 2:
+            continue
+        ratio = distinct / non_null
+        if col["type"].upper() in TEMPORAL_TYPES:
+            candidates.append((0, ratio, col, f"{col['type']} column, likely used in range filters."))
+        elif ratio <= settings.INDEX_ADVISOR_MAX_DISTINCT_RATIO:
+            candidates.append((1, ratio, col, f"{distinct} distinct values in {non_null} sampled rows, likely a filter or GROUP BY key."))
+
+    candidates.sort(key=lambda candidate: candidate[:2])
+    selected = candidates[:settings.INDEX_ADVISOR_MAX_UPLOAD_INDEXES]
+
+    with _lock:
+        usage = _usage.get(dataset_id)
+        if usage is None or usage.table_name != table_name:
+            usage = _usage[dataset_id] = _DatasetUsage(table_name, {})
+        usage.pending.update(col["name"] for _, _, col, _ in selected)
+    for _, _, col, reason in selected:
+        _submit(dataset_id, table_name, col["name"], col["type"], "create", "upload", reason)
+
+
+def observe_query(dataset_id: int, table_name: str, sql_query: str, catalog: dict):
+    """Records the predicate columns of an executed query and adjusts indexes accordingly."""
+
+    if not settings.INDEX_ADVISOR_ENABLED or dataset_id is None:
+        return
+
+    try:
+        column_types = {col["name"]: col["type"] for col in catalog["columns"]}
+        used = predicate_columns(sql_query, column_types)
+
+        with _lock:
+            usage = _usage.get(dataset_id)
+        if usage is None or usage.table_name != table_name:
+            loaded = _load_usage(dataset_id, table_name)
+            with _lock:
+                usage = _usage.get(dataset_id)
+                if usage is None or usage.table_name != table_name:
+                    usage = _usage[dataset_id] = loaded
+
+        to_create, to_drop = [], []
+        with _lock:
+            usage.queries += 1
+            for col in used:
+                usage.counts[col] += 1
+                usage.last_seen[col] = usage.queries
+
+            for col in used:
+                if (
+                    col not in usage.indexed
+                    and col not in usage.pending
+                    and _indexable(column_types[col])
+                    and usage.counts[col] >= settings.INDEX_ADVISOR_MIN_OBSERVATIONS
+                    and len(usage.indexed) + len(usage.pending) < settings.INDEX_ADVISOR_MAX_INDEXES
+                ):
+                    usage.pending.add(col)
+                    to_create.append((col, f"Used in predicates of {usage.counts[col]} of {usage.queries} observed queries."))
+
+            for col in list(usage.indexed):
+                idle = usage.queries - usage.last_seen.setdefault(col, 0)
+                if col not in usage.pending and col in column_types and idle >= settings.INDEX_ADVISOR_DROP_AFTER_QUERIES:
+                    usage.pending.add(col)
+                    to_drop.append((col, f"Not used in predicates of the last {idle} observed queries."))
+
+        for col, reason in to_create:
+            _submit(dataset_id, table_name, col, column_types[col], "create", "runtime", reason)
+        for col, reason in to_drop:
+            _submit(dataset_id, table_name, col, column_types[col], "drop", "runtime", reason)
+    except Exception as e:
+        logger.warning("Index advisor failed to observe query for dataset %s: %s", dataset_id, e)
+
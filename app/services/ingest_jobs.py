@@ -0,0 +1,578 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core import observability
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models import dataset as dataset_model, ingest_job as job_model
+from app.services import cost_guard, file_handler, index_advisor, profiler as profiler_service, row_hashes, schema_catalog
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+RETRYABLE_STATUSES = ("failed", "cancelled")
+# "upload" creates the dataset; "append" adds rows to its table and "replace"
+# loads the file into a new table that takes the old one's place.
+JOB_KINDS = ("upload", "append", "replace")
+
+_executor = None
+_executor_lock = threading.Lock()
+_futures = {}
+_lease_thread = None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _worker_init():
+    # Every mapped class must be imported before the first query configures the mappers.
+    from app.models import user, dataset, dataset_catalog, dataset_profile, index_decision, ingest_job, conversation_summary, chat, saved_chart  # noqa: F401
+
+    observability.configure_logging()
+    # Ingest yields the CPU to the API process, which serves chat.
+    if settings.INGEST_WORKER_NICE and hasattr(os, "nice"):
+        os.nice(settings.INGEST_WORKER_NICE)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor, _lease_thread
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked: the parent holds connection pools and threads.
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.INGEST_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+            )
+        if _lease_thread is None:
+            _lease_thread = threading.Thread(target=_renew_leases, daemon=True)
+            _lease_thread.start()
+        return _executor
+
+
+def _renew_leases():
+    # Jobs waiting in this process's pool have no worker heartbeating for them yet.
+    # Renewing their heartbeat here keeps other API processes, which cannot see
+    # this pool, from taking a long queue for abandoned jobs.
+    while True:
+        time.sleep(settings.INGEST_PROGRESS_INTERVAL_SECONDS)
+        job_ids = list(_futures)
+        if not job_ids:
+            continue
+        db = SessionLocal()
+        try:
+            db.query(job_model.IngestJob).filter(
+                job_model.IngestJob.id.in_(job_ids),
+                job_model.IngestJob.status.in_(ACTIVE_STATUSES)
+            ).update({"heartbeat_at": _utcnow()}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning("Could not renew the lease of queued ingest jobs: %s", e)
+        finally:
+            db.close()
+
+
+def spool(file_obj, filename: str) -> tuple:
+    """Copies an upload to the spool directory; returns the path and size in bytes."""
+
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.INGEST_SPOOL_DIR, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file_obj, out, 1024 * 1024)
+    return path, os.path.getsize(path)
+
+
+def create_job(db: Session, user_id: int, filename: str, backend: str, spool_path: str, file_size: int) -> job_model.IngestJob:
+    dataset = dataset_model.Dataset(
+        user_id=user_id,
+        original_filename=filename,
+        database_table_name=file_handler.new_table_name(filename),
+        storage_backend=backend,
+        status="processing"
+    )
+    job = job_model.IngestJob(
+        dataset=dataset,
+        status="queued",
+        filename=filename,
+        spool_path=spool_path,
+        backend=backend,
+        file_size=file_size,
+        attempts=1,
+        heartbeat_at=_utcnow()
+    )
+    job.table_name = dataset.database_table_name
+    expire_spools(db)
+    db.add(dataset)
+    db.flush()
+    job.active_dataset_id = dataset.id
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _busy(job_id: int) -> HTTPException:
+    return HTTPException(status_code=409, detail=f"Job {job_id} is still updating this dataset; wait for it to finish or cancel it.")
+
+
+def check_idle(db: Session, dataset: dataset_model.Dataset):
+    # One job at a time per dataset: concurrent appends would race on the staging table.
+    # This also expires a job that was left behind; the claim itself is made by
+    # the unique active_dataset_id when the new job is stored.
+    active = db.query(job_model.IngestJob).filter(
+        job_model.IngestJob.dataset_id == dataset.id,
+        job_model.IngestJob.status.in_(ACTIVE_STATUSES)
+    ).first()
+    if active is not None and refresh(db, active).status in ACTIVE_STATUSES:
+        raise _busy(active.id)
+
+
+def _claim(db: Session, job: job_model.IngestJob):
+    """Commits ``job`` as its dataset's one active job; 409 if another job got there first."""
+
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        active_id = db.query(job_model.IngestJob.id).filter(job_model.IngestJob.active_dataset_id == job.dataset_id).scalar()
+        raise _busy(active_id)
+
+
+def create_update_job(db: Session, dataset: dataset_model.Dataset, kind: str, filename: str, spool_path: str, file_size: int, dedup: bool) -> job_model.IngestJob:
+    """Queues an append to, or a replacement of, an existing dataset's data.
+
+    The dataset stays queryable meanwhile: appends become visible all at once
+    and replacements swap tables when they finish.
+    """
+
+    job = job_model.IngestJob(
+        dataset=dataset,
+        kind=kind,
+        status="queued",
+        filename=filename,
+        spool_path=spool_path,
+        backend=dataset.storage_backend,
+        table_name=dataset.database_table_name if kind == "append" else file_handler.new_table_name(filename),
+        dedup=dedup,
+        file_size=file_size,
+        attempts=1,
+        heartbeat_at=_utcnow(),
+        active_dataset_id=dataset.id
+    )
+    expire_spools(db)
+    db.add(job)
+    try:
+        _claim(db, job)
+    except HTTPException:
+        _remove_spool(spool_path)
+        raise
+    db.refresh(job)
+    return job
+
+
+def submit(job: job_model.IngestJob):
+    future = _get_executor().submit(_run_job, job.id, job.attempts)
+    _futures[job.id] = future
+    future.add_done_callback(lambda future, job_id=job.id: _job_finished(job_id, future))
+
+
+def run_inline(job: job_model.IngestJob):
+    """Runs the job in the calling thread, for INGEST_BACKGROUND=False."""
+
+    _after_success(_run_job(job.id, job.attempts))
+
+
+def _after_success(result: dict):
+    # Index creation stays in the API process, where the advisor tracks query usage.
+    # Appends keep the table's existing indexes.
+    if result is not None and result["backend"] == "sql" and result["kind"] != "append":
+        index_advisor.advise_upload(result["dataset_id"], result["table_name"], result["catalog"])
+
+
+def _job_finished(job_id: int, future):
+    global _executor
+    _futures.pop(job_id, None)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        # The worker process died (e.g. out of memory) before it could record the outcome.
+        logger.error("Ingest job %s crashed: %s", job_id, error)
+        if isinstance(error, BrokenProcessPool):
+            # A broken pool rejects all further work; the next submit starts a fresh one.
+            with _executor_lock:
+                _executor = None
+        _update_job(job_id, ("running", "cancelling", "queued"), status="failed", error=f"The ingest worker crashed: {error}", finished_at=_utcnow())
+        return
+    _after_success(future.result())
+
+
+def _update_job(job_id: int, expected_statuses: tuple, attempt: int = None, **values) -> bool:
+    """Updates the job only while it is in one of ``expected_statuses`` (and on ``attempt``); returns whether it did."""
+
+    db = SessionLocal()
+    try:
+        query = db.query(job_model.IngestJob).filter(
+            job_model.IngestJob.id == job_id,
+            job_model.IngestJob.status.in_(expected_statuses)
+        )
+        if attempt is not None:
+            query = query.filter(job_model.IngestJob.attempts == attempt)
+        if values.get("status") in RETRYABLE_STATUSES:
+            values["active_dataset_id"] = None
+        updated = query.update(values, synchronize_session=False)
+        if updated and "status" in values and values["status"] in RETRYABLE_STATUSES:
+            job = db.get(job_model.IngestJob, job_id)
+            _mark_dataset(job, values["status"])
+        db.commit()
+        return bool(updated)
+    finally:
+        db.close()
+
+
+def _mark_dataset(job: job_model.IngestJob, status: str):
+    # A failed append or replacement leaves the dataset's existing data in place.
+    if job.kind == "upload":
+        job.dataset.status = status
+
+
+def _remove_spool(path: str):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def expire_spools(db: Session):
+    """Removes the files of failed and cancelled jobs that were not retried within INGEST_SPOOL_TTL_SECONDS."""
+
+    cutoff = _utcnow() - timedelta(seconds=settings.INGEST_SPOOL_TTL_SECONDS)
+    expired = db.query(job_model.IngestJob).filter(
+        job_model.IngestJob.status.in_(RETRYABLE_STATUSES),
+        job_model.IngestJob.finished_at < cutoff,
+        job_model.IngestJob.spool_path != ""
+    ).all()
+    for job in expired:
+        _remove_spool(job.spool_path)
+        # Cleared so the job is not looked at again; retrying it answers 410.
+        job.spool_path = ""
+
+
+def _job_table(job: job_model.IngestJob) -> str:
+    # Jobs queued before table_name was recorded always loaded the dataset's own table.
+    return job.table_name or job.dataset.database_table_name
+
+
+class _Progress:
+    """Progress callback for store_file that also heartbeats and watches for cancellation.
+
+    A background thread writes the latest counts every INGEST_PROGRESS_INTERVAL_SECONDS,
+    so the job stays alive even while a single large read produces no rows.
+    """
+
+    def __init__(self, job_id: int, spool_file):
+        self.job_id = job_id
+        self.spool_file = spool_file
+        self.rows = 0
+        self.rows_total = None
+        self.bytes_read = 0
+        self.cancelled = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+
+    def __call__(self, rows: int, rows_total: int = None):
+        self.rows = rows
+        self.rows_total = rows_total
+        self.bytes_read = self.spool_file.tell()
+        if self.cancelled:
+            raise file_handler.IngestCancelled()
+
+    def _heartbeat(self):
+        while not self._stop.wait(settings.INGEST_PROGRESS_INTERVAL_SECONDS):
+            self.flush()
+
+    def flush(self):
+        db = SessionLocal()
+        try:
+            db.query(job_model.IngestJob).filter(job_model.IngestJob.id == self.job_id).update(
+                {"rows_ingested": self.rows, "rows_total": self.rows_total, "bytes_read": self.bytes_read, "heartbeat_at": _utcnow()},
+                synchronize_session=False
+            )
+            db.commit()
+            status = db.query(job_model.IngestJob.status).filter(job_model.IngestJob.id == self.job_id).scalar()
+            self.cancelled = status == "cancelling"
+        except Exception as e:
+            logger.warning("Could not record progress of ingest job %s: %s", self.job_id, e)
+        finally:
+            db.close()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _run_job(job_id: int, attempt: int):
+    """Runs in a worker process. Returns what the API process needs once the job succeeded."""
+
+    db = SessionLocal()
+    try:
+        # Claiming with a conditional update means a cancelled job, or an older attempt
+        # still sitting in a queue after a retry, never runs.
+        claimed = db.query(job_model.IngestJob).filter(
+            job_model.IngestJob.id == job_id,
+            job_model.IngestJob.status == "queued",
+            job_model.IngestJob.attempts == attempt
+        ).update({"status": "running", "started_at": _utcnow(), "heartbeat_at": _utcnow()}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            # Cancelled after the pool had already picked the job up, too late for the future to be cancelled.
+            _update_job(job_id, ("cancelling",), attempt, status="cancelled", finished_at=_utcnow())
+            return None
+
+        job = db.get(job_model.IngestJob, job_id)
+        dataset = job.dataset
+        table_name, backend, filename = _job_table(job), job.backend, job.filename
+
+        with open(job.spool_path, "rb") as spool_file:
+            reporter = _Progress(job_id, spool_file)
+            try:
+                if job.kind == "append":
+                    catalog = schema_catalog.from_model(dataset.catalog)
+                    catalog, dataset_profiler = file_handler.append_file(spool_file, filename, table_name, catalog, db, backend, job.dedup, reporter)
+                else:
+                    _, catalog, dataset_profiler = file_handler.store_file(spool_file, filename, db, backend, table_name, reporter)
+                reporter.flush()
+                if reporter.cancelled:
+                    raise file_handler.IngestCancelled()
+            except file_handler.IngestCancelled:
+                db.rollback()
+                if job.kind != "append":
+                    file_handler.discard_table(table_name, backend, db)
+                _update_job(job_id, ("running", "cancelling"), status="cancelled", finished_at=_utcnow())
+                return None
+            except Exception as e:
+                db.rollback()
+                if job.kind != "append":
+                    file_handler.discard_table(table_name, backend, db)
+                error = e.detail if isinstance(e, HTTPException) else str(e)
+                _update_job(job_id, ("running", "cancelling"), status="failed", error=str(error), finished_at=_utcnow())
+                return None
+            finally:
+                reporter.stop()
+
+        if job.kind == "append":
+            rows_ingested = catalog["row_count"] - dataset.catalog.row_count
+        else:
+            rows_ingested = catalog["row_count"]
+        # Committed in the same transaction as the dataset changes, and only if the job
+        # was not cancelled or given up on since the last progress check. Appended rows
+        # are already in the table by now, so nothing can stop an append at this point.
+        finished = db.query(job_model.IngestJob).filter(
+            job_model.IngestJob.id == job_id,
+            job_model.IngestJob.attempts == attempt,
+            job_model.IngestJob.status.in_(("running", "cancelling", "failed") if job.kind == "append" else ("running",))
+        ).update(
+            {"status": "succeeded", "rows_ingested": rows_ingested, "bytes_read": job.file_size, "finished_at": _utcnow(), "active_dataset_id": None},
+            synchronize_session=False
+        )
+        if not finished:
+            db.rollback()
+            if job.kind != "append":
+                file_handler.discard_table(table_name, backend, db)
+            _update_job(job_id, ("cancelling",), attempt, status="cancelled", finished_at=_utcnow())
+            return None
+
+        if job.kind == "append":
+            dataset.data_version += 1
+            _apply_append(db, dataset, catalog, dataset_profiler)
+        elif job.kind == "replace":
+            dataset.data_version += 1
+            _apply_replace(db, dataset, table_name, catalog, dataset_profiler)
+        else:
+            db.add(schema_catalog.to_model(dataset.id, table_name, catalog))
+            db.add(profiler_service.to_model(dataset.id, dataset_profiler))
+            dataset.status = "ready"
+        db.commit()
+        # Failed and cancelled jobs keep the file for a retry until expire_spools removes it.
+        _remove_spool(job.spool_path)
+        return {"dataset_id": dataset.id, "table_name": table_name, "backend": backend, "kind": job.kind, "catalog": catalog}
+    finally:
+        db.close()
+
+
+def _store_metadata(db: Session, dataset: dataset_model.Dataset, table_name: str, catalog: dict, dataset_profiler):
+    # Updated in place: the catalog and profile rows are unique per dataset.
+    catalog_row = schema_catalog.to_model(dataset.id, table_name, catalog)
+    profile_row = profiler_service.to_model(dataset.id, dataset_profiler)
+    if dataset.catalog is None:
+        db.add(catalog_row)
+    else:
+        dataset.catalog.columns = catalog_row.columns
+        dataset.catalog.sample_rows = catalog_row.sample_rows
+        dataset.catalog.row_count = catalog_row.row_count
+        dataset.catalog.schema_hash = catalog_row.schema_hash
+    if dataset.profile is None:
+        db.add(profile_row)
+    else:
+        dataset.profile.row_count = profile_row.row_count
+        dataset.profile.profile = profile_row.profile
+
+
+def _apply_append(db: Session, dataset: dataset_model.Dataset, catalog: dict, appended_profiler):
+    # The catalog and profile are updated from the appended rows alone rather than
+    # rebuilt from the table. A schema hash that changed (a widened VARCHAR) makes
+    # the SQL cache drop the table's entries on its next lookup.
+    dataset_profiler = appended_profiler
+    if dataset.profile is not None:
+        dataset_profiler = profiler_service.from_model(dataset.profile)
+        dataset_profiler.merge(appended_profiler)
+    _store_metadata(db, dataset, dataset.database_table_name, catalog, dataset_profiler)
+    if dataset.storage_backend != "duckdb":
+        # The cost guard's random sample no longer represents the table; it is rebuilt on next use.
+        cost_guard.drop_sample_table(dataset.database_table_name)
+
+
+def _apply_replace(db: Session, dataset: dataset_model.Dataset, table_name: str, catalog: dict, dataset_profiler):
+    old_table_name = dataset.database_table_name
+    _store_metadata(db, dataset, table_name, catalog, dataset_profiler)
+    dataset.database_table_name = table_name
+    db.commit()
+
+    # Chat history stays with the dataset; only the old table and the tables derived
+    # from it go. SQL cache entries are keyed by table name and are never hit again.
+    file_handler.discard_table(old_table_name, dataset.storage_backend, db)
+    if dataset.storage_backend != "duckdb":
+        cost_guard.drop_sample_table(old_table_name)
+        with db.get_bind().begin() as connection:
+            row_hashes.drop(connection, old_table_name)
+
+
+def _stale_cutoff() -> datetime:
+    return _utcnow() - timedelta(seconds=settings.INGEST_STALE_SECONDS)
+
+
+def _is_stale(job: job_model.IngestJob) -> bool:
+    if job.status not in ACTIVE_STATUSES:
+        return False
+    if job.id in _futures:
+        return False
+    # Running jobs heartbeat from their worker, and queued ones have their lease renewed
+    # by the API process whose pool holds them; either stops only when that process does.
+    return job.heartbeat_at is None or job.heartbeat_at < _stale_cutoff()
+
+
+def refresh(db: Session, job: job_model.IngestJob) -> job_model.IngestJob:
+    """Marks jobs whose worker or API process stopped heartbeating (e.g. after a restart) as failed."""
+
+    if not _is_stale(job):
+        return job
+    # Conditional, so a heartbeat that lands meanwhile keeps the job alive.
+    expired = db.query(job_model.IngestJob).filter(
+        job_model.IngestJob.id == job.id,
+        job_model.IngestJob.status.in_(ACTIVE_STATUSES),
+        (job_model.IngestJob.heartbeat_at.is_(None)) | (job_model.IngestJob.heartbeat_at < _stale_cutoff())
+    ).update({
+        "status": "failed",
+        "error": "The ingest was interrupted before it finished. Retry the job to run it again.",
+        "finished_at": _utcnow(),
+        "active_dataset_id": None,
+    }, synchronize_session=False)
+    if expired:
+        _mark_dataset(job, "failed")
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def describe(job: job_model.IngestJob) -> dict:
+    if job.status == "succeeded":
+        percent = 100.0
+    elif job.rows_total:
+        # Buffered and memory-mapped formats are read far ahead of, or apart from, the
+        # rows written, so their progress is counted in rows wherever the total is known.
+        percent = round(100.0 * min(job.rows_ingested, job.rows_total) / job.rows_total, 1)
+    else:
+        percent = round(100.0 * job.bytes_read / job.file_size, 1) if job.file_size else 0.0
+    eta_seconds = None
+    if job.status == "running" and job.started_at is not None and 0 < percent < 100:
+        elapsed = (_utcnow() - job.started_at).total_seconds()
+        eta_seconds = round(elapsed * (100 - percent) / percent, 1)
+    return {
+        "id": job.id,
+        "dataset_id": job.dataset_id,
+        "kind": job.kind,
+        "status": job.status,
+        "filename": job.filename,
+        "backend": job.backend,
+        "file_size": job.file_size,
+        "bytes_read": job.bytes_read,
+        "rows_ingested": job.rows_ingested,
+        "rows_total": job.rows_total,
+        "dedup": job.dedup,
+        "percent": percent,
+        "eta_seconds": eta_seconds,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def cancel(db: Session, job: job_model.IngestJob) -> job_model.IngestJob:
+    if job.status not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"The job has already {job.status}.")
+    if job.status == "queued":
+        future = _futures.get(job.id)
+        if future is None or future.cancel():
+            job.status = "cancelled"
+            job.finished_at = _utcnow()
+            job.active_dataset_id = None
+            _mark_dataset(job, "cancelled")
+            db.commit()
+            return job
+    # A running worker notices at its next heartbeat and cleans up after itself.
+    job.status = "cancelling"
+    db.commit()
+    return job
+
+
+def retry(db: Session, job: job_model.IngestJob) -> job_model.IngestJob:
+    if job.status not in RETRYABLE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Only failed or cancelled jobs can be retried; this one is {job.status}.")
+    if not os.path.exists(job.spool_path):
+        raise HTTPException(status_code=410, detail="The uploaded file is no longer available. Upload it again.")
+
+    check_idle(db, job.dataset)
+    if job.kind != "append":
+        file_handler.discard_table(_job_table(job), job.backend, db)
+    job.status = "queued"
+    job.attempts += 1
+    job.error = None
+    job.bytes_read = 0
+    job.rows_ingested = 0
+    job.rows_total = None
+    job.started_at = None
+    job.heartbeat_at = _utcnow()
+    job.finished_at = None
+    job.active_dataset_id = job.dataset_id
+    _mark_dataset(job, "processing")
+    _claim(db, job)
+    if settings.INGEST_BACKGROUND:
+        submit(job)
+    else:
+        run_inline(job)
+        db.refresh(job)
+    return job
@@ -0,0 +1,295 @@
+"""Scheduling of calls to the LLM provider.
+
+Every call goes through ``llm_scheduler``, which
+
+- coalesces identical calls already in flight, so a double-clicked question or
+  a team opening the same dataset costs one provider call;
+- caps the calls in flight, handing free slots to queued users round-robin and
+  never more than ``per_user_limit`` at a time to one user;
+- retries rate-limited (429) calls with exponential backoff, honouring
+  Retry-After, and holds every other call back until the backoff is over.
+
+Limits apply per API process.
+"""
+import asyncio
+import contextlib
+import hashlib
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+
+from openai import APIConnectionError, APIStatusError, InternalServerError, RateLimitError
+
+from app.core import observability
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+def request_key(*parts) -> str:
+    """Identifies a call by the model and everything sent to it."""
+
+    payload = "\n\x00".join(str(part) for part in (settings.LLM_MODEL, *parts))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _retry_after(error: Exception):
+    if not isinstance(error, APIStatusError):
+        return None
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Flight:
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.subscribers = 0
+
+
+class _Broadcast:
+    """Chunks of one streamed call, replayed to every subscriber from the start."""
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._updated = asyncio.Event()
+
+    def _notify(self):
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: BaseException = None):
+        self.finished = True
+        self.error = error
+        self._notify()
+
+    async def wait(self):
+        await self._updated.wait()
+
+
+class LLMScheduler:
+
+    def __init__(self, max_concurrency: int, per_user_limit: int, max_retries: int, retry_base_seconds: float, retry_max_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.per_user_limit = per_user_limit
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.in_flight = 0
+        # Users with queued calls, in the order they are next served.
+        self._queues = OrderedDict()
+        self._active = {}
+        self._flights = {}
+        self._broadcasts = {}
+        self._resume_at = 0.0
+
+    # --- fair queue ---
+
+    def _queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _report(self):
+        observability.LLM_QUEUE_DEPTH.set(self._queued())
+        observability.LLM_IN_FLIGHT.set(self.in_flight)
+        observability.LLM_QUEUED_USERS.set(len(self._queues))
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrency:
+            user = next((user for user in self._queues if self._active.get(user, 0) < self.per_user_limit), None)
+            if user is None:
+                break
+            queue = self._queues.pop(user)
+            waiter = queue.popleft()
+            if queue:
+                # Back of the line: the next slot goes to another user if one is waiting.
+                self._queues[user] = queue
+            if waiter.done():
+                continue
+            self._active[user] = self._active.get(user, 0) + 1
+            self.in_flight += 1
+            waiter.set_result(None)
+        self._report()
+
+    def _release(self, user):
+        self.in_flight -= 1
+        self._active[user] -= 1
+        if not self._active[user]:
+            del self._active[user]
+        self._dispatch()
+
+    def _forget_waiter(self, user, waiter: asyncio.Future):
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user]
+        self._report()
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, user, stage: str):
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        started = time.perf_counter()
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                self._forget_waiter(user, waiter)
+            else:
+                # Granted just as the caller went away.
+                self._release(user)
+            raise
+        observability.LLM_QUEUE_WAIT_SECONDS.labels(stage).observe(time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            self._release(user)
+
+    # --- retries ---
+
+    def _backoff(self, error: Exception, attempt: int, stage: str) -> float:
+        delay = _retry_after(error)
+        if delay is None:
+            delay = self.retry_base_seconds * 2 ** attempt * random.uniform(0.5, 1.0)
+        delay = min(delay, self.retry_max_seconds)
+        reason = "rate_limit" if isinstance(error, RateLimitError) else "provider_error"
+        if reason == "rate_limit":
+            # The limit is shared, so the calls of every user pause, not just this one.
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        observability.LLM_RETRIES.labels(reason).inc()
+        logger.warning("LLM %s call failed (%s), retrying in %.1f s", stage, type(error).__name__, delay)
+        return delay
+
+    async def _wait_for_resume(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _run(self, user, stage: str, make_call):
+        attempt = 0
+        while True:
+            async with self._slot(user, stage):
+                await self._wait_for_resume()
+                try:
+                    return await make_call()
+                except RETRYABLE_ERRORS as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(e, attempt, stage)
+            # The slot is given up while waiting and queued for again.
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _run_stream(self, user, stage: str, make_stream):
+        attempt = 0
+        while True:
+            started = False
+            async with self._slot(user, stage):
+                await self._wait_for_resume()
+                try:
+                    async for chunk in make_stream():
+                        started = True
+                        yield chunk
+                    return
+                except RETRYABLE_ERRORS as e:
+                    # Chunks already sent cannot be taken back.
+                    if started or attempt >= self.max_retries:
+                        raise
+                    delay = self._backoff(e, attempt, stage)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # --- single-flight ---
+
+    def _landed(self, key: str, flight: _Flight, task: asyncio.Task):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not task.cancelled():
+            # Retrieved here so a call all of whose callers left is not reported as unhandled.
+            task.exception()
+
+    async def call(self, key: str, user, make_call, stage: str = "llm"):
+        """Awaits ``make_call()`` in a slot of ``user``'s; callers with the same ``key`` share one call."""
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._run(user, stage, make_call)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._landed(key, flight, task))
+        else:
+            observability.LLM_COALESCED.labels(stage).inc()
+        flight.subscribers += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.task.done():
+                # Nobody is left to answer; later callers start a call of their own.
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _produce(self, key: str, broadcast: _Broadcast, user, stage: str, make_stream):
+        try:
+            async for chunk in self._run_stream(user, stage, make_stream):
+                broadcast.publish(chunk)
+            broadcast.finish()
+        except BaseException as e:
+            broadcast.finish(e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            if self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+
+    async def stream(self, key: str, user, make_stream, stage: str = "llm"):
+        """Yields the chunks of ``make_stream()``; callers with the same ``key`` share one streamed call."""
+
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._broadcasts[key] = broadcast
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, user, stage, make_stream))
+        else:
+            observability.LLM_COALESCED.labels(stage).inc()
+        broadcast.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(broadcast.chunks):
+                    yield broadcast.chunks[position]
+                    position += 1
+                if broadcast.finished:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+                await broadcast.wait()
+        finally:
+            broadcast.subscribers -= 1
+            if not broadcast.subscribers and not broadcast.finished:
+                if self._broadcasts.get(key) is broadcast:
+                    del self._broadcasts[key]
+                broadcast.task.cancel()
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    per_user_limit=settings.LLM_MAX_CONCURRENCY_PER_USER,
+    max_retries=settings.LLM_MAX_RETRIES,
+    retry_base_seconds=settings.LLM_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.LLM_RETRY_MAX_SECONDS
+)
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import event, inspect
+
+from app.core.config import settings
+from app.models import user as user_model
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as requests see it, detached from any session."""
+
+    id: int
+    email: str
+
+
+class PrincipalCache:
+    """LRU/TTL cache of authenticated principals keyed on the token subject (the email)."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, email: str):
+        if self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None or time.monotonic() - entry[1] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[email]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            user_id, _ = entry
+        return Principal(id=user_id, email=email)
+
+    def set(self, principal: Principal):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[principal.email] = (principal.id, time.monotonic())
+            self._entries.move_to_end(principal.email)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, email: str):
+        with self._lock:
+            if self._entries.pop(email, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(user_model.User, "after_update")
+@event.listens_for(user_model.User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    # Covers changes made through the ORM; code that updates users with raw SQL must call invalidate().
+    principal_cache.invalidate(target.email)
+    for previous_email in inspect(target).attrs.email.history.deleted or ():
+        principal_cache.invalidate(previous_email)
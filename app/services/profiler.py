@@ -0,0 +1,349 @@
+import base64
+import json
+import math
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api import types as pd_types
+
+from app.core.config import settings
+from app.models import dataset_profile as profile_model
+
+NUMERIC_KINDS = ("int", "float")
+ORDERED_KINDS = ("int", "float", "date", "datetime")
+
+
+class DistinctSketch:
+    """HyperLogLog distinct-count sketch; sketches of the same precision merge by register-wise max."""
+
+    def __init__(self, precision: int = None, registers: np.ndarray = None):
+        self.precision = precision or settings.PROFILE_SKETCH_PRECISION
+        self.registers = registers if registers is not None else np.zeros(1 << self.precision, dtype=np.uint8)
+
+    def add(self, series: pd.Series):
+        values = series.dropna()
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # Rank is the position of the leftmost 1-bit in the remaining 64 - p bits.
+        bit_length = np.zeros(len(remainder), dtype=np.int64)
+        nonzero = remainder > 0
+        bit_length[nonzero] = np.frexp(remainder[nonzero].astype(np.float64))[1]
+        rank = (64 - self.precision - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "DistinctSketch"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_dict(self) -> dict:
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DistinctSketch":
+        registers = np.frombuffer(base64.b64decode(data["registers"]), dtype=np.uint8).copy()
+        return cls(data["precision"], registers)
+
+
+def _scalar(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, np.floating):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+class ColumnProfile:
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.count = 0
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.distinct = DistinctSketch()
+        self.top_values = {}
+        # The top values are exact until a value had to be evicted.
+        self.top_exact = True
+
+    def observe(self, series: pd.Series):
+        present = series.dropna()
+        self.count += len(series)
+        self.nulls += len(series) - len(present)
+        if present.empty:
+            return
+
+        if self.kind in ORDERED_KINDS:
+            self._update_range(_scalar(present.min()), _scalar(present.max()))
+        if self.kind in NUMERIC_KINDS:
+            self.total += float(present.sum())
+        self.distinct.add(present)
+
+        counts = present.astype(str).value_counts()
+        self._merge_top({value: int(count) for value, count in counts.head(settings.PROFILE_TOP_K_CAPACITY).items()})
+        if len(counts) > settings.PROFILE_TOP_K_CAPACITY:
+            self.top_exact = False
+
+    def widen(self, kind: str):
+        """Switches to ``kind`` after the column's type was widened part way through an ingest."""
+
+        if kind not in ORDERED_KINDS:
+            self.minimum = self.maximum = None
+        if kind not in NUMERIC_KINDS:
+            self.total = 0.0
+        self.kind = kind
+
+    def _update_range(self, minimum, maximum):
+        if minimum is not None and (self.minimum is None or minimum < self.minimum):
+            self.minimum = minimum
+        if maximum is not None and (self.maximum is None or maximum > self.maximum):
+            self.maximum = maximum
+
+    def _merge_top(self, counts: dict):
+        for value, count in counts.items():
+            self.top_values[value] = self.top_values.get(value, 0) + count
+        if len(self.top_values) > settings.PROFILE_TOP_K_CAPACITY:
+            kept = sorted(self.top_values.items(), key=lambda item: item[1], reverse=True)[:settings.PROFILE_TOP_K_CAPACITY]
+            self.top_values = dict(kept)
+            self.top_exact = False
+
+    def merge(self, other: "ColumnProfile"):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.total += other.total
+        self._update_range(other.minimum, other.maximum)
+        self.distinct.merge(other.distinct)
+        self.top_exact = self.top_exact and other.top_exact
+        self._merge_top(other.top_values)
+
+    @property
+    def mean(self):
+        non_null = self.count - self.nulls
+        return self.total / non_null if self.kind in NUMERIC_KINDS and non_null else None
+
+    def distinct_count(self) -> int:
+        if self.top_exact:
+            return len(self.top_values)
+        return self.distinct.estimate()
+
+    def summary(self) -> dict:
+        top = sorted(self.top_values.items(), key=lambda item: item[1], reverse=True)[:settings.PROFILE_TOP_K]
+        return {
+            "kind": self.kind,
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": self.mean,
+            "sum": self.total if self.kind in NUMERIC_KINDS else None,
+            "distinct": self.distinct_count(),
+            "distinct_exact": self.top_exact,
+            "top_values": [{"value": value, "count": count} for value, count in top],
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "count": self.count,
+            "nulls": self.nulls,
+            "min": self.minimum,
+            "max": self.maximum,
+            "total": self.total,
+            "distinct": self.distinct.to_dict(),
+            "top_values": self.top_values,
+            "top_exact": self.top_exact,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ColumnProfile":
+        profile = cls(data["kind"])
+        profile.count = data["count"]
+        profile.nulls = data["nulls"]
+        profile.minimum = data["min"]
+        profile.maximum = data["max"]
+        profile.total = data["total"]
+        profile.distinct = DistinctSketch.from_dict(data["distinct"])
+        profile.top_values = data["top_values"]
+        profile.top_exact = data["top_exact"]
+        return profile
+
+
+def _column_kind(series: pd.Series, spec: dict = None) -> str:
+    if spec is not None:
+        return spec["kind"]
+    if pd_types.is_bool_dtype(series):
+        return "bool"
+    if pd_types.is_integer_dtype(series):
+        return "int"
+    if pd_types.is_float_dtype(series):
+        return "float"
+    if pd_types.is_datetime64_any_dtype(series):
+        return "datetime"
+    return "text"
+
+
+class DatasetProfiler:
+    """Accumulates a mergeable per-column profile chunk by chunk during ingestion."""
+
+    def __init__(self):
+        self.row_count = 0
+        self.columns = {}
+
+    def observe(self, df: pd.DataFrame, specs: dict = None):
+        self.row_count += len(df)
+        for col in df.columns:
+            kind = _column_kind(df[col], (specs or {}).get(col))
+            if col not in self.columns:
+                self.columns[col] = ColumnProfile(kind)
+            elif self.columns[col].kind != kind and specs is not None:
+                self.columns[col].widen(kind)
+            self.columns[col].observe(df[col])
+
+    def merge(self, other: "DatasetProfiler"):
+        self.row_count += other.row_count
+        for col, column_profile in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(column_profile)
+            else:
+                self.columns[col] = column_profile
+
+    def summary(self) -> dict:
+        return {
+            "row_count": self.row_count,
+            "columns": {col: column_profile.summary() for col, column_profile in self.columns.items()},
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "row_count": self.row_count,
+            "columns": {col: column_profile.to_dict() for col, column_profile in self.columns.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DatasetProfiler":
+        profiler = cls()
+        profiler.row_count = data["row_count"]
+        profiler.columns = {col: ColumnProfile.from_dict(column_data) for col, column_data in data["columns"].items()}
+        return profiler
+
+
+def to_model(dataset_id: int, profiler: DatasetProfiler) -> profile_model.DatasetProfile:
+
+    return profile_model.DatasetProfile(
+        dataset_id=dataset_id,
+        row_count=profiler.row_count,
+        profile=json.dumps(profiler.to_dict())
+    )
+
+
+def from_model(db_profile: profile_model.DatasetProfile) -> DatasetProfiler:
+
+    return DatasetProfiler.from_dict(json.loads(db_profile.profile))
+
+
+QUESTION_PREFIX = r"^(?:(?:what|whats|what's)\s+(?:is|are)?\s*|(?:show|give|tell)\s+(?:me\s+)?|please\s+)?(?:the\s+)?"
+ROW_COUNT_QUESTION = re.compile(QUESTION_PREFIX + r"(?:how\s+many\s+(?:rows|records|entries)(?:\s+(?:are\s+there|does\s+it\s+have|do\s+we\s+have|in\s+(?:the\s+)?(?:data|dataset|table|file)))?|(?:number|count)\s+of\s+(?:rows|records|entries)|row\s+count)$")
+AGGREGATE_QUESTION = re.compile(QUESTION_PREFIX + r"(?P<stat>average|avg|mean|minimum|min|maximum|max|smallest|lowest|earliest|largest|highest|latest|sum|total)\s+(?:value\s+)?(?:of\s+|for\s+|in\s+)?(?:the\s+)?(?P<column>[\w\s]+?)(?:\s+column)?$")
+DISTINCT_QUESTION = re.compile(QUESTION_PREFIX + r"(?:how\s+many\s+(?:distinct|unique|different)\s+(?P<column_a>[\w\s]+?)(?:\s+(?:are\s+there|values))?|(?:number\s+of\s+)?(?:distinct|unique)\s+(?:values\s+(?:of|in|for)\s+)?(?:the\s+)?(?P<column_b>[\w\s]+?))(?:\s+column)?$")
+NULL_QUESTION = re.compile(QUESTION_PREFIX + r"(?:how\s+many\s+)?(?:null|missing|empty)\s+(?:values\s+)?(?:are\s+there\s+)?(?:in|of|for)\s+(?:the\s+)?(?P<column>[\w\s]+?)(?:\s+column)?$")
+
+STAT_NAMES = {
+    "average": "mean", "avg": "mean", "mean": "mean",
+    "minimum": "min", "min": "min", "smallest": "min", "lowest": "min", "earliest": "min",
+    "maximum": "max", "max": "max", "largest": "max", "highest": "max", "latest": "max",
+    "sum": "sum", "total": "sum",
+}
+
+
+def _normalize_question(question: str) -> str:
+    question = question.strip().lower().rstrip("?.! ")
+    return re.sub(r"\s+", " ", question)
+
+
+def _match_column(phrase: str, columns: dict):
+    candidate = re.sub(r"\s+", "_", phrase.strip())
+    for name in (candidate, candidate.rstrip("s"), candidate[:-2] if candidate.endswith("es") else None):
+        if name and name in columns:
+            return name
+    return None
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.4f}".rstrip("0").rstrip(".")
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    return str(value)
+
+
+def answer_from_profile(question: str, profile: DatasetProfiler):
+    """Answers simple whole-table questions from the stored profile.
+
+    Only questions that match one of the patterns completely (no filters, no
+    grouping) are answered; everything else returns None and goes through SQL.
+    """
+
+    if profile is None:
+        return None
+    question = _normalize_question(question)
+    columns = profile.columns
+
+    if ROW_COUNT_QUESTION.match(question):
+        return f"The dataset has {_format_value(profile.row_count)} rows."
+
+    match = AGGREGATE_QUESTION.match(question)
+    if match:
+        column_name = _match_column(match.group("column"), columns)
+        stat = STAT_NAMES[match.group("stat")]
+        if column_name is None:
+            return None
+        column_profile = columns[column_name]
+        value = {
+            "mean": column_profile.mean,
+            "min": column_profile.minimum,
+            "max": column_profile.maximum,
+            "sum": column_profile.total if column_profile.kind in NUMERIC_KINDS else None,
+        }[stat]
+        if value is None:
+            return None
+        label = {"mean": "average", "min": "minimum", "max": "maximum", "sum": "sum"}[stat]
+        return f"The {label} of {column_name} is {_format_value(value)}."
+
+    match = DISTINCT_QUESTION.match(question)
+    if match:
+        column_name = _match_column(match.group("column_a") or match.group("column_b"), columns)
+        if column_name is None:
+            return None
+        column_profile = columns[column_name]
+        distinct = column_profile.distinct_count()
+        if column_profile.top_exact:
+            values = sorted(column_profile.top_values)
+            listed = ", ".join(values[:settings.PROFILE_TOP_K])
+            more = f" and {len(values) - settings.PROFILE_TOP_K} more" if len(values) > settings.PROFILE_TOP_K else ""
+            return f"{column_name} has {_format_value(distinct)} distinct values: {listed}{more}."
+        return f"{column_name} has about {_format_value(distinct)} distinct values."
+
+    match = NULL_QUESTION.match(question)
+    if match:
+        column_name = _match_column(match.group("column"), columns)
+        if column_name is None:
+            return None
+        return f"{column_name} has {_format_value(columns[column_name].nulls)} missing values."
+
+    return None
@@ -0,0 +1,292 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from app.core import observability
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TOTAL_ROWS_KEY = b"total_rows"
+MAX_ROWS_KEY = b"max_rows"
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+# Functions whose result changes between calls on unchanged data: the clock, randomness and the session.
+VOLATILE_FUNCTIONS = re.compile(
+    r"\b(now|sysdate|curdate|curtime|current_date|current_time|current_timestamp|localtime|localtimestamp|"
+    r"utc_date|utc_time|utc_timestamp|unix_timestamp|today|get_current_time|rand|random|uuid|uuid_short|"
+    r"gen_random_uuid|connection_id)\s*\(",
+    re.IGNORECASE
+)
+# Those that MySQL and DuckDB also accept without parentheses.
+VOLATILE_KEYWORDS = re.compile(r"\b(current_date|current_time|current_timestamp|localtime|localtimestamp)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql_query: str) -> str:
+    # Whitespace and a trailing semicolon only: literals are case sensitive.
+    return re.sub(r'\s+', ' ', sql_query).strip().rstrip(';').strip()
+
+
+def is_cacheable(sql_query: str) -> bool:
+    """Whether the query's result depends on the data alone, so the data version can key it."""
+
+    code = STRING_LITERAL.sub("''", sql_query)
+    return not VOLATILE_FUNCTIONS.search(code) and not VOLATILE_KEYWORDS.search(code)
+
+
+def _serialize(result_df: pd.DataFrame, total_rows, max_rows: int) -> bytes:
+    table = pa.Table.from_pandas(result_df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        TOTAL_ROWS_KEY: b"" if total_rows is None else str(total_rows).encode(),
+        MAX_ROWS_KEY: str(max_rows).encode(),
+    })
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=pa.ipc.IpcWriteOptions(compression="zstd")) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _deserialize(payload: bytes) -> tuple:
+    table = pa.ipc.open_stream(payload).read_all()
+    metadata = table.schema.metadata
+    total_rows = int(metadata[TOTAL_ROWS_KEY]) if metadata[TOTAL_ROWS_KEY] else None
+    return table.to_pandas(), total_rows, int(metadata[MAX_ROWS_KEY])
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_dead_spill_dirs(spill_dir: str):
+    # Spilled files have no index on disk, so those of exited processes are unreachable.
+    if not os.path.isdir(spill_dir):
+        return
+    for name in os.listdir(spill_dir):
+        if name.isdigit() and (int(name) == os.getpid() or not _process_alive(int(name))):
+            shutil.rmtree(os.path.join(spill_dir, name), ignore_errors=True)
+
+
+class ResultCache:
+    """LRU/TTL cache of query results keyed on (table, data version, normalized SQL).
+
+    Results are held as zstd-compressed Arrow IPC streams within a memory budget
+    of ``max_bytes``. With ``spill_dir`` set, entries evicted from memory move to
+    local files (up to ``spill_max_bytes``) and come back on their next hit.
+    A table's data version is bumped whenever its rows change; entries for older
+    versions are never served and are dropped as soon as a newer one is seen.
+    Entries older than ``ttl_seconds`` are not served either, and queries calling
+    volatile functions such as NOW() or RAND() are never cached.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int, spill_dir: Optional[str] = None, spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # Each API process spills into a directory of its own.
+        self.spill_dir = os.path.join(spill_dir, str(os.getpid())) if spill_dir else None
+        self.spill_max_bytes = spill_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.expirations = 0
+        self.bypassed = 0
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._table_versions = {}
+        self._lock = threading.Lock()
+        if spill_dir:
+            _remove_dead_spill_dirs(spill_dir)
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(table_name: str, data_version: int, sql_query: str) -> str:
+        payload = f"{table_name}\n{data_version}\n{normalize_sql(sql_query)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.arrow")
+
+    def _check_version(self, table_name: str, data_version: int):
+        known = self._table_versions.get(table_name)
+        if known is not None and known < data_version:
+            self._drop_table_entries(table_name)
+        if known is None or known < data_version:
+            self._table_versions[table_name] = data_version
+
+    def _drop_table_entries(self, table_name: str):
+        for key in [key for key, entry in self._memory.items() if entry[0] == table_name]:
+            self._forget_memory(key)
+            self.invalidations += 1
+        for key in [key for key, entry in self._disk.items() if entry[0] == table_name]:
+            self._forget_disk(key)
+            self.invalidations += 1
+
+    def _forget_memory(self, key: str):
+        entry = self._memory.pop(key)
+        self._memory_bytes -= len(entry[1])
+        return entry
+
+    def _forget_disk(self, key: str):
+        table_name, size, stored_at = self._disk.pop(key)
+        self._disk_bytes -= size
+        try:
+            os.remove(self._spill_path(key))
+        except OSError:
+            pass
+        return table_name, stored_at
+
+    def _spill(self, key: str, table_name: str, payload: bytes, stored_at: float):
+        if not self.spill_dir or len(payload) > self.spill_max_bytes:
+            return
+        try:
+            with open(self._spill_path(key), "wb") as f:
+                f.write(payload)
+        except OSError as e:
+            logger.warning("Could not spill cached result to disk: %s", e)
+            return
+        self._disk[key] = (table_name, len(payload), stored_at)
+        self._disk_bytes += len(payload)
+        while self._disk_bytes > self.spill_max_bytes:
+            self._forget_disk(next(iter(self._disk)))
+            self.evictions += 1
+
+    def _store(self, key: str, table_name: str, payload: bytes, stored_at: float):
+        self._memory[key] = (table_name, payload, stored_at)
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.max_bytes:
+            oldest_key = next(iter(self._memory))
+            oldest_table, oldest_payload, oldest_stored_at = self._forget_memory(oldest_key)
+            self._spill(oldest_key, oldest_table, oldest_payload, oldest_stored_at)
+            self.evictions += 1
+
+    def _expired(self, stored_at: float) -> bool:
+        return time.time() - stored_at > self.ttl_seconds
+
+    def _lookup(self, key: str) -> Optional[bytes]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            if self._expired(entry[2]):
+                self._forget_memory(key)
+                self.expirations += 1
+                return None
+            self._memory.move_to_end(key)
+            return entry[1]
+        entry = self._disk.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry[2]):
+            self._forget_disk(key)
+            self.expirations += 1
+            return None
+        try:
+            with open(self._spill_path(key), "rb") as f:
+                payload = f.read()
+        except OSError:
+            self._forget_disk(key)
+            return None
+        table_name, stored_at = self._forget_disk(key)
+        self._store(key, table_name, payload, stored_at)
+        return payload
+
+    def get(self, table_name: str, data_version: int, sql_query: str, max_rows: int):
+        """Returns ``(result_df, total_rows)`` for a result of at least ``max_rows`` rows, or None."""
+
+        if not is_cacheable(sql_query):
+            self._record(None)
+            return None
+        key = self.make_key(table_name, data_version, sql_query)
+        with self._lock:
+            self._check_version(table_name, data_version)
+            payload = self._lookup(key) if data_version >= self._table_versions[table_name] else None
+            self._report()
+        if payload is not None:
+            result_df, total_rows, cached_max_rows = _deserialize(payload)
+            # A result cut off at fewer rows than now wanted has to be fetched again.
+            if cached_max_rows >= max_rows or total_rows is not None and total_rows <= cached_max_rows:
+                self._record(hit=True)
+                return result_df.head(max_rows), total_rows
+        self._record(hit=False)
+        return None
+
+    def set(self, table_name: str, data_version: int, sql_query: str, max_rows: int, result_df: pd.DataFrame, total_rows):
+        if not is_cacheable(sql_query):
+            return
+        try:
+            payload = _serialize(result_df, total_rows, max_rows)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            # Object columns holding mixed types have no Arrow type; such results are not cached.
+            logger.debug("Result not cached: %s", e)
+            return
+        if len(payload) > self.max_bytes:
+            return
+
+        key = self.make_key(table_name, data_version, sql_query)
+        with self._lock:
+            self._check_version(table_name, data_version)
+            if data_version < self._table_versions[table_name]:
+                return
+            if key in self._memory:
+                self._forget_memory(key)
+            if key in self._disk:
+                self._forget_disk(key)
+            self._store(key, table_name, payload, time.time())
+            self._report()
+
+    def _record(self, hit: Optional[bool]):
+        # ``hit`` is None for queries the cache does not take.
+        with self._lock:
+            if hit is None:
+                self.bypassed += 1
+            elif hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        observability.RESULT_CACHE_LOOKUPS.labels("bypass" if hit is None else "hit" if hit else "miss").inc()
+
+    def _report(self):
+        observability.RESULT_CACHE_BYTES.labels("memory").set(self._memory_bytes)
+        observability.RESULT_CACHE_BYTES.labels("disk").set(self._disk_bytes)
+        observability.RESULT_CACHE_ENTRIES.labels("memory").set(len(self._memory))
+        observability.RESULT_CACHE_ENTRIES.labels("disk").set(len(self._disk))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "spilled_entries": len(self._disk),
+                "bytes": self._memory_bytes,
+                "spilled_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "expirations": self.expirations,
+                "bypassed": self.bypassed,
+            }
+
+
+result_cache = ResultCache(
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    spill_dir=settings.RESULT_CACHE_SPILL_DIR,
+    spill_max_bytes=settings.RESULT_CACHE_SPILL_MAX_BYTES
+)
@@ -0,0 +1,96 @@
+"""Row hashes behind deduplicating appends.
+
+A dataset table can have a ``<table>_rowhash`` side table holding one 64-bit
+hash per distinct row. It is created, and filled from the rows already in the
+table, the first time an append asks for deduplication; every append after
+that keeps it up to date.
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, column, inspect, table, text
+
+from app.core.config import settings
+
+HASH_SUFFIX = "_rowhash"
+LOOKUP_BATCH = 1000
+BOOL_VALUES = {True: 1.0, False: 0.0}
+
+
+def hash_table_name(table_name: str) -> str:
+    return f"{table_name[:64 - len(HASH_SUFFIX)]}{HASH_SUFFIX}"
+
+
+def _canonical(series: pd.Series, kind: str):
+    # Freshly coerced chunks and rows read back from the database hold different
+    # Python types (e.g. date objects vs. ISO strings in SQLite, bools vs. 0/1 in
+    # MySQL); both are brought to the same dtype before hashing.
+    values = series.astype(object).where(series.notna(), None)
+    if kind == "bool":
+        return values.map(BOOL_VALUES).astype("float64")
+    if kind in ("int", "float"):
+        return pd.to_numeric(values, errors="coerce").astype("float64")
+    if kind in ("date", "datetime"):
+        return pd.Series(pd.to_datetime(values, format="ISO8601", errors="coerce").to_numpy().view("int64"), index=series.index)
+    return values
+
+
+def row_hashes(df: pd.DataFrame, kinds: dict) -> np.ndarray:
+    canonical = pd.DataFrame({col: _canonical(df[col], kinds[col]) for col in kinds}, index=df.index)
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy().view("int64")
+
+
+def exists(connection, table_name: str) -> bool:
+    return inspect(connection).has_table(hash_table_name(table_name))
+
+
+def add(connection, table_name: str, hashes):
+    if len(hashes) == 0:
+        return
+    # Hashes already present (duplicate rows in the table itself) are skipped rather than rejected.
+    prefix = "IGNORE" if connection.dialect.name == "mysql" else "OR IGNORE"
+    target = table(hash_table_name(table_name), column("row_hash"))
+    connection.execute(target.insert().prefix_with(prefix), [{"row_hash": int(h)} for h in np.unique(hashes)])
+
+
+def known(connection, hash_table: str, hashes, hash_column: str = "row_hash") -> np.ndarray:
+    """The subset of ``hashes`` found in ``hash_column`` of ``hash_table``."""
+
+    query = text(f"SELECT `{hash_column}` FROM `{hash_table}` WHERE `{hash_column}` IN :hashes").bindparams(
+        bindparam("hashes", expanding=True)
+    )
+    unique = np.unique(hashes)
+    found = set()
+    for start in range(0, len(unique), LOOKUP_BATCH):
+        batch = [int(h) for h in unique[start:start + LOOKUP_BATCH]]
+        found.update(row[0] for row in connection.execute(query, {"hashes": batch}))
+    return np.fromiter(found, dtype="int64", count=len(found))
+
+
+def backfill(bind, table_name: str, kinds: dict):
+    """Creates the side table from the rows already in ``table_name``, read chunk by chunk."""
+
+    columns = ", ".join(f"`{col}`" for col in kinds)
+    # Hashes (8 bytes a row) are collected before writing: SQLite would block the
+    # writes while the reading cursor holds its lock.
+    hashes = []
+    with bind.connect() as reader:
+        if reader.dialect.name == "mysql":
+            reader = reader.execution_options(stream_results=True)
+        for chunk in pd.read_sql(text(f"SELECT {columns} FROM `{table_name}`"), reader, chunksize=settings.INGEST_CHUNK_ROWS):
+            hashes.append(np.unique(row_hashes(chunk, kinds)))
+    with bind.begin() as connection:
+        connection.execute(text(f"CREATE TABLE `{hash_table_name(table_name)}` (row_hash BIGINT NOT NULL PRIMARY KEY)"))
+        for chunk_hashes in hashes:
+            add(connection, table_name, chunk_hashes)
+
+
+def add_staged(connection, table_name: str, staging_table: str, hash_column: str):
+    prefix = "IGNORE" if connection.dialect.name == "mysql" else "OR IGNORE"
+    connection.execute(text(
+        f"INSERT {prefix} INTO `{hash_table_name(table_name)}` (row_hash) "
+        f"SELECT DISTINCT `{hash_column}` FROM `{staging_table}`"
+    ))
+
+
+def drop(connection, table_name: str):
+    connection.execute(text(f"DROP TABLE IF EXISTS `{hash_table_name(table_name)}`"))
@@ -0,0 +1,89 @@
+import json
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.db.database import engine
+from app.models import dataset_catalog as catalog_model
+from app.services.sql_cache import schema_hash
+
+SAMPLE_ROWS = 3
+
+
+def build_catalog(df: pd.DataFrame, column_types: dict, row_count: int) -> dict:
+    """``df`` is a sample of the ingested rows; it supplies the sample rows and cardinality estimates."""
+
+    sample_df = df.head(SAMPLE_ROWS)
+    return {
+        "columns": [
+            {
+                "name": col,
+                "type": column_types[col],
+                "sample_non_null": int(df[col].notna().sum()),
+                "sample_distinct": int(df[col].nunique()),
+            }
+            for col in df.columns
+        ],
+        "sample_rows": json.loads(sample_df.to_json(orient='values', date_format='iso')),
+        "row_count": int(row_count),
+    }
+
+
+def render_table_info(table_name: str, catalog: dict) -> str:
+    """Renders the catalog the same way SQLDatabase.get_table_info does."""
+
+    column_definitions = ",\n".join(f"\t`{col['name']}` {col['type']}" for col in catalog["columns"])
+    header = "\t".join(col["name"] for col in catalog["columns"])
+    rows = "\n".join(
+        "\t".join("" if value is None else str(value)[:100] for value in row)
+        for row in catalog["sample_rows"]
+    )
+    return (
+        f"CREATE TABLE `{table_name}` (\n{column_definitions}\n)\n\n"
+        f"/*\n{len(catalog['sample_rows'])} rows from {table_name} table:\n{header}\n{rows}\n*/"
+    )
+
+
+def reflect_catalog(table_name: str) -> dict:
+    """Builds a catalog for tables uploaded before catalogs were stored."""
+
+    columns = inspect(engine).get_columns(table_name)
+    with engine.connect() as connection:
+        sample_rows = connection.execute(text(f"SELECT * FROM `{table_name}` LIMIT {SAMPLE_ROWS}")).fetchall()
+        row_count = connection.execute(text(f"SELECT COUNT(*) FROM `{table_name}`")).scalar()
+    return {
+        "columns": [{"name": col["name"], "type": str(col["type"])} for col in columns],
+        "sample_rows": json.loads(json.dumps([list(row) for row in sample_rows], default=str)),
+        "row_count": int(row_count or 0),
+    }
+
+
+def to_model(dataset_id: int, table_name: str, catalog: dict) -> catalog_model.DatasetCatalog:
+
+    return catalog_model.DatasetCatalog(
+        dataset_id=dataset_id,
+        columns=json.dumps(catalog["columns"]),
+        sample_rows=json.dumps(catalog["sample_rows"]),
+        row_count=catalog["row_count"],
+        schema_hash=schema_hash(render_table_info(table_name, catalog))
+    )
+
+
+def from_model(db_catalog: catalog_model.DatasetCatalog) -> dict:
+
+    return {
+        "columns": json.loads(db_catalog.columns),
+        "sample_rows": json.loads(db_catalog.sample_rows),
+        "row_count": db_catalog.row_count,
+        "schema_hash": db_catalog.schema_hash,
+    }
+
+
+def get_catalog(db: Session, dataset) -> dict:
+
+    if dataset.catalog is None:
+        catalog = reflect_catalog(dataset.database_table_name)
+        db.add(to_model(dataset.id, dataset.database_table_name, catalog))
+        db.commit()
+        db.refresh(dataset)
+    return from_model(dataset.catalog)
@@ -0,0 +1,180 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core import observability
+from app.core.config import settings
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r'\s+', ' ', prompt).strip().lower()
+
+
+def question_window(conversation_prompt: str, previous: int) -> list:
+    """The latest question and up to ``previous`` questions before it, normalized.
+
+    The AI's answers and the rolling summary are left out: they are worded
+    differently every time, while a follow-up mostly depends on what was asked before.
+    """
+
+    turns = re.split(r'(?m)^Human:', conversation_prompt)[1:]
+    questions = [re.split(r'(?m)^AI:', turn)[0] for turn in turns]
+    return [normalize_prompt(question) for question in questions[-(previous + 1):]]
+
+
+def schema_hash(table_info: str) -> str:
+    return hashlib.sha256(table_info.encode("utf-8")).hexdigest()
+
+
+class SQLCache:
+    """LRU/TTL cache of generated SQL keyed on (table schema, normalized latest questions).
+
+    Entries live in memory; when ``path`` is set they are also written to a local
+    SQLite file so they survive restarts. Seeing a new schema hash for a table drops
+    every entry generated against its previous schema.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, path: Optional[str] = None, context_questions: int = 1):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.context_questions = context_questions
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._table_schemas = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sql_cache ("
+                "key TEXT PRIMARY KEY, table_name TEXT NOT NULL, schema_hash TEXT NOT NULL, "
+                "sql_query TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+            self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl_seconds
+        self._conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (cutoff,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT key, table_name, schema_hash, sql_query, created_at FROM sql_cache ORDER BY created_at"
+        ).fetchall()
+        for key, table_name, table_schema_hash, sql_query, created_at in rows[-self.max_entries:]:
+            self._entries[key] = (table_name, sql_query, created_at)
+            self._table_schemas[table_name] = table_schema_hash
+
+    def make_key(self, table_schema_hash: str, conversation_prompt: str) -> str:
+        questions = question_window(conversation_prompt, self.context_questions)
+        payload = "\n\x00".join([table_schema_hash, *questions])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _check_schema(self, table_name: str, table_schema_hash: str):
+        known = self._table_schemas.get(table_name)
+        if known is not None and known != table_schema_hash:
+            self._drop_table_entries(table_name)
+        self._table_schemas[table_name] = table_schema_hash
+
+    def _drop_table_entries(self, table_name: str):
+        stale = [key for key, entry in self._entries.items() if entry[0] == table_name]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        observability.SQL_CACHE_REMOVALS.labels("schema").inc(len(stale))
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM sql_cache WHERE table_name = ?", (table_name,))
+            self._conn.commit()
+
+    def _delete(self, key: str, reason: str):
+        if self._entries.pop(key, None) is not None:
+            observability.SQL_CACHE_REMOVALS.labels(reason).inc()
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        observability.SQL_CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+        observability.SQL_CACHE_ENTRIES.set(len(self._entries))
+
+    def get(self, table_name: str, table_schema_hash: str, conversation_prompt: str) -> Optional[str]:
+        key = self.make_key(table_schema_hash, conversation_prompt)
+        with self._lock:
+            self._check_schema(table_name, table_schema_hash)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._record(hit=False)
+                return None
+            if time.time() - entry[2] > self.ttl_seconds:
+                self._delete(key, "expired")
+                self.evictions += 1
+                self._record(hit=False)
+                return None
+            self._entries.move_to_end(key)
+            self._record(hit=True)
+            return entry[1]
+
+    def set(self, table_name: str, table_schema_hash: str, conversation_prompt: str, sql_query: str):
+        """Stores SQL that has run successfully; failing SQL must not be replayed to the next asker."""
+        key = self.make_key(table_schema_hash, conversation_prompt)
+        created_at = time.time()
+        with self._lock:
+            self._check_schema(table_name, table_schema_hash)
+            self._entries[key] = (table_name, sql_query, created_at)
+            self._entries.move_to_end(key)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sql_cache (key, table_name, schema_hash, sql_query, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, table_name, table_schema_hash, sql_query, created_at)
+                )
+                self._conn.commit()
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._delete(oldest_key, "capacity")
+                self.evictions += 1
+            observability.SQL_CACHE_ENTRIES.set(len(self._entries))
+
+    def discard(self, table_name: str, table_schema_hash: str, conversation_prompt: str):
+        """Drops a cached query that failed or was rejected when run, so the next ask generates a new one."""
+
+        key = self.make_key(table_schema_hash, conversation_prompt)
+        with self._lock:
+            self._delete(key, "failed")
+            observability.SQL_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate_table(self, table_name: str):
+        with self._lock:
+            self._drop_table_entries(table_name)
+            self._table_schemas.pop(table_name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+sql_cache = SQLCache(
+    max_entries=settings.SQL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SQL_CACHE_TTL_SECONDS,
+    path=settings.SQL_CACHE_PATH,
+    context_questions=settings.SQL_CACHE_CONTEXT_QUESTIONS
+)
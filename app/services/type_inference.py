@@ -0,0 +1,230 @@
+import re
+
+import pandas as pd
+import pyarrow as pa
+from pandas.api import types as pd_types
+
+from app.core.config import settings
+
+VARCHAR_WIDTHS = (16, 32, 64, 128, 255, 512, 1024)
+BOOLEAN_VALUES = {"true": True, "false": False, "yes": True, "no": False, "t": True, "f": False, "y": True, "n": False}
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d")
+INTEGER_PATTERN = r'[+-]?(0|[1-9]\d{0,17})'
+BIGINT_MAX = 2 ** 63 - 1
+DATETIME_PATTERN = r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?'
+# Column types as stored in catalogs: our own DDL, SQLAlchemy reflection or DuckDB's DESCRIBE.
+SQL_TYPE_KINDS = (
+    (r'BOOL(EAN)?|TINYINT\(1\)', "bool"),
+    (r'U?(TINY|SMALL|MEDIUM|BIG|HUGE)?INT(EGER)?(\d+)?(\(\d+\))?( UNSIGNED)?', "int"),
+    (r'DOUBLE( PRECISION)?|FLOAT\d*(\(\d+\))?|REAL|(DECIMAL|NUMERIC)(\(.*\))?', "float"),
+    (r'DATE', "date"),
+    (r'DATETIME(\(\d\))?|TIMESTAMP.*', "datetime"),
+)
+def _is_integral_float(series: pd.Series) -> bool:
+    # pandas reads an integer Parquet or Feather column holding nulls as float64.
+    return pd_types.is_float_dtype(series) and bool((series.dropna() % 1 == 0).all())
+
+
+# Existing column kind -> dtype checks a typed (e.g. Parquet) column must pass to be appended.
+APPENDABLE_DTYPES = {
+    "bool": (pd_types.is_bool_dtype,),
+    "int": (pd_types.is_integer_dtype, _is_integral_float),
+    "float": (pd_types.is_integer_dtype, pd_types.is_float_dtype),
+    "date": (pd_types.is_datetime64_any_dtype,),
+    "datetime": (pd_types.is_datetime64_any_dtype,),
+}
+
+
+def text_spec(max_length: int = None) -> dict:
+    if max_length is None:
+        return {"sql_type": "MEDIUMTEXT", "kind": "text"}
+    for width in VARCHAR_WIDTHS:
+        if max_length * 1.5 <= width:
+            return {"sql_type": f"VARCHAR({width})", "kind": "text", "width": width}
+    return {"sql_type": "MEDIUMTEXT", "kind": "text"}
+
+
+def untyped_spec() -> dict:
+    return {"sql_type": "MEDIUMTEXT", "kind": "text"}
+
+
+def _accepts(parsed_mask: pd.Series) -> bool:
+    # Every sampled value has to parse; a value that does not is never loaded as NULL.
+    return bool(parsed_mask.all())
+
+
+def _infer_text_column(values: pd.Series) -> dict:
+
+    values = values.dropna().astype(str).str.strip()
+    values = values[values != ""]
+    if values.empty:
+        return text_spec()
+
+    lowered = values.str.lower()
+    if _accepts(lowered.isin(BOOLEAN_VALUES.keys())):
+        return {"sql_type": "BOOLEAN", "kind": "bool"}
+
+    if _accepts(values.str.fullmatch(INTEGER_PATTERN)):
+        return {"sql_type": "BIGINT", "kind": "int"}
+
+    has_leading_zeros = values.str.fullmatch(r'[+-]?0\d+').any()
+    if not has_leading_zeros and _accepts(pd.to_numeric(values, errors='coerce').notna()):
+        return {"sql_type": "DOUBLE", "kind": "float"}
+
+    for date_format in DATE_FORMATS:
+        if _accepts(pd.to_datetime(values, format=date_format, errors='coerce').notna()):
+            return {"sql_type": "DATE", "kind": "date", "format": date_format}
+
+    if _accepts(values.str.fullmatch(DATETIME_PATTERN)):
+        return {"sql_type": "DATETIME", "kind": "datetime", "format": "ISO8601"}
+
+    return text_spec(int(values.str.len().max()))
+
+
+def arrow_spec(arrow_type: pa.DataType) -> dict:
+    """Maps a typed (Parquet or Feather) column to a native SQL column; anything else is stored as text."""
+
+    if pa.types.is_dictionary(arrow_type):
+        return arrow_spec(arrow_type.value_type)
+    if pa.types.is_boolean(arrow_type):
+        return {"sql_type": "BOOLEAN", "kind": "bool"}
+    if pa.types.is_integer(arrow_type):
+        return {"sql_type": "BIGINT", "kind": "int"}
+    if pa.types.is_floating(arrow_type):
+        return {"sql_type": "DOUBLE", "kind": "float"}
+    if pa.types.is_decimal(arrow_type) and arrow_type.precision <= 65 and 0 <= arrow_type.scale <= 30:
+        return {"sql_type": f"DECIMAL({arrow_type.precision},{arrow_type.scale})", "kind": "float", "decimal": True}
+    if pa.types.is_date(arrow_type):
+        return {"sql_type": "DATE", "kind": "date"}
+    if pa.types.is_timestamp(arrow_type):
+        return {"sql_type": "DATETIME", "kind": "datetime"}
+    return text_spec()
+
+
+def infer_column_types(df: pd.DataFrame) -> dict:
+    """Picks a SQL column type per column from a sample of the frame's rows."""
+
+    if not settings.INGEST_INFER_TYPES:
+        return {col: untyped_spec() for col in df.columns}
+
+    sample = df.head(settings.TYPE_INFERENCE_SAMPLE_ROWS)
+    specs = {}
+    for col in sample.columns:
+        series = sample[col]
+        if pd_types.is_bool_dtype(series):
+            specs[col] = {"sql_type": "BOOLEAN", "kind": "bool"}
+        elif pd_types.is_integer_dtype(series):
+            specs[col] = {"sql_type": "BIGINT", "kind": "int"}
+        elif pd_types.is_float_dtype(series):
+            specs[col] = {"sql_type": "DOUBLE", "kind": "float"}
+        elif pd_types.is_datetime64_any_dtype(series):
+            specs[col] = {"sql_type": "DATETIME", "kind": "datetime"}
+        else:
+            specs[col] = _infer_text_column(series)
+    return specs
+
+
+def _coerce_column(series: pd.Series, spec: dict) -> tuple:
+    """Returns ``series`` converted to the spec's kind and whether every value fit."""
+
+    if spec["kind"] == "int" and pd_types.is_float_dtype(series):
+        return (series.astype("Int64"), True) if _is_integral_float(series) else (series, False)
+    if spec["kind"] == "int" and pd_types.is_unsigned_integer_dtype(series) and series.max() > BIGINT_MAX:
+        return series, False
+    if spec["kind"] == "text" or not pd_types.is_object_dtype(series):
+        return (series if spec["kind"] != "text" else series.where(series.isna(), series.astype(str))), True
+
+    # Typed files can put date or Decimal objects in object columns; .str only sees strings.
+    stripped = series.where(series.isna(), series.astype(str)).str.strip()
+    present = stripped.notna() & (stripped != "")
+    if spec["kind"] == "bool":
+        values = stripped.str.lower().map(BOOLEAN_VALUES).astype("boolean")
+    elif spec["kind"] == "int":
+        values = pd.to_numeric(stripped.where(stripped.str.fullmatch(INTEGER_PATTERN, na=False)), errors='coerce').astype("Int64")
+    elif spec["kind"] == "float":
+        values = pd.to_numeric(stripped, errors='coerce')
+    elif spec["kind"] == "date":
+        values = pd.to_datetime(stripped, format=spec["format"], errors='coerce').dt.date
+    else:
+        values = pd.to_datetime(stripped, format=spec.get("format", "ISO8601"), errors='coerce', utc=True).dt.tz_localize(None)
+    return values, not (present & values.isna()).any()
+
+
+def _wider(spec: dict, series: pd.Series) -> dict:
+    # uint64 values past BIGINT would lose digits as doubles; they are kept exactly as text.
+    if spec["kind"] == "int" and not pd_types.is_unsigned_integer_dtype(series):
+        return {"sql_type": "DOUBLE", "kind": "float"}
+    return untyped_spec()
+
+
+def coerce_frame(df: pd.DataFrame, specs: dict) -> tuple:
+    """Converts columns to their inferred kinds.
+
+    A column holding a value its kind cannot represent is widened instead,
+    int to double to text, so no value is ever replaced by NULL. Returns the
+    converted frame and the new specs of the columns that were widened.
+    """
+
+    converted = {}
+    widened = {}
+    for col in df.columns:
+        spec = specs[col]
+        values, fits = _coerce_column(df[col], spec)
+        while not fits:
+            spec = widened[col] = _wider(spec, df[col])
+            values, fits = _coerce_column(df[col], spec)
+        converted[col] = values
+
+    return pd.DataFrame(converted, index=df.index), widened
+
+
+def widened_spec(spec: dict, series: pd.Series):
+    """Returns a wider text spec when ``series`` holds values longer than the column allows."""
+
+    if spec["kind"] != "text" or "width" not in spec:
+        return None
+    max_length = series.dropna().astype(str).str.len().max()
+    if pd.isna(max_length) or max_length <= spec["width"]:
+        return None
+    return text_spec(int(max_length))
+
+
+def kind_of(sql_type: str) -> str:
+    for pattern, kind in SQL_TYPE_KINDS:
+        if re.fullmatch(pattern, sql_type.strip(), re.IGNORECASE):
+            return kind
+    return "text"
+
+
+def _parses(values: pd.Series, spec: dict) -> bool:
+    return _coerce_column(values, spec)[1]
+
+
+def append_spec(sql_type: str, series: pd.Series):
+    """Spec that loads ``series`` from a new file into an existing ``sql_type`` column.
+
+    Returns None when the sampled new values do not fit the column.
+    """
+
+    spec = {"sql_type": sql_type, "kind": kind_of(sql_type)}
+    width = re.fullmatch(r'VARCHAR\((\d+)\)', sql_type.strip(), re.IGNORECASE)
+    if width:
+        spec["width"] = int(width.group(1))
+    if spec["kind"] == "text":
+        return spec
+
+    sample = series.head(settings.TYPE_INFERENCE_SAMPLE_ROWS)
+    if not pd_types.is_object_dtype(sample):
+        return spec if any(check(sample) for check in APPENDABLE_DTYPES[spec["kind"]]) else None
+
+    values = sample.dropna().astype(str).str.strip()
+    values = values[values != ""]
+    if spec["kind"] == "date":
+        candidates = [{**spec, "format": date_format} for date_format in DATE_FORMATS]
+    elif spec["kind"] == "datetime":
+        candidates = [{**spec, "format": "ISO8601"}] + [{**spec, "format": date_format} for date_format in DATE_FORMATS]
+    else:
+        candidates = [spec]
+    if values.empty:
+        return candidates[0]
+    return next((candidate for candidate in candidates if _parses(values, candidate)), None)
@@ -0,0 +1,107 @@
+"""Load-tests authenticated requests and logins with the principal cache off and on.
+
+The app runs in-process behind httpx's ASGI transport against a SQLite file.
+Authenticated load is a burst of GET /api/v1/datasets/ calls; the login burst
+runs concurrent /token requests while a probe measures how long an
+authenticated request waits behind them:
+
+    python -m benchmarks.auth_benchmark --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+async def authenticated_burst(client, headers: dict, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get("/api/v1/datasets/", headers=headers)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "requests_per_sec": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+async def login_burst(client, headers: dict, credentials: dict, logins: int) -> dict:
+
+    async def one_login():
+        response = await client.post(
+            "/api/v1/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+        )
+        response.raise_for_status()
+
+    async def probe() -> float:
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        response = await client.get("/api/v1/datasets/", headers=headers)
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = await asyncio.gather(probe(), *(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    return {
+        "logins": logins,
+        "logins_per_sec": round(logins / elapsed, 1),
+        "probe_ms_during_burst": round(results[0] * 1000, 1),
+    }
+
+
+async def main_async(args):
+    import httpx
+    from app.main import app
+    from app.services.principal_cache import principal_cache
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        credentials = {"email": "auth-bench@example.com", "password": "benchmark"}
+        await client.post("/api/v1/auth/register", json=credentials)
+        token = (await client.post(
+            "/api/v1/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+        )).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        ttl_seconds = principal_cache.ttl_seconds
+        for label, ttl in (("cache off", 0), ("cache on", ttl_seconds or 60)):
+            principal_cache.clear()
+            principal_cache.ttl_seconds = ttl
+            stats = await authenticated_burst(client, headers, args.requests, args.concurrency)
+            print(f"{label:<10} {stats}")
+        principal_cache.ttl_seconds = ttl_seconds
+        print(f"cache      {principal_cache.stats()}")
+
+        print(f"login      {await login_burst(client, headers, credentials, args.logins)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=40)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="auth_bench_")
+    os.environ.setdefault("OPENROUTER_KEY", "benchmark")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Compares query latency and storage size of the SQL and DuckDB/Parquet backends.
+
+The same generated CSV is ingested through the regular upload path into a typed
+database table and into a Parquet file, then the typed-query workload is timed
+on both:
+
+    python -m benchmarks.backend_benchmark --rows 5000000
+    python -m benchmarks.backend_benchmark --database-url mysql+pymysql://...
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.ingest_benchmark import generate_csv
+from benchmarks.typed_query_benchmark import QUERIES, table_size_mb
+
+
+def time_runs(run, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="backend_bench_")
+    path = os.path.join(workdir, "orders.csv")
+    generate_csv(path, args.rows)
+
+    os.environ.setdefault("OPENROUTER_KEY", "benchmark")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DUCKDB_DATA_DIR"] = os.path.join(workdir, "duckdb")
+
+    from sqlalchemy import text
+    from app.db.database import SessionLocal, engine
+    from app.services import duckdb_backend, file_handler
+
+    sql_table = "bench_sql"
+    duckdb_table = "bench_duckdb"
+    db = SessionLocal()
+    try:
+        db.execute(text(f"DROP TABLE IF EXISTS `{sql_table}`"))
+        db.commit()
+        with open(path, "rb") as f:
+            _, sql_stats = file_handler.ingest_streaming(f, path, sql_table, db)
+    finally:
+        db.close()
+    with open(path, "rb") as f:
+        _, duckdb_stats = file_handler.ingest_columnar(f, path, duckdb_table)
+
+    print(f"{'ingest':<16} {'sql s':>12} {'duckdb s':>12}")
+    print(f"{'':<16} {sql_stats['seconds']:>12.1f} {duckdb_stats['seconds']:>12.1f}")
+
+    print(f"\n{'query':<16} {'sql ms':>12} {'duckdb ms':>12} {'speedup':>9}")
+    cursor = duckdb_backend.cursor(duckdb_table)
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            sql_ms = time_runs(lambda: connection.execute(text(sql.format(table=sql_table))).fetchall(), args.repeat)
+            duckdb_sql = duckdb_backend.to_duckdb_sql(sql.format(table=duckdb_table))
+            duckdb_ms = time_runs(lambda: cursor.execute(duckdb_sql).fetchall(), args.repeat)
+            print(f"{name:<16} {sql_ms:>12.1f} {duckdb_ms:>12.1f} {sql_ms / duckdb_ms:>8.1f}x")
+
+        print(f"\n{'storage':<16} {'sql MB':>12} {'duckdb MB':>12}")
+        print(f"{'':<16} {str(table_size_mb(connection, sql_table)):>12} {str(duckdb_backend.storage_size_mb(duckdb_table)):>12}")
+    cursor.close()
+
+
+if __name__ == "__main__":
+    main()
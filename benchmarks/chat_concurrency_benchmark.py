@@ -0,0 +1,99 @@
+"""Measures /api/v1/query/chat throughput under concurrent load with a stub LLM.
+
+The app runs in-process behind httpx's ASGI transport against a SQLite file.
+The "blocking" run makes the stub LLM sleep without yielding to the event
+loop, which is how the pipeline behaved before it went async:
+
+    python -m benchmarks.chat_concurrency_benchmark --concurrency 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.ingest_benchmark import generate_csv
+from benchmarks.suite import upload
+
+
+async def run_chats(client, headers: dict, dataset_id: int, concurrency: int, label: str) -> dict:
+
+    async def one_chat(i: int) -> float:
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/v1/query/chat",
+            json={"dataset_id": dataset_id, "question": f"How many orders per region? ({label} run {i})"},
+            headers=headers,
+            timeout=None
+        )
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(one_chat(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latencies)
+    return {
+        "chats": concurrency,
+        "seconds": round(elapsed, 3),
+        "chats_per_sec": round(concurrency / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+async def main_async(args):
+    import httpx
+    from app.main import app
+    from app.services import ai_service
+    from benchmarks.stub_llm import StubChatModel
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        credentials = {"email": "bench@example.com", "password": "benchmark"}
+        await client.post("/api/v1/auth/register", json=credentials)
+        token = (await client.post(
+            "/api/v1/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+        )).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        path = os.path.join(args.workdir, "orders.csv")
+        generate_csv(path, args.rows)
+        dataset_id = (await upload(client, headers, path, "sql"))["dataset_id"]
+
+        from app.db.database import SessionLocal
+        from app.models import dataset as dataset_model
+        db = SessionLocal()
+        table_name = db.get(dataset_model.Dataset, dataset_id).database_table_name
+        db.close()
+
+        results = {}
+        for label, blocking in (("blocking", True), ("async", False)):
+            stub = StubChatModel(latency=args.latency, table=table_name, blocking=blocking)
+            ai_service.get_llm = lambda stub=stub: stub
+            results[label] = await run_chats(client, headers, dataset_id, args.concurrency, label)
+
+    print(f"{'mode':<10} {'chats':>6} {'seconds':>9} {'chats/s':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for label, stats in results.items():
+        print(f"{label:<10} {stats['chats']:>6} {stats['seconds']:>9} {stats['chats_per_sec']:>9} {stats['p50_ms']:>9} {stats['p95_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub LLM latency per call, in seconds.")
+    parser.add_argument("--rows", type=int, default=10_000)
+    args = parser.parse_args()
+
+    args.workdir = tempfile.mkdtemp(prefix="chat_bench_")
+    os.environ.setdefault("OPENROUTER_KEY", "benchmark")
+    # One user sends every chat; the LLM scheduler's caps would otherwise hide the event-loop effect measured here.
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency))
+    os.environ.setdefault("LLM_MAX_CONCURRENCY_PER_USER", str(args.concurrency))
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Deterministic synthetic order datasets from 1k to 50M rows in every upload format.
+
+Rows are generated and written in fixed-size chunks, so even the largest sizes
+need little memory:
+
+    python -m benchmarks.datasets --rows 10m --format parquet --output orders.parquet
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SIZES = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+    "50m": 50_000_000,
+}
+FORMATS = ("csv", "tsv", "jsonl", "parquet", "feather")
+REGIONS = np.array(["north", "south", "east", "west"])
+CHUNK_ROWS = 500_000
+
+
+def parse_size(value: str) -> int:
+    return SIZES.get(value.lower()) or int(value.replace("_", ""))
+
+
+def order_chunk(start: int, rows: int, seed: int = 0) -> pd.DataFrame:
+    """Rows ``start`` to ``start + rows`` of the dataset; the same arguments always give the same rows."""
+    rng = np.random.default_rng([seed, start])
+    days = rng.integers(0, 365, rows)
+    return pd.DataFrame({
+        "id": np.arange(start, start + rows),
+        "region": REGIONS[rng.integers(0, len(REGIONS), rows)],
+        "amount": np.round(rng.uniform(1, 1000, rows), 2),
+        "quantity": rng.integers(1, 51, rows),
+        "order date": (np.datetime64("2024-01-01") + days.astype("timedelta64[D]")).astype(str),
+    })
+
+
+def generate(path: str, rows: int, fmt: str = None, seed: int = 0) -> str:
+    """Writes ``rows`` order rows to ``path`` in ``fmt`` (taken from the extension by default)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+
+    writer = None
+    with open(path, "wb") as f:
+        for start in range(0, rows, CHUNK_ROWS):
+            chunk = order_chunk(start, min(CHUNK_ROWS, rows - start), seed)
+            if fmt in ("csv", "tsv"):
+                chunk.to_csv(f, sep="," if fmt == "csv" else "\t", index=False, header=start == 0)
+            elif fmt == "jsonl":
+                lines = chunk.to_json(orient="records", lines=True)
+                f.write((lines if lines.endswith("\n") else lines + "\n").encode("utf-8"))
+            else:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    # Feather v2 is the Arrow IPC file format.
+                    writer = pq.ParquetWriter(f, table.schema) if fmt == "parquet" else pa.ipc.new_file(f, table.schema)
+                writer.write_table(table)
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="100k", help=f"Row count or one of {', '.join(SIZES)}.")
+    parser.add_argument("--format", choices=FORMATS, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    generate(args.output, parse_size(args.rows), args.format, args.seed)
+
+
+if __name__ == "__main__":
+    main()
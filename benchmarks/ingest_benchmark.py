@@ -0,0 +1,106 @@
+"""Compares the upload paths on a generated file.
+
+CSV uploads compare the buffered and streaming paths; Parquet and Feather
+uploads compare the buffered (pandas) path with the Arrow path. Each mode
+runs in its own subprocess so the reported peak RSS is not polluted by the
+other run:
+
+    python -m benchmarks.ingest_benchmark --rows 10000000
+    python -m benchmarks.ingest_benchmark --rows 10000000 --format parquet
+    python -m benchmarks.ingest_benchmark --rows 1000000 --database-url mysql+pymysql://...
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+MODES = {
+    "csv": ("buffered", "streaming"),
+    "parquet": ("buffered", "arrow"),
+    "feather": ("buffered", "arrow"),
+}
+
+
+def generate_csv(path: str, rows: int):
+    regions = ["north", "south", "east", "west"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "region", "amount", "quantity", "order date"])
+        for i in range(rows):
+            writer.writerow([
+                i,
+                random.choice(regions),
+                f"{random.uniform(1, 1000):.2f}",
+                random.randint(1, 50),
+                f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+            ])
+
+
+def run_single(mode: str, path: str):
+    from sqlalchemy import text
+    from app.core.config import settings
+    from app.db.database import SessionLocal
+    from app.services import file_handler
+
+    settings.INGEST_MODE = "buffered" if mode == "buffered" else "streaming"
+    db = SessionLocal()
+    try:
+        table_name = f"bench_ingest_{mode}"
+        db.execute(text(f"DROP TABLE IF EXISTS `{table_name}`"))
+        db.commit()
+        with open(path, "rb") as f:
+            if mode == "streaming":
+                _, stats = file_handler.ingest_streaming(f, path, table_name, db)
+            elif mode == "arrow":
+                _, stats = file_handler.ingest_arrow(f, path, table_name, db)
+            else:
+                _, stats = file_handler.ingest_buffered(f, path, table_name, db)
+        print(json.dumps(stats))
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=sorted(MODES), default="csv")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--single", choices=["buffered", "streaming", "arrow"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single, args.path)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="ingest_bench_")
+    path = os.path.join(workdir, f"orders.{args.format}")
+    if args.format == "csv":
+        generate_csv(path, args.rows)
+    else:
+        from benchmarks import datasets
+        datasets.generate(path, args.rows, args.format)
+
+    env = dict(os.environ)
+    env.setdefault("OPENROUTER_KEY", "benchmark")
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    results = []
+    for mode in MODES[args.format]:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.ingest_benchmark", "--single", mode, "--path", path],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<16} {'rows':>12} {'seconds':>10} {'rows/sec':>12} {'peak MB':>10}")
+    for stats in results:
+        print(f"{stats['mode']:<16} {stats['rows']:>12} {stats['seconds']:>10} {stats['rows_per_sec']:>12} {stats['peak_rss_mb']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""A stub LLM that answers like the real one after a fixed delay.
+
+SQL-generation prompts get a canned query against the table named in the
+prompt's CREATE TABLE statement; every other prompt gets a canned answer.
+It comes in two forms:
+
+- ``StubChatModel``, an in-process chat model to patch in for ``get_llm``;
+- a local server that speaks the OpenAI chat-completions API, so the app
+  reaches it over HTTP like the real provider. Each call waits
+  ``--latency`` seconds, and streamed answers are split into ``--chunks``
+  deltas spread over that time:
+
+    python -m benchmarks.stub_llm --port 8900 --latency 0.5
+    LLM_BASE_URL=http://127.0.0.1:8900/v1 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+DEFAULT_SQL = "SELECT region, COUNT(*) AS orders, SUM(amount) AS revenue FROM {table} GROUP BY region"
+DEFAULT_ANSWER = "The north region has the most orders, followed by east, south and west."
+TABLE_PATTERN = re.compile(r"CREATE TABLE `?(\w+)`?")
+
+
+def canned_reply(prompt: str, sql: str = DEFAULT_SQL, answer: str = DEFAULT_ANSWER, table: str = "") -> str:
+    if "SQLQuery:" in prompt:
+        if not table:
+            match = TABLE_PATTERN.search(prompt)
+            table = match.group(1) if match else "data"
+        return sql.format(table=table)
+    return answer
+
+
+class StubChatModel(BaseChatModel):
+    latency: float = 0.5
+    sql: str = DEFAULT_SQL
+    answer: str = DEFAULT_ANSWER
+    # Taken from the prompt when empty.
+    table: str = ""
+    # Simulates a synchronous HTTP client: the async path sleeps without yielding.
+    blocking: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _reply(self, messages) -> str:
+        return canned_reply(messages[-1].content, self.sql, self.answer, self.table)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(latency: float = 0.5, sql: str = DEFAULT_SQL, answer: str = DEFAULT_ANSWER, chunks: int = 8):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI(title="Stub OpenAI API")
+    app.state.calls = 0
+
+    def completion_body(model: str, content: str, prompt: str) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": _estimate_tokens(prompt),
+                "completion_tokens": _estimate_tokens(content),
+                "total_tokens": _estimate_tokens(prompt) + _estimate_tokens(content),
+            },
+        }
+
+    async def stream_body(model: str, content: str, prompt: str, include_usage: bool):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        words = content.split(" ")
+        size = max(1, -(-len(words) // chunks))
+        pieces = [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+        for piece in pieces:
+            await asyncio.sleep(latency / (len(pieces) + 1))
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        if include_usage:
+            usage = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [],
+                "usage": {"prompt_tokens": _estimate_tokens(prompt), "completion_tokens": _estimate_tokens(content),
+                          "total_tokens": _estimate_tokens(prompt) + _estimate_tokens(content)},
+            }
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "benchmark"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        prompt = _prompt_text(body.get("messages", []))
+        content = canned_reply(prompt, sql, answer)
+        model = body.get("model", "stub")
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            await asyncio.sleep(latency / (chunks + 1))
+            return StreamingResponse(stream_body(model, content, prompt, include_usage), media_type="text/event-stream")
+        await asyncio.sleep(latency)
+        return completion_body(model, content, prompt)
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def running_server(port: int = None, **options):
+    """Runs the stub server on a background thread and yields its ``/v1`` base URL."""
+    import uvicorn
+
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(**options), host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("Stub LLM server failed to start")
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per completion.")
+    parser.add_argument("--chunks", type=int, default=8, help="Deltas per streamed answer.")
+    parser.add_argument("--sql", default=DEFAULT_SQL, help="Canned SQL; {table} is replaced with the prompt's table.")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER)
+    args = parser.parse_args()
+
+    app = create_app(latency=args.latency, sql=args.sql, answer=args.answer, chunks=args.chunks)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Offline benchmark suite: upload throughput, chat latency, concurrent chat throughput and memory.
+
+Nothing needs a network or an API key. The app runs in-process behind httpx's
+ASGI transport against SQLite (or --database-url), and the LLM is the stub
+OpenAI-compatible server from benchmarks.stub_llm, reached over
+HTTP like the real provider. Each upload runs in its own subprocess so its
+memory high-water mark is its own.
+
+Results are written as JSON. Pass an earlier results file as --baseline to
+list the metrics that got worse by more than --tolerance (the exit status is
+1 when there are any):
+
+    python -m benchmarks.suite --sizes 1k,100k --output results.json
+    python -m benchmarks.suite --sizes 1m --formats csv,parquet --concurrency 1,10,50 --output new.json --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import datasets
+from benchmarks.stub_llm import running_server
+
+SCENARIOS = ("upload", "chat_latency", "chat_concurrency")
+HIGHER_IS_BETTER = {"rows_per_sec", "chats_per_sec"}
+LOWER_IS_BETTER = {"seconds", "p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms", "peak_rss_mb"}
+CREDENTIALS = {"email": "suite@example.com", "password": "benchmark"}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return max_rss_mb()
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(len(ordered) * fraction)) - 1))]
+
+
+class PeakRss:
+    """Samples the process RSS in the background while a scenario runs."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0.0
+        self._task = None
+
+    async def _sample(self):
+        while True:
+            self.peak = max(self.peak, rss_mb())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self.peak = rss_mb()
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, rss_mb())
+
+
+async def login(client) -> dict:
+    await client.post("/api/v1/auth/register", json=CREDENTIALS)
+    response = await client.post("/api/v1/auth/token", data={"username": CREDENTIALS["email"], "password": CREDENTIALS["password"]})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def upload(client, headers: dict, path: str, backend: str) -> dict:
+    """Uploads a file and waits for its ingest job; returns the finished job."""
+    with open(path, "rb") as f:
+        response = await client.post(
+            "/api/v1/data/upload", files={"file": (os.path.basename(path), f)}, data={"backend": backend},
+            headers=headers, timeout=None
+        )
+    response.raise_for_status()
+    job = response.json()
+    while job["status"] in ("queued", "running", "cancelling"):
+        await asyncio.sleep(0.1)
+        job = (await client.get(f"/api/v1/data/jobs/{job['id']}", headers=headers)).json()
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"Ingest of {path} {job['status']}: {job['error']}")
+    return job
+
+
+def app_client():
+    import httpx
+    from app.main import app
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark")
+
+
+# --- upload -----------------------------------------------------------------
+
+async def single_upload(path: str, backend: str) -> dict:
+    async with app_client() as client:
+        headers = await login(client)
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        await upload(client, headers, path, backend)
+        seconds = time.perf_counter() - started
+    return {"seconds": round(seconds, 3), "rss_before_mb": round(rss_before, 1), "peak_rss_mb": round(max_rss_mb(), 1)}
+
+
+def run_uploads(args, env: dict) -> list:
+    results = []
+    for size in args.sizes:
+        rows = datasets.parse_size(size)
+        for fmt in args.formats:
+            path = os.path.join(args.workdir, f"orders_{size}.{fmt}")
+            if not os.path.exists(path):
+                datasets.generate(path, rows, fmt)
+            for backend in args.backends:
+                # Ingest runs inline in the subprocess so its peak RSS covers the parse and insert.
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.suite", "--single-upload", path, "--single-backend", backend],
+                    env=env, check=True, capture_output=True, text=True
+                ).stdout
+                stats = json.loads(output.strip().splitlines()[-1])
+                result = {
+                    "scenario": "upload",
+                    "name": f"upload/{fmt}/{size}/{backend}",
+                    "format": fmt,
+                    "rows": rows,
+                    "backend": backend,
+                    "file_mb": round(os.path.getsize(path) / (1024 * 1024), 2),
+                    **stats,
+                    "rows_per_sec": round(rows / stats["seconds"], 1) if stats["seconds"] else 0.0,
+                }
+                print(f"{result['name']:<32} {result['seconds']:>9}s {result['rows_per_sec']:>12} rows/s {result['peak_rss_mb']:>9} MB")
+                results.append(result)
+    return results
+
+
+# --- chat -------------------------------------------------------------------
+
+async def streamed_chat(client, headers: dict, dataset_id: int, question: str) -> tuple:
+    """Returns (seconds to the first answer token, total seconds) for one /chat/stream call."""
+    started = time.perf_counter()
+    first_token = None
+    async with client.stream(
+        "POST", "/api/v1/query/chat/stream", json={"dataset_id": dataset_id, "question": question}, headers=headers, timeout=None
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token is None and line == "event: token":
+                first_token = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return first_token if first_token is not None else total, total
+
+
+async def run_chat_latency(client, headers: dict, dataset_id: int, chats: int) -> dict:
+    first_tokens, totals = [], []
+    async with PeakRss() as peak:
+        for i in range(chats):
+            # A distinct question per call keeps the SQL cache out of the measurement.
+            first_token, total = await streamed_chat(client, headers, dataset_id, f"What are the orders and revenue per region? (latency run {i})")
+            first_tokens.append(first_token)
+            totals.append(total)
+    result = {
+        "scenario": "chat_latency",
+        "name": "chat_latency",
+        "chats": chats,
+        "p50_ms": round(statistics.median(totals) * 1000, 1),
+        "p95_ms": round(percentile(totals, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(totals, 0.99) * 1000, 1),
+        "ttft_p50_ms": round(statistics.median(first_tokens) * 1000, 1),
+        "ttft_p95_ms": round(percentile(first_tokens, 0.95) * 1000, 1),
+        "peak_rss_mb": round(peak.peak, 1),
+    }
+    print(f"{'chat_latency':<32} p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, first token p50 {result['ttft_p50_ms']} ms")
+    return result
+
+
+async def run_chat_concurrency(client, headers: dict, dataset_id: int, concurrency: int, chats: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_chat(i: int) -> float:
+        async with semaphore:
+            _, total = await streamed_chat(client, headers, dataset_id, f"What are the orders and revenue per region? (c{concurrency} run {i})")
+            return total
+
+    async with PeakRss() as peak:
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(one_chat(i) for i in range(chats)))
+        elapsed = time.perf_counter() - started
+    result = {
+        "scenario": "chat_concurrency",
+        "name": f"chat_concurrency/c{concurrency}",
+        "concurrency": concurrency,
+        "chats": chats,
+        "seconds": round(elapsed, 3),
+        "chats_per_sec": round(chats / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "peak_rss_mb": round(peak.peak, 1),
+    }
+    print(f"{result['name']:<32} {result['chats_per_sec']:>9} chats/s, p95 {result['p95_ms']} ms, {result['peak_rss_mb']} MB")
+    return result
+
+
+async def run_chats(args) -> list:
+    results = []
+    path = os.path.join(args.workdir, "chat_orders.csv")
+    datasets.generate(path, datasets.parse_size(args.chat_rows), "csv")
+    async with app_client() as client:
+        headers = await login(client)
+        dataset_id = (await upload(client, headers, path, args.backends[0]))["dataset_id"]
+        if "chat_latency" in args.scenarios:
+            results.append(await run_chat_latency(client, headers, dataset_id, args.chats))
+        if "chat_concurrency" in args.scenarios:
+            for concurrency in args.concurrency:
+                results.append(await run_chat_concurrency(client, headers, dataset_id, concurrency, max(args.chats, concurrency * 2)))
+    return results
+
+
+# --- results ----------------------------------------------------------------
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """Lists metrics that are more than ``tolerance`` (a fraction) worse than in ``baseline``."""
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        for metric, value in result.items():
+            old = before.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if (metric in HIGHER_IS_BETTER and change < -tolerance) or (metric in LOWER_IS_BETTER and change > tolerance):
+                regressions.append(f"{result['name']} {metric}: {old} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--sizes", default="1k,100k", help=f"Upload sizes: row counts or {', '.join(datasets.SIZES)}.")
+    parser.add_argument("--formats", default=",".join(datasets.FORMATS))
+    parser.add_argument("--backends", default="sql", help="Storage backends to upload into (sql, duckdb).")
+    parser.add_argument("--chat-rows", default="100k")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub LLM seconds per call.")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--single-upload", help=argparse.SUPPRESS)
+    parser.add_argument("--single-backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_upload:
+        print(json.dumps(asyncio.run(single_upload(args.single_upload, args.single_backend))))
+        return
+
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    args.sizes = args.sizes.split(",")
+    args.formats = args.formats.split(",")
+    args.backends = args.backends.split(",")
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+    args.workdir = tempfile.mkdtemp(prefix="suite_bench_")
+
+    with running_server(latency=args.latency) as llm_base_url:
+        # Settings are read at import time, so the environment is prepared before the app is imported.
+        os.environ["OPENROUTER_KEY"] = "benchmark"
+        os.environ["LLM_BASE_URL"] = llm_base_url
+        os.environ["LOG_LEVEL"] = "WARNING"
+        os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+        os.environ["DUCKDB_DATA_DIR"] = os.path.join(args.workdir, "duckdb")
+
+        results = []
+        if "upload" in args.scenarios:
+            results += run_uploads(args, {**os.environ, "INGEST_BACKGROUND": "false"})
+        if "chat_latency" in args.scenarios or "chat_concurrency" in args.scenarios:
+            results += asyncio.run(run_chats(args))
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+            "stub_latency_seconds": args.latency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
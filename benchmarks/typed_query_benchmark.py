@@ -0,0 +1,94 @@
+"""Times typical aggregate queries on a typed table and on an all-MEDIUMTEXT copy.
+
+Both tables are loaded from the same generated CSV through the regular
+ingest path, once with type inference and once with INGEST_INFER_TYPES off:
+
+    python -m benchmarks.typed_query_benchmark --rows 1000000
+    python -m benchmarks.typed_query_benchmark --database-url mysql+pymysql://...
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.ingest_benchmark import generate_csv
+
+QUERIES = {
+    "group_by_sum": "SELECT region, SUM(amount), AVG(quantity) FROM {table} GROUP BY region",
+    "numeric_filter": "SELECT COUNT(*) FROM {table} WHERE amount > 500",
+    "date_range": "SELECT order_date, COUNT(*) FROM {table} WHERE order_date >= '2024-06-01' GROUP BY order_date",
+    "min_max": "SELECT MIN(amount), MAX(amount), MAX(quantity) FROM {table}",
+}
+
+
+def table_size_mb(connection, table_name: str):
+    from sqlalchemy import text
+
+    if connection.dialect.name == "mysql":
+        size = connection.execute(text(
+            "SELECT data_length + index_length FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = :name"
+        ), {"name": table_name}).scalar()
+    else:
+        try:
+            size = connection.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = :name"), {"name": table_name}).scalar()
+        except Exception:
+            return None
+    return round(size / (1024 * 1024), 2) if size else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="typed_bench_")
+    path = os.path.join(workdir, "orders.csv")
+    generate_csv(path, args.rows)
+
+    os.environ.setdefault("OPENROUTER_KEY", "benchmark")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from sqlalchemy import text
+    from app.core.config import settings
+    from app.db.database import SessionLocal, engine
+    from app.services import file_handler
+
+    db = SessionLocal()
+    tables = {}
+    try:
+        for label, infer in (("untyped", False), ("typed", True)):
+            settings.INGEST_INFER_TYPES = infer
+            table_name = f"bench_{label}"
+            db.execute(text(f"DROP TABLE IF EXISTS `{table_name}`"))
+            db.commit()
+            with open(path, "rb") as f:
+                catalog, _ = file_handler.ingest_streaming(f, path, table_name, db)
+            tables[label] = table_name
+            print(f"{label}: " + ", ".join(f"{col['name']} {col['type']}" for col in catalog["columns"]))
+    finally:
+        db.close()
+
+    print(f"\n{'query':<16} {'untyped ms':>12} {'typed ms':>12} {'speedup':>9}")
+    with engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            timings = {}
+            for label, table_name in tables.items():
+                runs = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    connection.execute(text(sql.format(table=table_name))).fetchall()
+                    runs.append((time.perf_counter() - started) * 1000)
+                timings[label] = statistics.median(runs)
+            print(f"{name:<16} {timings['untyped']:>12.1f} {timings['typed']:>12.1f} {timings['untyped'] / timings['typed']:>8.1f}x")
+
+        print(f"\n{'table':<10} {'size MB':>10}")
+        for label, table_name in tables.items():
+            print(f"{label:<10} {str(table_size_mb(connection, table_name)):>10}")
+
+
+if __name__ == "__main__":
+    main()